@@ -0,0 +1,111 @@
+"""
+Row decoding benchmark for hbasepy.
+
+Compares decoding `scannerGetList` replies with the generated Thrift code
+(followed by the conversion into row dictionaries done by `Table.scan`)
+against the fast decoder in :py:mod:`hbasepy.decoder`, e.g.::
+
+    python benchmarks/bench_decode.py --rows 1000 --columns 20
+
+The replies are synthetic and decoded from memory, so no HBase server is
+needed; the numbers only cover decoding, not network transfer.
+"""
+
+import argparse
+import time
+
+from thrift.Thrift import TMessageType
+from thrift.protocol import TBinaryProtocol
+from thrift.transport import TTransport
+
+from hbase_thrift import Hbase, ttypes
+from hbasepy.decoder import FastDecodingClient
+from hbasepy.table import make_ordered_row, make_row
+
+
+def make_reply(n_rows, n_columns, value_size, sorted_columns):
+    value = b'x' * value_size
+    rows = []
+    for i in range(n_rows):
+        cells = [(b'cf:column-%04d' % j,
+                  ttypes.TCell(value=value, timestamp=1500000000000 + j))
+                 for j in range(n_columns)]
+        if sorted_columns:
+            rows.append(ttypes.TRowResult(
+                row=b'row-%08d' % i,
+                sortedColumns=[ttypes.TColumn(columnName=name, cell=cell)
+                               for name, cell in cells]))
+        else:
+            rows.append(ttypes.TRowResult(row=b'row-%08d' % i,
+                                          columns=dict(cells)))
+
+    transport = TTransport.TMemoryBuffer()
+    protocol = TBinaryProtocol.TBinaryProtocol(transport)
+    protocol.writeMessageBegin('scannerGetList', TMessageType.REPLY, 0)
+    Hbase.scannerGetList_result(success=rows).write(protocol)
+    protocol.writeMessageEnd()
+    return transport.getvalue()
+
+
+def make_client(data):
+    """Return a client that receives `data` as its reply."""
+    return Hbase.Client(
+        TBinaryProtocol.TBinaryProtocol(TTransport.TBufferedTransport(
+            TTransport.TMemoryBuffer(data))),
+        TBinaryProtocol.TBinaryProtocol(TTransport.TMemoryBuffer()))
+
+
+def decode_generic(data, sorted_columns, include_timestamp):
+    items = make_client(data).recv_scannerGetList()
+    if sorted_columns:
+        return [(item.row, make_ordered_row(item.sortedColumns,
+                                            include_timestamp))
+                for item in items]
+    return [(item.row, make_row(item.columns, include_timestamp))
+            for item in items]
+
+
+def decode_fast(data, sorted_columns, include_timestamp):
+    client = FastDecodingClient(make_client(data))
+    return client.decodeRows('scannerGetList', (0, 0), sorted_columns,
+                             include_timestamp)[0]
+
+
+def run(func, data, sorted_columns, include_timestamp, repeat):
+    timings = []
+    for i in range(repeat):
+        started = time.time()
+        func(data, sorted_columns, include_timestamp)
+        timings.append(time.time() - started)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--columns', type=int, default=20)
+    parser.add_argument('--value-size', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=11)
+    args = parser.parse_args()
+
+    for sorted_columns in (False, True):
+        data = make_reply(args.rows, args.columns, args.value_size,
+                          sorted_columns)
+        for include_timestamp in (False, True):
+            generic = decode_generic(data, sorted_columns, include_timestamp)
+            fast = decode_fast(data, sorted_columns, include_timestamp)
+            assert generic == fast
+
+            generic = run(decode_generic, data, sorted_columns,
+                          include_timestamp, args.repeat)
+            fast = run(decode_fast, data, sorted_columns,
+                       include_timestamp, args.repeat)
+            print("sorted_columns=%-5s include_timestamp=%-5s "
+                  "generic: %8.1f ms  fast: %8.1f ms  (%.1fx)"
+                  % (sorted_columns, include_timestamp, generic * 1000,
+                     fast * 1000, generic / fast))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Startup benchmark for hbasepy.
+
+Measures the time needed to import hbasepy, and the time to the first
+round trip to an HBase Thrift server, both for a plain connection and for
+a connection pool, e.g.::
+
+    python benchmarks/bench_startup.py --host localhost --pool-size 10
+
+Each measurement runs in a fresh interpreter, so that module caches do not
+affect the results.
+"""
+
+import argparse
+import subprocess
+import sys
+
+IMPORT_CODE = '''
+import time
+started = time.time()
+import hbasepy
+print(time.time() - started)
+'''
+
+CONNECTION_CODE = '''
+import time
+started = time.time()
+import hbasepy
+connection = hbasepy.Connection(%(host)r, %(port)d)
+connection.tables()
+print(time.time() - started)
+'''
+
+POOL_CODE = '''
+import time
+started = time.time()
+import hbasepy
+pool = hbasepy.ConnectionPool(%(size)d, preconnect=%(preconnect)r,
+                              host=%(host)r, port=%(port)d)
+with pool.connection() as connection:
+    connection.tables()
+print(time.time() - started)
+'''
+
+
+def run(code, repeat):
+    timings = []
+    for i in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', code])
+        timings.append(float(output.decode('ascii').strip()))
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9090)
+    parser.add_argument('--pool-size', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--import-only', action='store_true',
+                        help="only measure the import time")
+    args = parser.parse_args()
+
+    params = dict(host=args.host, port=args.port, size=args.pool_size)
+
+    print("import hbasepy:            %8.1f ms"
+          % (run(IMPORT_CODE, args.repeat) * 1000))
+    if args.import_only:
+        return
+
+    print("first RPC (connection):    %8.1f ms"
+          % (run(CONNECTION_CODE % params, args.repeat) * 1000))
+    for preconnect in (False, True):
+        code = POOL_CODE % dict(params, preconnect=preconnect)
+        print("first RPC (pool, preconnect=%-5s): %8.1f ms"
+              % (preconnect, run(code, args.repeat) * 1000))
+
+
+if __name__ == '__main__':
+    main()
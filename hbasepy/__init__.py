@@ -4,4 +4,7 @@ HBasepy, a developer-friendly Python library to interact with Apache HBase
 from .connection import DEFAULT_HOST, DEFAULT_PORT, Connection
 from .table import Table  # noqa
 from .batch import Batch  # noqa
-from .pool import ConnectionPool, NoConnectionsAvailable  # noqa
\ No newline at end of file
+from .deadline import Deadline, DeadlineExceeded  # noqa
+from .pool import (  # noqa
+    ConnectionPool, Lane, NoConnectionsAvailable, PooledTable)
+from .salted import SaltedTable  # noqa
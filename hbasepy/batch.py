@@ -5,10 +5,16 @@ hbasepy Batch module.
 from collections import defaultdict
 import logging
 from numbers import Integral
+import time
 
 import six
 
-from hbase_thrift.ttypes import BatchMutation, Mutation
+from .deadline import resolve as resolve_deadline, scope as deadline_scope
+from .tool import LazyModule
+from .stats import BatchStats, resolve as resolve_stats
+from .thrift2 import ROW_DELETE
+
+ttypes = LazyModule('hbase_thrift.ttypes')
 
 logger = logging.getLogger(__name__)
 
@@ -20,7 +26,8 @@ class Batch(object):
     instead.
     """
     def __init__(self, table, timestamp=None, batch_size=None,
-                 transaction=False):
+                 transaction=False, spool=None, controller=None,
+                 stats=None, deadline=None, coalesce=False):
         """Initialise a new Batch instance."""
         if not (timestamp is None or isinstance(timestamp, Integral)):
             raise TypeError("'timestamp' must be an integer or None")
@@ -32,37 +39,253 @@ class Batch(object):
             if not batch_size > 0:
                 raise ValueError("'batch_size' must be > 0")
 
+        if controller is not None:
+            if transaction:
+                raise TypeError("'transaction' cannot be used when "
+                                "'controller' is specified")
+            if batch_size is not None:
+                raise TypeError("'batch_size' cannot be used when "
+                                "'controller' is specified")
+
         self._table = table
         self._batch_size = batch_size
         self._timestamp = timestamp
         self._transaction = transaction
+        self._spool = spool
+        self._controller = controller
+        self._stats, self._stats_callback = resolve_stats(stats, BatchStats)
+        self._deadline = resolve_deadline(deadline)
+        self._coalesce = coalesce
         self._families = None
+
+        #: Number of mutations saved by coalescing (see
+        #: :py:meth:`Table.batch`)
+        self.coalesced = 0
         self._reset_mutations()
 
     def _reset_mutations(self):
         """Reset the internal mutation buffer."""
         self._mutations = defaultdict(list)
         self._mutation_count = 0
+        self._coalesced_pending = 0
+
+        # When coalescing: the position of the pending put for each column,
+        # and the columns with a pending delete, per row. Mutations that
+        # are superseded are replaced by `None` until the batch is sent.
+        self._put_positions = defaultdict(dict)
+        self._deleted_columns = defaultdict(set)
 
-    def send(self):
-        """Send the batch to the server."""
+        # Mutations for the index tables of the table's secondary indexes,
+        # and the index entries written by this batch for each row, so
+        # that a later delete in the same batch can remove them again.
+        self._index_mutations = defaultdict(lambda: defaultdict(list))
+        self._index_keys = defaultdict(list)
+
+    def _mutate_rows(self, table_name, mutations):
+        """Send the mutations for a single table to the server."""
         bms = [
-            BatchMutation(row, m)
-            for row, m in six.iteritems(self._mutations)
+            ttypes.BatchMutation(row, m)
+            for row, m in six.iteritems(mutations)
         ]
         if not bms:
             return
 
-        logger.debug("Sending batch for '%s' (%d mutations on %d rows)",
-                     self._table.name, self._mutation_count, len(bms))
         if self._timestamp is None:
-            self._table.connection.client.mutateRows(self._table.name, bms, {})
+            self._table.connection.client.mutateRows(table_name, bms, {})
         else:
             self._table.connection.client.mutateRowsTs(
-                self._table.name, bms, self._timestamp, {})
+                table_name, bms, self._timestamp, {})
+
+    def send(self, deadline=None):
+        """Send the batch to the server.
+
+        If the table has secondary indexes, the index mutations are sent
+        right after the data mutations. If this batch was created with
+        a `spool`, all mutations are appended to the spool instead.
+
+        The `deadline` argument (see :py:meth:`Table.row`) overrides the
+        deadline of the batch for this send. If the deadline passes,
+        :py:exc:`hbasepy.deadline.DeadlineExceeded` is raised and the
+        mutations are kept, but some of them may have been applied.
+
+        :param deadline: time limit (optional)
+        """
+        if deadline is None:
+            deadline = self._deadline
+        else:
+            deadline = resolve_deadline(deadline)
+
+        if not self._mutations:
+            return
+
+        mutations = self._mutations
+        if self._coalesce:
+            # Drop the superseded puts from a copy, so that the positions
+            # of the pending puts stay valid if the send fails.
+            mutations = dict(
+                (row, [m for m in row_mutations if m is not None])
+                for row, row_mutations in six.iteritems(mutations))
+
+        sections = [(self._table.name, mutations)]
+        sections.extend(six.iteritems(self._index_mutations))
+
+        if self._stats is not None:
+            started = time.time()
+
+        if self._spool is not None:
+            logger.debug("Spooling batch for '%s' (%d mutations on %d rows)",
+                         self._table.name, self._mutation_count,
+                         len(self._mutations))
+            self._spool.append(sections, self._timestamp)
+        else:
+            logger.debug("Sending batch for '%s' (%d mutations on %d rows)",
+                         self._table.name, self._mutation_count,
+                         len(self._mutations))
+            with deadline_scope(deadline):
+                if self._controller is None:
+                    for table_name, mutations in sections:
+                        self._mutate_rows(table_name, mutations)
+                else:
+                    self._send_controlled(sections)
+
+        if self._stats is not None:
+            self._record_stats(sections, time.time() - started)
 
         self._reset_mutations()
 
+    def _record_stats(self, sections, latency):
+        """Record a send in the statistics object."""
+        n_mutations = n_rows = n_bytes = 0
+        for table_name, mutations in sections:
+            for row, row_mutations in six.iteritems(mutations):
+                n_rows += 1
+                n_mutations += len(row_mutations)
+                n_bytes += len(row) + sum(
+                    len(m.column) + len(m.value or b'')
+                    for m in row_mutations)
+
+        if self._stats_callback is None:
+            stats = self._stats
+        else:
+            stats = BatchStats()
+        stats.record(n_mutations, n_rows, n_bytes, latency)
+        stats.coalesced += self._coalesced_pending
+        if self._stats_callback is not None:
+            self._stats_callback(stats)
+
+    def _send_controlled(self, sections):
+        """Send mutations, reporting their latency to the controller."""
+        controller = self._controller
+        controller.throttle(self._mutation_count)
+        with controller.slot() as started:
+            try:
+                for table_name, mutations in sections:
+                    self._mutate_rows(table_name, mutations)
+            except Exception:
+                controller.record(started, time.time() - started, error=True)
+                raise
+            controller.record(started, time.time() - started)
+
+    def _send_if_full(self):
+        """Send the batch if it reached the (possibly adaptive) batch size."""
+        if self._controller is not None:
+            batch_size = self._controller.batch_size
+        else:
+            batch_size = self._batch_size
+        if batch_size and self._mutation_count >= batch_size:
+            self.send()
+
+    def _index_put(self, row, data):
+        """Add index entries for the indexed columns in `data`."""
+        for index in six.itervalues(self._table.indexes):
+            value = data.get(index.column)
+            if value is None:
+                continue
+            index_key = index.index_key(value, row)
+            self._index_mutations[index.index_table][index_key].append(
+                ttypes.Mutation(
+                    isDelete=False,
+                    column=index.family + b':',
+                    value=b'',
+                ))
+            self._index_keys[row].append((index, index_key))
+
+    def _index_delete(self, row, columns):
+        """Remove the index entries for the indexed columns being deleted."""
+        indexes = [index for index in six.itervalues(self._table.indexes)
+                   if index.covers(columns)]
+        if not indexes:
+            return
+
+        # Index entries written earlier in this batch
+        index_keys = [(index, index_key)
+                      for index, index_key in self._index_keys.pop(row, ())
+                      if index in indexes]
+
+        # Index entries for the values currently stored in the table
+        current = self._table.row(row, [index.column for index in indexes])
+        for index in indexes:
+            value = current.get(index.column)
+            if value is not None:
+                index_keys.append((index, index.index_key(value, row)))
+
+        for index, index_key in index_keys:
+            self._index_mutations[index.index_table][index_key].append(
+                ttypes.Mutation(isDelete=True, column=index.family))
+
+    def _coalesce_put(self, row, mutations):
+        """Add puts, replacing pending puts of the same columns."""
+        row_mutations = self._mutations[row]
+        positions = self._put_positions[row]
+        saved = 0
+        for mutation in mutations:
+            position = positions.get(mutation.column)
+            if position is None:
+                positions[mutation.column] = len(row_mutations)
+                row_mutations.append(mutation)
+            else:
+                row_mutations[position] = mutation
+                saved += 1
+        return saved
+
+    def _coalesce_delete(self, row, columns):
+        """Add deletes, dropping the pending puts that they cover.
+
+        Puts added after a delete are kept, since the server applies all
+        puts for a row before its deletes, so the delete still removes
+        them. Coalescing therefore never changes the outcome of a batch.
+        """
+        row_mutations = self._mutations[row]
+        positions = self._put_positions[row]
+        deleted = self._deleted_columns[row]
+        saved = 0
+        for column in columns:
+            if column == ROW_DELETE:
+                covered = list(positions)
+            elif b':' in column:
+                covered = [column] if column in positions else []
+            else:
+                covered = [c for c in positions
+                           if c.partition(b':')[0] == column]
+            for c in covered:
+                row_mutations[positions.pop(c)] = None
+            saved += len(covered)
+
+            if column in deleted:
+                saved += 1
+            else:
+                deleted.add(column)
+                row_mutations.append(
+                    ttypes.Mutation(isDelete=True, column=column))
+        return saved
+
+    def _count(self, n_added, n_saved):
+        """Update the mutation counters, and send if the batch is full."""
+        self._mutation_count += n_added - n_saved
+        self._coalesced_pending += n_saved
+        self.coalesced += n_saved
+        self._send_if_full()
+
     #
     # Mutation methods
     #
@@ -73,17 +296,23 @@ class Batch(object):
         See :py:meth:`Table.put` for a description of the `row`, `data`,
             :py:meth:`Table.batch`.
         """
-        self._mutations[row].extend(
-            Mutation(
+        mutations = (
+            ttypes.Mutation(
                 isDelete=False,
                 column=column,
                 value=value,
             )
             for column, value in six.iteritems(data))
+        saved = 0
+        if self._coalesce:
+            saved = self._coalesce_put(row, mutations)
+        else:
+            self._mutations[row].extend(mutations)
 
-        self._mutation_count += len(data)
-        if self._batch_size and self._mutation_count >= self._batch_size:
-            self.send()
+        if self._table.indexes:
+            self._index_put(row, data)
+
+        self._count(len(data), saved)
 
     def delete(self, row, columns=None):
         """Delete data from the table.
@@ -91,22 +320,30 @@ class Batch(object):
         See :py:meth:`Table.put` for a description of the `row`, `data`,
             :py:meth:`Table.batch`.
         """
-        # Work-around Thrift API limitation: the mutation API can only
+        # Work-around Thrift1 API limitation: the mutation API can only
         # delete specified columns, not complete rows, so just list the
         # column families once and cache them for later use by the same
-        # batch instance.
+        # batch instance. The Thrift2 API can delete complete rows.
+        if self._table.indexes:
+            self._index_delete(row, columns)
+
         if columns is None:
-            if self._families is None:
-                self._families = self._table._column_family_names()
-            columns = self._families
+            if self._table.connection.api == 'thrift2':
+                columns = [ROW_DELETE]
+            else:
+                if self._families is None:
+                    self._families = self._table._column_family_names()
+                columns = self._families
 
-        self._mutations[row].extend(
-            Mutation(isDelete=True, column=column)
-            for column in columns)
+        saved = 0
+        if self._coalesce:
+            saved = self._coalesce_delete(row, columns)
+        else:
+            self._mutations[row].extend(
+                ttypes.Mutation(isDelete=True, column=column)
+                for column in columns)
 
-        self._mutation_count += len(columns)
-        if self._batch_size and self._mutation_count >= self._batch_size:
-            self.send()
+        self._count(len(columns), saved)
 
     def __enter__(self):
         """Called upon entering a ``with`` block"""
@@ -0,0 +1,358 @@
+"""
+hbasepy large value (blob) module.
+
+Values of many megabytes do not fit well in a single cell: they are sent
+in a single Thrift message, which may exceed the frame size, and are held
+in memory as a whole on both ends. A blob is stored as a number of chunk
+cells of at most `chunk_size` bytes instead, plus a manifest cell, e.g.::
+
+    with open('video.mp4', 'rb') as f:
+        table.put_blob(b'video-1', b'blobs:data', f)
+
+    with table.open_blob(b'video-1', b'blobs:data') as blob:
+        shutil.copyfileobj(blob, response)
+
+The manifest is stored in the given column, and the chunks in the same row
+and family, in columns named after the column, a generation id (unique per
+write) and the chunk number. The manifest is written after all chunks, in
+a single row mutation with the deletion of the chunks of the previous
+generation, so readers never see a partially written blob, and a failed
+write leaves the previous blob intact.
+
+Since the chunks are stored in the same row, rows with blobs should not be
+read without specifying columns; a separate column family for blobs is
+recommended.
+"""
+
+import binascii
+import io
+import logging
+import os
+from struct import Struct
+import sys
+
+import six
+
+from .tool import ensure_bytes
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'HBPYBLOB'
+VERSION = 1
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# magic, version, size, chunk size, number of chunks, generation
+_manifest = Struct('>8sBQII16s')
+
+
+class BlobError(RuntimeError):
+    """
+    Exception raised when a blob does not exist or cannot be read.
+    """
+    pass
+
+
+def chunk_column(column, generation, index):
+    """Return the name of the column storing a chunk of a blob."""
+    return b''.join((column, b'#', generation, b'#',
+                     ('%08x' % index).encode('ascii')))
+
+
+class Manifest(object):
+    """Description of a stored blob (internal use)."""
+
+    def __init__(self, size, chunk_size, n_chunks, generation):
+        self.size = size
+        self.chunk_size = chunk_size
+        self.n_chunks = n_chunks
+        self.generation = generation
+
+    def encode(self):
+        return _manifest.pack(MAGIC, VERSION, self.size, self.chunk_size,
+                              self.n_chunks, self.generation)
+
+    @classmethod
+    def decode(cls, value):
+        if len(value) != _manifest.size or not value.startswith(MAGIC):
+            raise BlobError("Not a blob manifest")
+        magic, version, size, chunk_size, n_chunks, generation = \
+            _manifest.unpack(value)
+        if version != VERSION:
+            raise BlobError("Unsupported blob version %d" % version)
+        return cls(size, chunk_size, n_chunks, generation)
+
+    def chunk_columns(self, column):
+        return [chunk_column(column, self.generation, i)
+                for i in range(self.n_chunks)]
+
+
+def read_manifest(table, row, column):
+    """Return the manifest of a blob, or `None` if there is none."""
+    value = table.row(row, [column]).get(column)
+    if value is None:
+        return None
+    return Manifest.decode(value)
+
+
+class BlobReader(io.RawIOBase):
+    """Read-only, seekable file object for a blob.
+
+    This class cannot be instantiated directly; use
+    :py:meth:`Table.open_blob` instead.
+
+    Chunks are fetched from the table as they are read, one at a time, so
+    memory use is bounded by the chunk size. If the blob is replaced or
+    deleted while it is read, :py:exc:`BlobError` is raised.
+    """
+
+    def __init__(self, table, row, column, manifest):
+        super(BlobReader, self).__init__()
+        self.row = row
+        self.column = column
+        #: The size of the blob in bytes
+        self.size = manifest.size
+        self._table = table
+        self._manifest = manifest
+        self._pos = 0
+        self._chunk_index = None
+        self._chunk = b''
+
+    def __repr__(self):
+        return '<%s.%s row=%r column=%r size=%d>' % (
+            __name__,
+            self.__class__.__name__,
+            self.row,
+            self.column,
+            self.size,
+        )
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError("Invalid 'whence' value %r" % (whence,))
+        if pos < 0:
+            raise ValueError("Negative seek position %d" % pos)
+        self._pos = pos
+        return pos
+
+    def _load_chunk(self, index):
+        manifest = self._manifest
+        column = chunk_column(self.column, manifest.generation, index)
+        chunk = self._table.row(self.row, [column]).get(column)
+        if index == manifest.n_chunks - 1:
+            expected = manifest.size - index * manifest.chunk_size
+        else:
+            expected = manifest.chunk_size
+        if chunk is None or len(chunk) != expected:
+            raise BlobError("Chunk %d of the blob in column %r of row %r is "
+                            "missing (the blob was replaced or deleted)"
+                            % (index, self.column, self.row))
+        self._chunk_index = index
+        self._chunk = chunk
+
+    def readinto(self, b):
+        if self.closed:
+            raise ValueError("I/O operation on closed blob")
+        # Fill `b` as far as possible, so that reads only return less than
+        # requested at the end of the blob.
+        n = 0
+        while n < len(b) and self._pos < self.size:
+            index, start = divmod(self._pos, self._manifest.chunk_size)
+            if index != self._chunk_index:
+                self._load_chunk(index)
+            length = min(len(b) - n, len(self._chunk) - start)
+            b[n:n + length] = self._chunk[start:start + length]
+            n += length
+            self._pos += length
+        return n
+
+    def close(self):
+        self._chunk = b''
+        super(BlobReader, self).close()
+
+
+class BlobWriter(object):
+    """Write-only file object that stores a blob.
+
+    This class cannot be instantiated directly; use
+    :py:meth:`Table.open_blob` instead.
+
+    Data is split into chunks as it is written, and the chunks are sent in
+    batches of `chunks_per_send`, so memory use is bounded by the chunk
+    size times `chunks_per_send`. The blob is stored when the writer is
+    closed; if the ``with`` block raises an exception, storing the blob
+    fails, or :py:meth:`abort` is called, the chunks written so far are
+    deleted, and the previous blob (if any) is kept.
+    """
+
+    def __init__(self, table, row, column, chunk_size=DEFAULT_CHUNK_SIZE,
+                 chunks_per_send=4):
+        if not chunk_size > 0:
+            raise ValueError("'chunk_size' must be > 0")
+        if not chunks_per_send > 0:
+            raise ValueError("'chunks_per_send' must be > 0")
+
+        self.row = row
+        self.column = column
+        #: Number of bytes written so far
+        self.size = 0
+        self.closed = False
+        self._table = table
+        self._chunk_size = chunk_size
+        self._previous = read_manifest(table, row, column)
+        self._generation = binascii.hexlify(os.urandom(8))
+        self._n_chunks = 0
+        self._buffer = bytearray()
+        self._batch = table.batch(batch_size=chunks_per_send)
+
+    def __repr__(self):
+        return '<%s.%s row=%r column=%r size=%d>' % (
+            __name__,
+            self.__class__.__name__,
+            self.row,
+            self.column,
+            self.size,
+        )
+
+    def writable(self):
+        return True
+
+    def _put_chunk(self, data):
+        column = chunk_column(self.column, self._generation, self._n_chunks)
+        self._batch.put(self.row, {column: data})
+        self._n_chunks += 1
+
+    def write(self, data):
+        """Write `data`, sending complete chunks to the table."""
+        if self.closed:
+            raise ValueError("I/O operation on closed blob")
+        self._buffer += data
+        self.size += len(data)
+        chunk_size = self._chunk_size
+        while len(self._buffer) >= chunk_size:
+            self._put_chunk(bytes(self._buffer[:chunk_size]))
+            del self._buffer[:chunk_size]
+        return len(data)
+
+    def close(self):
+        """Store the blob, replacing the previous one."""
+        if self.closed:
+            return
+        try:
+            if self._buffer:
+                self._put_chunk(bytes(self._buffer))
+                self._buffer = bytearray()
+            self._batch.send()
+
+            # The new manifest and the deletion of the previous chunks are
+            # applied to the row atomically.
+            manifest = Manifest(self.size, self._chunk_size, self._n_chunks,
+                                self._generation)
+            with self._table.batch() as batch:
+                batch.put(self.row, {self.column: manifest.encode()})
+                if self._previous is not None:
+                    batch.delete(self.row,
+                                 self._previous.chunk_columns(self.column))
+        except Exception:
+            # No manifest will ever reference the chunks written so far,
+            # so they are deleted, unless the manifest was stored after all
+            # (e.g. if the reply was lost).
+            exc_info = sys.exc_info()
+            try:
+                stored = read_manifest(self._table, self.row, self.column)
+                if (stored is not None and
+                        stored.generation == self._generation):
+                    self.closed = True
+                else:
+                    self.abort()
+            except Exception:
+                logger.warning("Failed to delete the chunks of blob in "
+                               "column %r of row %r", self.column, self.row,
+                               exc_info=True)
+            six.reraise(*exc_info)
+        self.closed = True
+
+    def abort(self):
+        """Discard the data written so far, keeping the previous blob."""
+        if self.closed:
+            return
+        self.closed = True
+        self._buffer = bytearray()
+        self._batch = None
+        if self._n_chunks:
+            self._table.delete(self.row, [
+                chunk_column(self.column, self._generation, i)
+                for i in range(self._n_chunks)])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def put_blob(table, row, column, data, chunk_size=DEFAULT_CHUNK_SIZE,
+             chunks_per_send=4):
+    """Store `data` (a byte string or a readable file object) as a blob.
+
+    See :py:meth:`Table.put_blob`.
+    """
+    row = ensure_bytes(row)
+    column = ensure_bytes(column)
+    with BlobWriter(table, row, column, chunk_size,
+                    chunks_per_send) as writer:
+        if isinstance(data, six.binary_type):
+            for start in range(0, len(data), chunk_size):
+                writer.write(data[start:start + chunk_size])
+        else:
+            while True:
+                chunk = data.read(chunk_size)
+                if not chunk:
+                    break
+                writer.write(chunk)
+    return writer.size
+
+
+def open_blob(table, row, column, mode='rb', chunk_size=DEFAULT_CHUNK_SIZE,
+              chunks_per_send=4):
+    """Open a blob for reading or writing; see :py:meth:`Table.open_blob`."""
+    row = ensure_bytes(row)
+    column = ensure_bytes(column)
+    if mode in ('r', 'rb'):
+        manifest = read_manifest(table, row, column)
+        if manifest is None:
+            raise BlobError("No blob in column %r of row %r"
+                            % (column, row))
+        return BlobReader(table, row, column, manifest)
+    if mode in ('w', 'wb'):
+        return BlobWriter(table, row, column, chunk_size, chunks_per_send)
+    raise ValueError("'mode' must be 'rb' or 'wb'")
+
+
+def delete_blob(table, row, column):
+    """Delete a blob; see :py:meth:`Table.delete_blob`."""
+    row = ensure_bytes(row)
+    column = ensure_bytes(column)
+    manifest = read_manifest(table, row, column)
+    if manifest is None:
+        return False
+    table.delete(row, [column] + manifest.chunk_columns(column))
+    return True
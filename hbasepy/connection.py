@@ -4,27 +4,36 @@ hbasepy connection module.
 """
 
 import logging
+import socket
+import threading
+import time
 
-from thrift import Thrift
 import six
-from thrift.transport import TTransport
-from thrift.transport import TSocket
-from thrift.protocol import TBinaryProtocol, TCompactProtocol
 
-from hbase_thrift import Hbase
-from hbase_thrift.ttypes import *
 from .tool import *
 
+from .deadline import DeadlineClient
 from .table import Table
+from .traffic import (
+    CountingClient, CountingTransport, TrafficCounter, aggregate)
+
+# The generated Thrift modules are large, so they are only imported when the
+# first connection is made (see LazyModule).
+Hbase = LazyModule('hbase_thrift.Hbase')
+THBaseService = LazyModule('hbase_thrift2.THBaseService')
+ttypes = LazyModule('hbase_thrift.ttypes')
 
 logger = logging.getLogger(__name__)
 COMPAT_MODES = ('0.90', '0.92', '0.94', '0.96', '0.98', '1.24')
+THRIFT_APIS = ('thrift1', 'thrift2')
 STRING_OR_BINARY = (six.binary_type, six.text_type)
 
 DEFAULT_HOST = 'localhost'
 DEFAULT_PORT = 9090
 DEFAULT_PROTOCOL = 'binary'
 DEFAULT_COMPAT = '0.98'
+DEFAULT_SCHEMA_TTL = 60.0
+DEFAULT_API = 'thrift1'
 
 class Connection(object):
     """Connection to an HBase Thrift server.
@@ -33,21 +42,62 @@ class Connection(object):
     :param int port: The port to connect to
     :param bool autoconnect: Whether the connection should be opened directly
     :param str compat: Compatibility mode (optional)
+    :param float schema_ttl: Seconds to cache table metadata (optional)
+    :param str api: Thrift API to use, ``'thrift1'`` or ``'thrift2'``
+    :param bool fast_decode: Whether to use the fast row decoder
+
+    Table metadata (column descriptors and the enabled state) is cached for
+    `schema_ttl` seconds, so that e.g. deleting complete rows does not need
+    a `getColumnDescriptors` call for every row. The cache is invalidated by
+    the table administration methods of this connection; use
+    :py:meth:`invalidate_schema` after schema changes made elsewhere, or
+    pass ``schema_ttl=0`` to disable caching.
+
+    By default, the Thrift1 (`Hbase`) API is used. With ``api='thrift2'``,
+    the Thrift2 (`THBaseService`) API of the Thrift server is used instead,
+    through an adapter (see :py:mod:`hbasepy.thrift2`), so that the rest of
+    the API works the same. Thrift2 supports deleting complete rows without
+    looking up the column families first, fetches multiple cell versions
+    for many rows in a single call, and allows reading a time range (see
+    the `time_range` arguments of :py:class:`Table`). It does not support
+    compactions, and requires HBase 2.0 or newer.
+
+    With ``fast_decode=True``, the replies of row and scanner calls are
+    decoded directly into row dictionaries by
+    :py:mod:`hbasepy.decoder`, instead of through the generated Thrift
+    types, which is considerably faster for wide rows and large scan
+    batches. This requires the binary protocol and the Thrift1 API.
     """
 
     def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, autoconnect=True,timeout=None,
-                 protocol=DEFAULT_PROTOCOL,compat=DEFAULT_COMPAT):
+                 protocol=DEFAULT_PROTOCOL,compat=DEFAULT_COMPAT,
+                 schema_ttl=DEFAULT_SCHEMA_TTL, api=DEFAULT_API,
+                 fast_decode=False):
 
         # Allow host and port to be None, which may be easier for
         # applications wrapping a Connection instance.
         if compat not in COMPAT_MODES:
             raise ValueError("'compat' must be one of %s"
                              % ", ".join(COMPAT_MODES))
+        if api not in THRIFT_APIS:
+            raise ValueError("'api' must be one of %s"
+                             % ", ".join(THRIFT_APIS))
+        if api == 'thrift2' and compat < '0.98':
+            raise ValueError("The thrift2 API requires compat >= '0.98'")
+        if fast_decode and (protocol != 'binary' or api != 'thrift1'):
+            raise ValueError("'fast_decode' requires the binary protocol "
+                             "and the thrift1 API")
         self.host = host or DEFAULT_HOST
         self.port = port or DEFAULT_PORT
         self._protocol = protocol
         self.timeout = timeout
         self.compat = compat
+        self.api = api
+        self.schema_ttl = schema_ttl
+        self.fast_decode = fast_decode
+        self._schema_cache = {}
+        self._schema_lock = threading.Lock()
+        self._traffic = TrafficCounter()
         self._refresh_thrift_client()
         self._transport_is_open = False
 
@@ -58,17 +108,31 @@ class Connection(object):
 
     def _refresh_thrift_client(self):
         """Refresh the Thrift socket, transport, and client."""
-        socket = TSocket.TSocket(host=self.host, port=self.port)
+        from thrift.transport import TSocket, TTransport
+        from thrift.protocol import TBinaryProtocol, TCompactProtocol
+
+        self._socket = TSocket.TSocket(host=self.host, port=self.port)
         if self.timeout:
-            socket.setTimeout(self.timeout)
+            self._socket.setTimeout(self.timeout)
 
-        self.transport = TTransport.TBufferedTransport(socket)
+        counting = CountingTransport(self._socket)
+        self.transport = TTransport.TBufferedTransport(counting)
 
         if self._protocol == 'binary':
             protocol = TBinaryProtocol.TBinaryProtocol(self.transport)
         else:
             protocol = TCompactProtocol.TCompactProtocol(self.transport)
-        self.client = Hbase.Client(protocol)
+        if self.api == 'thrift2':
+            from .thrift2 import Thrift2Client
+            client = Thrift2Client(THBaseService.Client(protocol))
+        else:
+            client = Hbase.Client(protocol)
+            if self.fast_decode:
+                from .decoder import FastDecodingClient
+                client = FastDecodingClient(client)
+        self.client = DeadlineClient(
+            CountingClient(client, counting, self._traffic), self)
+        self._transport_is_open = False
 
     def open(self):
         """Open the underlying transport to the HBase instance.
@@ -100,6 +164,20 @@ class Connection(object):
         self.transport.close()
         self._transport_is_open = False
 
+    def _abort(self):
+        """Shut down the socket, failing calls blocked on it.
+
+        Unlike :py:meth:`close`, this may be called from another thread
+        while a call is in progress. The connection is unusable afterwards,
+        until :py:meth:`_refresh_thrift_client` is called.
+        """
+        handle = getattr(self._socket, 'handle', None)
+        if handle is not None:
+            try:
+                handle.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
     def __del__(self):
         try:
             self._initialized
@@ -109,13 +187,71 @@ class Connection(object):
         else:
             self.close()
 
-    def table(self, name):
+    def table(self, name, indexes=None):
         """
         Return a table object.
         :param str name:the name of the table
+        :param list indexes: secondary indexes on the table (optional)
         :return:py:class:`Table`
         """
-        return Table(name, self)
+        return Table(name, self, indexes=indexes)
+
+    def _cached_schema(self, kind, name, fetch):
+        """Return cached table metadata, calling `fetch` when expired."""
+        if not self.schema_ttl:
+            return fetch(name)
+
+        key = (kind, ensure_bytes(name))
+        now = time.time()
+        with self._schema_lock:
+            entry = self._schema_cache.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        value = fetch(name)
+        with self._schema_lock:
+            self._schema_cache[key] = (now + self.schema_ttl, value)
+        return value
+
+    def _column_descriptors(self, name):
+        """Return the (cached) column descriptors of a table."""
+        return self._cached_schema(
+            'descriptors', name,
+            lambda name: self.client.getColumnDescriptors(name))
+
+    def invalidate_schema(self, name=None):
+        """Discard cached table metadata.
+
+        :param str name: The table name (optional; defaults to all tables)
+        """
+        with self._schema_lock:
+            if name is None:
+                self._schema_cache.clear()
+                return
+            name = ensure_bytes(name)
+            for key in list(self._schema_cache):
+                if key[1] == name:
+                    del self._schema_cache[key]
+
+    def traffic(self, by=None):
+        """Return the number of bytes sent and received by this connection.
+
+        The bytes moved by each Thrift call are counted on the wire, and
+        attributed to the Thrift method and the table of the call. By
+        default, the result maps `(method, table)` tuples to
+        :py:class:`hbasepy.traffic.TrafficStats` tuples of `(calls,
+        bytes_sent, bytes_received)`; if `by` is ``'method'`` or
+        ``'table'``, the totals are grouped by method or by table instead.
+        The table is `None` for calls that do not operate on a table.
+
+        :param str by: ``'method'`` or ``'table'`` (optional)
+        :rtype: dict
+        """
+        return aggregate([self._traffic.snapshot()], by=by)
+
+    def reset_traffic(self):
+        """Reset the traffic counters of this connection."""
+        self._traffic.reset()
 
     def tables(self):
         """Return a list of table names available in this HBase instance.
@@ -159,9 +295,10 @@ class Connection(object):
                 cf_name += ':'
             kwargs['name'] = cf_name
 
-            column_descriptors.append(ColumnDescriptor(**kwargs))
+            column_descriptors.append(ttypes.ColumnDescriptor(**kwargs))
 
         self.client.createTable(name, column_descriptors)
+        self.invalidate_schema(name)
 
     def delete_table(self, name):
         """Delete the specified table.
@@ -171,6 +308,7 @@ class Connection(object):
         :param str name: The table name
         """
         self.client.deleteTable(name)
+        self.invalidate_schema(name)
 
     def enable_table(self, name):
         """Enable the specified table.
@@ -178,6 +316,7 @@ class Connection(object):
         :param str name: The table name
         """
         self.client.enableTable(name)
+        self.invalidate_schema(name)
 
     def disable_table(self, name):
         """Disable the specified table.
@@ -185,6 +324,7 @@ class Connection(object):
         :param str name: The table name
         """
         self.client.disableTable(name)
+        self.invalidate_schema(name)
 
     def is_table_enabled(self, name):
         """Return whether the specified table is enabled.
@@ -194,7 +334,8 @@ class Connection(object):
         :return: whether the table is enabled
         :rtype: bool
         """
-        return self.client.isTableEnabled(name)
+        return self._cached_schema(
+            'enabled', name, lambda name: self.client.isTableEnabled(name))
 
     def compact_table(self, name, major=False):
         """Compact the specified table.
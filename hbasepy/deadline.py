@@ -0,0 +1,174 @@
+"""
+hbasepy deadline module.
+
+A :py:class:`Deadline` limits the total time an operation may take, e.g.::
+
+    table.row(b'row-key', deadline=0.05)
+
+    deadline = Deadline(0.2)
+    data = table.row(b'row-key', deadline=deadline)
+    for key, data in table.scan(row_prefix=b'user-', deadline=deadline):
+        pass
+
+Each Thrift call made on behalf of the operation gets the remaining time as
+its socket timeout (see :py:class:`DeadlineClient`), and waiting for a pool
+connection is limited to the remaining time as well. When the time runs
+out, :py:exc:`DeadlineExceeded` is raised.
+"""
+
+import contextlib
+import logging
+from numbers import Real
+import socket
+import threading
+import time
+
+from thrift.Thrift import TException
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class DeadlineExceeded(RuntimeError):
+    """
+    Exception raised when an operation does not finish before its deadline.
+    """
+    pass
+
+
+class Deadline(object):
+    """Point in time by which an operation must be finished.
+
+    A deadline can be shared by multiple operations, e.g. all calls made
+    while serving a single request.
+
+    :param float timeout: number of seconds from now
+    """
+
+    def __init__(self, timeout):
+        if not timeout > 0:
+            raise ValueError("'timeout' must be > 0")
+        self.expires = time.time() + timeout
+
+    def __repr__(self):
+        return '<%s.%s remaining=%.3f>' % (
+            __name__,
+            self.__class__.__name__,
+            self.remaining(),
+        )
+
+    @classmethod
+    def at(cls, expires):
+        """Return a deadline for the given `time.time()` value."""
+        deadline = cls.__new__(cls)
+        deadline.expires = expires
+        return deadline
+
+    def remaining(self):
+        """Return the number of seconds left (zero once expired)."""
+        return max(0.0, self.expires - time.time())
+
+    def check(self):
+        """Raise :py:exc:`DeadlineExceeded` if the deadline has passed."""
+        if time.time() >= self.expires:
+            raise DeadlineExceeded("Deadline exceeded")
+
+
+def resolve(deadline):
+    """Convert a `deadline` argument into a :py:class:`Deadline` (or `None`).
+
+    `deadline` may be `None`, a :py:class:`Deadline`, or a number of
+    seconds from now.
+    """
+    if deadline is None or isinstance(deadline, Deadline):
+        return deadline
+    if isinstance(deadline, Real) and not isinstance(deadline, bool):
+        return Deadline(deadline)
+    raise TypeError("'deadline' must be a Deadline instance or a number "
+                    "of seconds")
+
+
+def current():
+    """Return the deadline that applies to the current thread, if any."""
+    return getattr(_local, 'deadline', None)
+
+
+@contextlib.contextmanager
+def scope(deadline):
+    """Apply `deadline` to the Thrift calls made by this thread in the block.
+
+    Nested scopes use the earliest deadline. The scope should only enclose
+    the calls themselves, not a `yield`, since it applies to the whole
+    thread.
+    """
+    previous = current()
+    if deadline is None or (previous is not None
+                            and previous.expires <= deadline.expires):
+        yield
+        return
+    _local.deadline = deadline
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+class DeadlineClient(object):
+    """Thrift client proxy that applies the current deadline to each call.
+
+    Before each call made within a :py:func:`scope`, the socket timeout of
+    `connection` is set to the remaining time, and
+    :py:exc:`DeadlineExceeded` is raised if there is none left. A call that
+    times out leaves a partial reply on the socket, so the connection is
+    replaced and reopened before the exception is raised.
+    """
+
+    def __init__(self, client, connection):
+        self._client = client
+        self._connection = connection
+
+    def __getattr__(self, method):
+        func = getattr(self._client, method)
+        if not callable(func):
+            return func
+
+        connection = self._connection
+
+        def call(*args):
+            deadline = current()
+            if deadline is None:
+                return func(*args)
+
+            remaining = deadline.expires - time.time()
+            if remaining <= 0:
+                raise DeadlineExceeded(
+                    "Deadline exceeded before calling %s()" % method)
+
+            sock = connection._socket
+            sock.setTimeout(remaining * 1000)
+            try:
+                return func(*args)
+            except (TException, socket.error):
+                if time.time() < deadline.expires:
+                    raise
+                # Typically a socket timeout, after which the reply can
+                # no longer be read.
+                logger.debug("Replacing connection after %s() timed out",
+                             method)
+                connection.close()
+                connection._refresh_thrift_client()
+                try:
+                    connection.open()
+                except (TException, socket.error):
+                    logger.warning("Failed to reopen connection to %s:%d",
+                                   connection.host, connection.port,
+                                   exc_info=True)
+                raise DeadlineExceeded(
+                    "Deadline exceeded during %s()" % method)
+            finally:
+                sock.setTimeout(connection.timeout)
+
+        call.__name__ = method
+        setattr(self, method, call)
+        return call
@@ -0,0 +1,322 @@
+"""
+hbasepy fast reply decoder module.
+
+The generated Thrift code decodes a row reply into a `TRowResult` with
+a `TCell` for every cell, after which :py:class:`Table` walks all cells
+again to build the row dictionaries. For the calls that return rows
+(`scannerGetList` and the `getRow*WithColumns*` calls),
+:py:class:`FastDecodingClient` decodes the binary protocol reply directly
+into the final `(row_key, row_dict)` tuples instead, slicing row keys,
+column names and values from the receive buffer through a memoryview.
+
+The reply is read from the transport in large chunks. When a row does not
+fit in the data received so far, more data is read and decoding resumes at
+the start of that row, so the reply is only decoded once. Replies that are
+not a list of rows (e.g. server-side exceptions) are handed to the
+generated code.
+
+This module is only used with the binary protocol of the Thrift1 API; see
+the `fast_decode` argument of :py:class:`Connection`.
+"""
+
+from struct import Struct, error as StructError
+import time
+
+from .tool import LazyModule, OrderedDict
+
+Hbase = LazyModule('hbase_thrift.Hbase')
+Thrift = LazyModule('thrift.Thrift')
+TTransport = LazyModule('thrift.transport.TTransport')
+TBinaryProtocol = LazyModule('thrift.protocol.TBinaryProtocol')
+
+_i32 = Struct('>i').unpack_from
+_i64 = Struct('>q').unpack_from
+
+# Thrift type ids
+STOP, I64, STRING, STRUCT, MAP, SET, LIST = 0, 10, 11, 12, 13, 14, 15
+_FIXED_SIZES = {2: 1, 3: 1, 4: 8, 6: 2, 8: 4, 10: 8}
+
+_CHUNK_SIZE = 65536
+
+# Raised when decoding runs past the end of the data received so far
+_INCOMPLETE = (IndexError, StructError)
+
+
+def _skip(buf, ttype, pos):
+    """Return the position after the value of type `ttype` at `pos`."""
+    size = _FIXED_SIZES.get(ttype)
+    if size is not None:
+        return pos + size
+    if ttype == STRING:
+        return pos + 4 + _i32(buf, pos)[0]
+    if ttype == STRUCT:
+        while buf[pos] != STOP:
+            pos = _skip(buf, buf[pos], pos + 3)
+        return pos + 1
+    if ttype == MAP:
+        key_type, value_type = buf[pos], buf[pos + 1]
+        n = _i32(buf, pos + 2)[0]
+        pos += 6
+        for _ in range(n):
+            pos = _skip(buf, value_type, _skip(buf, key_type, pos))
+        return pos
+    if ttype in (LIST, SET):
+        element_type = buf[pos]
+        n = _i32(buf, pos + 1)[0]
+        pos += 5
+        for _ in range(n):
+            pos = _skip(buf, element_type, pos)
+        return pos
+    raise Thrift.TException("Unknown Thrift type %d" % ttype)
+
+
+def _decode_cell(buf, view, pos):
+    """Decode a `TCell` into a `(value, timestamp, end)` tuple."""
+    value = timestamp = None
+    while True:
+        field_type = buf[pos]
+        if field_type == STOP:
+            return value, timestamp, pos + 1
+        field_id = (buf[pos + 1] << 8) | buf[pos + 2]
+        pos += 3
+        if field_id == 1 and field_type == STRING:
+            n = _i32(buf, pos)[0]
+            value = view[pos + 4:pos + 4 + n].tobytes()
+            pos += 4 + n
+        elif field_id == 2 and field_type == I64:
+            timestamp = _i64(buf, pos)[0]
+            pos += 8
+        else:
+            pos = _skip(buf, field_type, pos)
+
+
+def _decode_column(buf, view, pos, include_timestamp):
+    """Decode a `TColumn` into a `(name, value, end)` tuple."""
+    name = value = None
+    while True:
+        field_type = buf[pos]
+        if field_type == STOP:
+            return name, value, pos + 1
+        field_id = (buf[pos + 1] << 8) | buf[pos + 2]
+        pos += 3
+        if field_id == 1 and field_type == STRING:
+            n = _i32(buf, pos)[0]
+            name = view[pos + 4:pos + 4 + n].tobytes()
+            pos += 4 + n
+        elif field_id == 2 and field_type == STRUCT:
+            cell_value, timestamp, pos = _decode_cell(buf, view, pos)
+            value = (cell_value, timestamp) if include_timestamp \
+                else cell_value
+        else:
+            pos = _skip(buf, field_type, pos)
+
+
+def decode_row(buf, view, pos, sorted_columns, include_timestamp):
+    """Decode a `TRowResult` into a `(row_key, row_dict, end)` tuple.
+
+    If `sorted_columns` is true, the `sortedColumns` field is decoded into
+    an `OrderedDict`, otherwise the `columns` field into a `dict`. Raises
+    `IndexError` or `struct.error` if `buf` ends before the row does.
+    """
+    key = None
+    row = OrderedDict() if sorted_columns else {}
+    while True:
+        field_type = buf[pos]
+        if field_type == STOP:
+            return key, row, pos + 1
+        field_id = (buf[pos + 1] << 8) | buf[pos + 2]
+        pos += 3
+        if field_id == 1 and field_type == STRING:
+            n = _i32(buf, pos)[0]
+            key = view[pos + 4:pos + 4 + n].tobytes()
+            pos += 4 + n
+        elif field_id == 2 and field_type == MAP and not sorted_columns:
+            # map<Text, TCell> columns
+            n = _i32(buf, pos + 2)[0]
+            pos += 6
+            for _ in range(n):
+                length = _i32(buf, pos)[0]
+                name = view[pos + 4:pos + 4 + length].tobytes()
+                pos += 4 + length
+                if buf[pos] == STRING and buf[pos + 2] == 1 \
+                        and buf[pos + 1] == 0:
+                    # The usual layout: value, timestamp, stop
+                    length = _i32(buf, pos + 3)[0]
+                    value = view[pos + 7:pos + 7 + length].tobytes()
+                    pos += 7 + length
+                    if buf[pos] == I64 and buf[pos + 2] == 2 \
+                            and buf[pos + 1] == 0 and buf[pos + 11] == STOP:
+                        if include_timestamp:
+                            row[name] = (value, _i64(buf, pos + 3)[0])
+                        else:
+                            row[name] = value
+                        pos += 12
+                        continue
+                    pos -= 7 + length
+                value, timestamp, pos = _decode_cell(buf, view, pos)
+                row[name] = (value, timestamp) if include_timestamp \
+                    else value
+        elif field_id == 3 and field_type == LIST and sorted_columns:
+            # list<TColumn> sortedColumns
+            n = _i32(buf, pos + 1)[0]
+            pos += 5
+            for _ in range(n):
+                name, value, pos = _decode_column(buf, view, pos,
+                                                  include_timestamp)
+                row[name] = value
+        else:
+            pos = _skip(buf, field_type, pos)
+
+
+class _PrefixTransport(object):
+    """Read-only transport that returns `prefix` before reading `trans`."""
+
+    def __init__(self, prefix, trans):
+        self._prefix = bytes(prefix)
+        self._trans = trans
+
+    def read(self, sz):
+        if self._prefix:
+            data = self._prefix[:sz]
+            self._prefix = self._prefix[sz:]
+            return data
+        return self._trans.read(sz)
+
+    def readAll(self, sz):
+        data = self.read(sz)
+        while len(data) < sz:
+            chunk = self.read(sz - len(data))
+            if not chunk:
+                raise TTransport.TTransportException(
+                    type=TTransport.TTransportException.END_OF_FILE,
+                    message="End of file reading reply")
+            data += chunk
+        return data
+
+
+class FastDecodingClient(object):
+    """Thrift client wrapper with fast decoding of row replies.
+
+    All calls are passed to the wrapped `Hbase.Client`, except for
+    :py:meth:`decodeRows`. The client must use a `TBinaryProtocol`, and
+    :py:meth:`decodeRows` must not be used while pipelined calls (see
+    :py:meth:`Table.cells_many`) are in flight, since it reads ahead.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        value = getattr(self._client, name)
+        setattr(self, name, value)
+        return value
+
+    def decodeRows(self, method, args, sorted_columns, include_timestamp):
+        """Call `method` and decode the returned rows.
+
+        `method` must be a Thrift call returning a list of `TRowResult`.
+        Returns a `(rows, n_bytes, decode_time)` tuple, where `rows` is
+        a list of `(row_key, row_dict)` tuples, `n_bytes` the size of the
+        reply, and `decode_time` the time spent decoding it (excluding the
+        time spent waiting for data).
+        """
+        client = self._client
+        getattr(client, 'send_' + method)(*args)
+
+        iprot = client._iprot
+        (fname, mtype, rseqid) = iprot.readMessageBegin()
+        if mtype == Thrift.TMessageType.EXCEPTION:
+            x = Thrift.TApplicationException()
+            x.read(iprot)
+            iprot.readMessageEnd()
+            raise x
+
+        trans = iprot.trans
+        buf = bytearray(trans.read(_CHUNK_SIZE))
+        n_bytes = len(buf)
+        waited = 0.0
+        started = time.time()
+
+        def more(buf, start):
+            # A new buffer is built from the unfinished part of the reply,
+            # since a bytearray cannot be resized while it is viewed.
+            wait_started = time.time()
+            chunk = trans.read(max(len(buf) - start, _CHUNK_SIZE))
+            if not chunk:
+                raise TTransport.TTransportException(
+                    type=TTransport.TTransportException.END_OF_FILE,
+                    message="End of file reading reply")
+            return buf[start:] + chunk, len(chunk), \
+                time.time() - wait_started
+
+        # The result struct should start with the success field (id 0), a
+        # list of TRowResult structs.
+        while True:
+            try:
+                if buf[0] != LIST or buf[1] != 0 or buf[2] != 0 \
+                        or buf[3] != STRUCT:
+                    return self._decode_generic(
+                        method, _PrefixTransport(buf, trans), sorted_columns,
+                        include_timestamp)
+                n = _i32(buf, 4)[0]
+                break
+            except _INCOMPLETE:
+                buf, n_read, wait = more(buf, 0)
+                n_bytes += n_read
+                waited += wait
+
+        rows = []
+        pos = 8
+        view = memoryview(buf)
+        while len(rows) < n:
+            try:
+                key, row, pos = decode_row(buf, view, pos, sorted_columns,
+                                           include_timestamp)
+            except _INCOMPLETE:
+                buf, n_read, wait = more(buf, pos)
+                n_bytes += n_read
+                waited += wait
+                pos = 0
+                view = memoryview(buf)
+                continue
+            rows.append((key, row))
+
+        # The end of the result struct
+        while pos >= len(buf):
+            buf, n_read, wait = more(buf, pos)
+            n_bytes += n_read
+            waited += wait
+            pos = 0
+        iprot.readMessageEnd()
+
+        return rows, n_bytes, time.time() - started - waited
+
+    def _decode_generic(self, method, trans, sorted_columns,
+                        include_timestamp):
+        """Decode a reply using the generated code (e.g. for exceptions)."""
+        started = time.time()
+        result = getattr(Hbase, method + '_result')()
+        result.read(TBinaryProtocol.TBinaryProtocol(trans))
+        self._client._iprot.readMessageEnd()
+        if result.success is not None:
+            rows = []
+            for item in result.success:
+                if sorted_columns:
+                    row = OrderedDict(
+                        (c.columnName, (c.cell.value, c.cell.timestamp)
+                         if include_timestamp else c.cell.value)
+                        for c in item.sortedColumns)
+                else:
+                    row = dict(
+                        (name, (cell.value, cell.timestamp)
+                         if include_timestamp else cell.value)
+                        for name, cell in item.columns.items())
+                rows.append((item.row, row))
+            return rows, 0, time.time() - started
+        if result.io is not None:
+            raise result.io
+        if getattr(result, 'ia', None) is not None:
+            raise result.ia
+        raise Thrift.TApplicationException(
+            Thrift.TApplicationException.MISSING_RESULT,
+            "%s failed: unknown result" % method)
@@ -0,0 +1,457 @@
+"""
+hbasepy filter module.
+
+This module contains a small filter builder that compiles to the HBase filter
+string language, so that filtering can be pushed down to the region servers
+instead of being done in Python after the rows have been transferred::
+
+    from hbasepy.filters import PrefixFilter, ValueFilter, KeyOnlyFilter
+
+    f = PrefixFilter(b'user-') & ValueFilter('=', b'active') & KeyOnlyFilter()
+    for key, data in table.scan(filter=f):
+        pass
+
+Filters can be combined using ``&`` (``AND``) and ``|`` (``OR``), and wrapped
+using :py:class:`Skip` and :py:class:`While`. All arguments are validated when
+the filter is constructed, and values are quoted and escaped when the filter is
+compiled, so arbitrary binary values can be used safely.
+"""
+
+from numbers import Integral
+
+import six
+
+from .tool import ensure_bytes
+
+COMPARE_OPERATORS = ('<', '<=', '=', '!=', '>', '>=')
+COMPARATORS = ('binary', 'binaryprefix', 'regexstring', 'substring')
+
+# The regexstring and substring comparators only support equality checks
+# at the server side.
+EQUALITY_ONLY_COMPARATORS = ('regexstring', 'substring')
+
+
+def quote(value):
+    """Quote a value as a filter string literal.
+
+    Single quotes are escaped by doubling them, which is the only escaping the
+    HBase filter parser knows about.
+    """
+    value = ensure_bytes(value)
+    return b"'" + value.replace(b"'", b"''") + b"'"
+
+
+def _check_operator(op):
+    if op not in COMPARE_OPERATORS:
+        raise ValueError("'op' must be one of %s"
+                         % ", ".join(COMPARE_OPERATORS))
+    return op.encode('ascii')
+
+
+def _check_comparator(comparator, op):
+    if comparator not in COMPARATORS:
+        raise ValueError("'comparator' must be one of %s"
+                         % ", ".join(COMPARATORS))
+    if comparator in EQUALITY_ONLY_COMPARATORS and op not in ('=', '!='):
+        raise ValueError("the %r comparator only supports '=' and '!='"
+                         % comparator)
+    return comparator.encode('ascii')
+
+
+def _check_int(name, value, minimum=0):
+    if not isinstance(value, Integral) or isinstance(value, bool):
+        raise TypeError("'%s' must be an integer" % name)
+    if value < minimum:
+        raise ValueError("'%s' must be >= %d" % (name, minimum))
+    return str(value).encode('ascii')
+
+
+def _check_bool(name, value):
+    if not isinstance(value, bool):
+        raise TypeError("'%s' must be a boolean" % name)
+    return b'true' if value else b'false'
+
+
+def _split_column(column):
+    column = ensure_bytes(column)
+    family, sep, qualifier = column.partition(b':')
+    if not sep or not family:
+        raise ValueError(
+            "'column' must be of the form 'family:qualifier', got %r"
+            % column)
+    return family, qualifier
+
+
+class Filter(object):
+    """Base class for all filters.
+
+    Subclasses implement :py:meth:`compile`, which returns the filter string
+    as a byte string. A compiled filter can be passed anywhere a filter string
+    is accepted, e.g. the `filter` argument of :py:meth:`Table.scan`.
+    """
+
+    #: Whether this filter is a combination of other filters, in which case
+    #: it is parenthesized when used inside another combination.
+    composite = False
+
+    def compile(self):
+        """Compile this filter into a filter string.
+
+        :return: the filter string
+        :rtype: bytes
+        """
+        raise NotImplementedError
+
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __eq__(self, other):
+        return isinstance(other, Filter) and self.compile() == other.compile()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.compile())
+
+    def __repr__(self):
+        return '<%s.%s %r>' % (
+            __name__,
+            self.__class__.__name__,
+            self.compile(),
+        )
+
+    def _compile_nested(self):
+        if self.composite:
+            return b'(' + self.compile() + b')'
+        return self.compile()
+
+
+class _SimpleFilter(Filter):
+    """Filter with a name and a list of already compiled arguments."""
+
+    name = None
+
+    def __init__(self, *args):
+        self._args = args
+
+    def compile(self):
+        return (self.name.encode('ascii') + b' (' +
+                b', '.join(self._args) + b')')
+
+
+class FilterString(Filter):
+    """Hand-written filter string, for combining it with other filters."""
+
+    composite = True
+
+    def __init__(self, filter_string):
+        self.filter_string = ensure_bytes(filter_string)
+
+    def compile(self):
+        return self.filter_string
+
+
+def compile_filter(filter):
+    """Return the filter string for a filter object or a filter string.
+
+    This is used by :py:class:`Table` to accept both :py:class:`Filter`
+    instances and hand-written filter strings.
+    """
+    if filter is None or isinstance(filter, (six.binary_type, six.text_type)):
+        return filter
+    if isinstance(filter, Filter):
+        return filter.compile()
+    raise TypeError("'filter' must be a filter string or a Filter instance")
+
+
+#
+# Key and column filters
+#
+
+class KeyOnlyFilter(_SimpleFilter):
+    """Only return the key component of each cell, with an empty value."""
+
+    name = 'KeyOnlyFilter'
+
+    def __init__(self):
+        super(KeyOnlyFilter, self).__init__()
+
+
+class FirstKeyOnlyFilter(_SimpleFilter):
+    """Only return the first cell of each row."""
+
+    name = 'FirstKeyOnlyFilter'
+
+    def __init__(self):
+        super(FirstKeyOnlyFilter, self).__init__()
+
+
+class PrefixFilter(_SimpleFilter):
+    """Only return rows whose key starts with `prefix`."""
+
+    name = 'PrefixFilter'
+
+    def __init__(self, prefix):
+        super(PrefixFilter, self).__init__(quote(prefix))
+
+
+class ColumnPrefixFilter(_SimpleFilter):
+    """Only return columns whose qualifier starts with `prefix`."""
+
+    name = 'ColumnPrefixFilter'
+
+    def __init__(self, prefix):
+        super(ColumnPrefixFilter, self).__init__(quote(prefix))
+
+
+class MultipleColumnPrefixFilter(_SimpleFilter):
+    """Only return columns whose qualifier starts with any of `prefixes`."""
+
+    name = 'MultipleColumnPrefixFilter'
+
+    def __init__(self, prefixes):
+        if isinstance(prefixes, (six.binary_type, six.text_type)):
+            raise TypeError("'prefixes' must be a list of prefixes")
+        prefixes = [quote(p) for p in prefixes]
+        if not prefixes:
+            raise ValueError("'prefixes' must not be empty")
+        super(MultipleColumnPrefixFilter, self).__init__(*prefixes)
+
+
+class ColumnRangeFilter(_SimpleFilter):
+    """Only return columns with a qualifier between two qualifiers.
+
+    Either bound may be `None` (but not both), meaning the range is unbounded
+    on that side.
+    """
+
+    name = 'ColumnRangeFilter'
+
+    def __init__(self, min_column=None, max_column=None, min_inclusive=True,
+                 max_inclusive=False):
+        if min_column is None and max_column is None:
+            raise ValueError(
+                "at least one of 'min_column' and 'max_column' is required")
+        super(ColumnRangeFilter, self).__init__(
+            quote(b'' if min_column is None else min_column),
+            _check_bool('min_inclusive', min_inclusive),
+            quote(b'' if max_column is None else max_column),
+            _check_bool('max_inclusive', max_inclusive))
+
+
+class InclusiveStopFilter(_SimpleFilter):
+    """Stop the scan after the row `row`, which is included."""
+
+    name = 'InclusiveStopFilter'
+
+    def __init__(self, row):
+        super(InclusiveStopFilter, self).__init__(quote(row))
+
+
+class TimestampsFilter(_SimpleFilter):
+    """Only return cells with one of the given timestamps."""
+
+    name = 'TimestampsFilter'
+
+    def __init__(self, timestamps):
+        timestamps = [_check_int('timestamp', ts) for ts in timestamps]
+        if not timestamps:
+            raise ValueError("'timestamps' must not be empty")
+        super(TimestampsFilter, self).__init__(*timestamps)
+
+
+#
+# Paging filters
+#
+
+class PageFilter(_SimpleFilter):
+    """Return at most `page_size` rows per region server.
+
+    Note that this limit is applied by each region server separately, so more
+    rows may be returned in total; combine it with the `limit` argument of
+    :py:meth:`Table.scan` for an exact limit.
+    """
+
+    name = 'PageFilter'
+
+    def __init__(self, page_size):
+        super(PageFilter, self).__init__(
+            _check_int('page_size', page_size, minimum=1))
+
+
+class ColumnCountGetFilter(_SimpleFilter):
+    """Only return the first `limit` columns of each row."""
+
+    name = 'ColumnCountGetFilter'
+
+    def __init__(self, limit):
+        super(ColumnCountGetFilter, self).__init__(
+            _check_int('limit', limit, minimum=1))
+
+
+class ColumnPaginationFilter(_SimpleFilter):
+    """Only return `limit` columns of each row, starting at `offset`."""
+
+    name = 'ColumnPaginationFilter'
+
+    def __init__(self, limit, offset=0):
+        super(ColumnPaginationFilter, self).__init__(
+            _check_int('limit', limit, minimum=1),
+            _check_int('offset', offset))
+
+
+#
+# Comparison filters
+#
+
+class _CompareFilter(_SimpleFilter):
+    """Filter comparing a part of each cell using a comparator."""
+
+    def __init__(self, op, value, comparator='binary'):
+        compiled_op = _check_operator(op)
+        comparator = _check_comparator(comparator, op)
+        super(_CompareFilter, self).__init__(
+            compiled_op,
+            quote(comparator + b':' + ensure_bytes(value)))
+
+
+class RowFilter(_CompareFilter):
+    """Compare row keys, e.g. ``RowFilter('>=', b'row-100')``."""
+
+    name = 'RowFilter'
+
+
+class FamilyFilter(_CompareFilter):
+    """Compare column family names."""
+
+    name = 'FamilyFilter'
+
+
+class QualifierFilter(_CompareFilter):
+    """Compare column qualifiers."""
+
+    name = 'QualifierFilter'
+
+
+class ValueFilter(_CompareFilter):
+    """Compare cell values, e.g. ``ValueFilter('=', b'x', 'substring')``."""
+
+    name = 'ValueFilter'
+
+
+class SingleColumnValueFilter(_SimpleFilter):
+    """Only return rows for which the value of `column` matches.
+
+    If `filter_if_missing` is `True`, rows without the column are skipped as
+    well; by default they are returned. If `latest_version_only` is `True`
+    (the default), only the latest version of the column is compared.
+    """
+
+    name = 'SingleColumnValueFilter'
+
+    def __init__(self, column, op, value, comparator='binary',
+                 filter_if_missing=False, latest_version_only=True):
+        family, qualifier = _split_column(column)
+        compiled_op = _check_operator(op)
+        comparator = _check_comparator(comparator, op)
+        super(SingleColumnValueFilter, self).__init__(
+            quote(family),
+            quote(qualifier),
+            compiled_op,
+            quote(comparator + b':' + ensure_bytes(value)),
+            _check_bool('filter_if_missing', filter_if_missing),
+            _check_bool('latest_version_only', latest_version_only))
+
+
+class SingleColumnValueExcludeFilter(SingleColumnValueFilter):
+    """Like :py:class:`SingleColumnValueFilter`, but omit the tested column."""
+
+    name = 'SingleColumnValueExcludeFilter'
+
+
+def row_range_filter(start, stop):
+    """Return a filter that only passes rows in the range `[start, stop)`.
+
+    Either bound may be `None` (or an empty start key), but not both.
+    """
+    filters = []
+    if start:
+        filters.append(RowFilter('>=', start))
+    if stop is not None:
+        filters.append(RowFilter('<', stop))
+    if not filters:
+        raise ValueError("at least one of 'start' and 'stop' is required")
+    if len(filters) == 1:
+        return filters[0]
+    return And(*filters)
+
+
+#
+# Combinations
+#
+
+class _FilterList(Filter):
+    """Combination of filters using a boolean operator."""
+
+    operator = None
+    composite = True
+
+    def __init__(self, *filters):
+        if len(filters) < 2:
+            raise ValueError("at least two filters are required")
+        flattened = []
+        for f in filters:
+            if not isinstance(f, Filter):
+                raise TypeError("arguments must be Filter instances")
+            if type(f) is type(self):
+                # Flatten nested combinations using the same operator
+                flattened.extend(f.filters)
+            else:
+                flattened.append(f)
+        self.filters = tuple(flattened)
+
+    def compile(self):
+        separator = b' ' + self.operator + b' '
+        return separator.join(f._compile_nested() for f in self.filters)
+
+
+class And(_FilterList):
+    """Only return cells that pass all filters."""
+
+    operator = b'AND'
+
+
+class Or(_FilterList):
+    """Return cells that pass at least one of the filters."""
+
+    operator = b'OR'
+
+
+class _UnaryFilter(Filter):
+    """Filter wrapping another filter."""
+
+    operator = None
+
+    def __init__(self, filter):
+        if not isinstance(filter, Filter):
+            raise TypeError("argument must be a Filter instance")
+        self.filter = filter
+
+    def compile(self):
+        return self.operator + b' ' + self.filter._compile_nested()
+
+
+class Skip(_UnaryFilter):
+    """Skip an entire row if any of its cells does not pass `filter`."""
+
+    operator = b'SKIP'
+
+
+class While(_UnaryFilter):
+    """Stop the scan as soon as a cell does not pass `filter`."""
+
+    operator = b'WHILE'
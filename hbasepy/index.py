@@ -0,0 +1,87 @@
+"""
+hbasepy secondary index module.
+"""
+
+from struct import Struct
+
+from .tool import ensure_bytes
+
+pack_u32 = Struct('>I').pack
+unpack_u32 = Struct('>I').unpack_from
+
+
+class Index(object):
+    """Client-maintained secondary index on a single column.
+
+    An index maps the values of `column` in a table to the row keys of the
+    rows containing them. It is stored in a separate table, `index_table`,
+    which must have a column family named `family`, e.g.::
+
+        connection.create_table('users_by_email', {'i': dict(max_versions=1)})
+        index = Index('email', b'cf:email', 'users_by_email')
+        users = connection.table('users', indexes=[index])
+
+    Index entries are written by :py:class:`Batch` (and hence by
+    :py:meth:`Table.put`) together with the data, and removed again when
+    the indexed column is deleted. Use :py:meth:`Table.lookup` to find rows
+    by value.
+
+    Overwriting an indexed column does not remove the index entry for the
+    old value, since that would require a read for every write. Such stale
+    entries are skipped by :py:meth:`Table.lookup`, which verifies the
+    current value of each row it returns.
+
+    Each index row key consists of the length of the value, the value
+    itself, and the row key of the indexed row, so that all rows with
+    a given value can be found with a single prefix scan.
+
+    :param str name: the name of the index
+    :param str column: the indexed column, e.g. ``b'cf:email'``
+    :param str index_table: the name of the table storing the index
+    :param str family: the column family used in the index table
+    """
+
+    def __init__(self, name, column, index_table, family=b'i'):
+        self.name = name
+        self.column = ensure_bytes(column)
+        self.family = ensure_bytes(family).rstrip(b':')
+        self.index_table = index_table
+
+        self._column_family = self.column.partition(b':')[0]
+
+    def __repr__(self):
+        return '<%s.%s name=%r column=%r index_table=%r>' % (
+            __name__,
+            self.__class__.__name__,
+            self.name,
+            self.column,
+            self.index_table,
+        )
+
+    def prefix(self, value):
+        """Return the index row key prefix for all rows with `value`."""
+        value = ensure_bytes(value)
+        return pack_u32(len(value)) + value
+
+    def index_key(self, value, row):
+        """Return the index row key for `value` in row `row`."""
+        return self.prefix(value) + ensure_bytes(row)
+
+    def row_key(self, index_key):
+        """Return the row key of the indexed row for an index row key."""
+        (length,) = unpack_u32(index_key)
+        return index_key[4 + length:]
+
+    def covers(self, columns):
+        """Return whether deleting `columns` deletes the indexed column.
+
+        `columns` may contain full column names or column family names;
+        `None` means all columns.
+        """
+        if columns is None:
+            return True
+        for column in columns:
+            column = ensure_bytes(column)
+            if column == self.column or column == self._column_family:
+                return True
+        return False
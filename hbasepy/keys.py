@@ -0,0 +1,233 @@
+"""
+hbasepy composite row key module.
+
+HBase sorts row keys as byte strings, so keys built by concatenating
+fields only sort like the fields themselves if each field is encoded in
+an order-preserving way. :py:class:`KeyCodec` encodes tuples of integers,
+floats, byte strings and text strings such that the encoded keys sort in
+the same order as the tuples, e.g.::
+
+    codec = KeyCodec(six.text_type, int, Descending(int))
+    key = codec.encode((u'tenant-1', -5, 1500000000000))
+    codec.decode(key)  # (u'tenant-1', -5, 1500000000000)
+
+    # All rows of a tenant, newest first within each id
+    for key, data in table.scan(row_prefix=(u'tenant-1',), key_codec=codec):
+        tenant, id, timestamp = key
+
+A tuple with fewer values than the codec has fields encodes a key prefix,
+so leading fields can be used in the `row_start`, `row_stop` and
+`row_prefix` arguments of :py:meth:`Table.scan`; see its `key_codec`
+argument.
+
+The encodings are:
+
+* integers: 8 bytes, big endian, with the sign bit flipped (the values
+  must fit in a signed 64-bit integer);
+* floats: the 8 byte IEEE 754 representation, with the sign bit flipped
+  for positive numbers and all bits flipped for negative numbers;
+* byte strings: zero bytes are escaped as ``00 ff``, and the string is
+  terminated by ``00 01``, so that a string sorts before its extensions;
+* text strings: UTF-8 encoded, then as byte strings.
+
+Fields wrapped in :py:class:`Descending` have all bits of their encoding
+flipped, which reverses their sort order.
+"""
+
+from numbers import Integral, Real
+from struct import Struct
+
+import six
+
+_u64 = Struct('>Q')
+_f64 = Struct('>d')
+
+_SIGN = 1 << 63
+_MASK = (1 << 64) - 1
+
+_INVERT = bytes(bytearray(range(255, -1, -1)))
+
+
+def _invert(data):
+    return data.translate(_INVERT)
+
+
+class Descending(object):
+    """Key field that sorts in descending order; see :py:class:`KeyCodec`.
+
+    :param type kind: the type of the field
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.kind.__name__)
+
+
+class _IntField(object):
+    width = 8
+
+    def encode(self, value):
+        if not isinstance(value, Integral) or isinstance(value, bool):
+            raise TypeError("Key field must be an integer, not %r"
+                            % (value,))
+        if not -_SIGN <= value < _SIGN:
+            raise ValueError("Key field %d does not fit in 64 bits" % value)
+        return _u64.pack(value + _SIGN)
+
+    def decode(self, data):
+        return _u64.unpack(data)[0] - _SIGN
+
+
+class _FloatField(object):
+    width = 8
+
+    def encode(self, value):
+        if not isinstance(value, Real) or isinstance(value, bool):
+            raise TypeError("Key field must be a number, not %r" % (value,))
+        bits = _u64.unpack(_f64.pack(value))[0]
+        bits = bits ^ _MASK if bits & _SIGN else bits | _SIGN
+        return _u64.pack(bits)
+
+    def decode(self, data):
+        bits = _u64.unpack(data)[0]
+        bits = bits ^ _SIGN if bits & _SIGN else bits ^ _MASK
+        return _f64.unpack(_u64.pack(bits))[0]
+
+
+class _BytesField(object):
+    width = None
+
+    def check(self, value):
+        if not isinstance(value, six.binary_type):
+            raise TypeError("Key field must be a byte string, not %r"
+                            % (value,))
+        return value
+
+    def encode(self, value):
+        return self.check(value).replace(b'\x00', b'\x00\xff') + b'\x00\x01'
+
+    def decode_from(self, key, pos, descending):
+        """Return the value at `pos` in `key`, and the position after it."""
+        if descending:
+            zero, escaped, end = b'\xff', b'\x00', b'\xfe'
+        else:
+            zero, escaped, end = b'\x00', b'\xff', b'\x01'
+        parts = []
+        while True:
+            i = key.find(zero, pos)
+            if i < 0 or i + 1 == len(key):
+                raise ValueError("Unterminated string field in key %r"
+                                 % (key,))
+            parts.append(key[pos:i])
+            marker = key[i + 1:i + 2]
+            pos = i + 2
+            if marker == end:
+                break
+            if marker != escaped:
+                raise ValueError("Invalid string field in key %r" % (key,))
+            parts.append(zero)
+        value = b''.join(parts)
+        if descending:
+            value = _invert(value)
+        return self.convert(value), pos
+
+    def convert(self, value):
+        return value
+
+
+class _TextField(_BytesField):
+
+    def check(self, value):
+        if not isinstance(value, six.text_type):
+            raise TypeError("Key field must be a text string, not %r"
+                            % (value,))
+        return value.encode('utf-8')
+
+    def convert(self, value):
+        return value.decode('utf-8')
+
+
+_FIELDS = [
+    (six.text_type, _TextField),
+    (six.binary_type, _BytesField),
+    (float, _FloatField),
+]
+_FIELDS.extend((kind, _IntField) for kind in six.integer_types)
+
+
+class KeyCodec(object):
+    """Order-preserving encoding of tuples as row keys.
+
+    Each field is one of the types ``int``, ``float``, ``bytes`` or
+    ``six.text_type``, optionally wrapped in :py:class:`Descending`. See
+    :py:mod:`hbasepy.keys` for the encodings.
+
+    :param fields: the types of the fields of the key
+    """
+
+    def __init__(self, *fields):
+        if not fields:
+            raise TypeError("KeyCodec needs at least one field")
+        self.fields = fields
+        self._fields = []
+        for field in fields:
+            descending = isinstance(field, Descending)
+            kind = field.kind if descending else field
+            for field_kind, field_class in _FIELDS:
+                if kind is field_kind:
+                    self._fields.append((field_class(), descending))
+                    break
+            else:
+                raise TypeError("Unsupported key field type %r" % (kind,))
+
+    def __repr__(self):
+        return '<%s.%s fields=(%s)>' % (
+            __name__,
+            self.__class__.__name__,
+            ', '.join(repr(field) if isinstance(field, Descending)
+                      else field.__name__ for field in self.fields),
+        )
+
+    def encode(self, values):
+        """Encode a tuple of values into a row key.
+
+        If `values` has fewer values than the codec has fields, the result
+        is the prefix shared by all keys starting with these values.
+
+        :param tuple values: the values of (the leading) fields
+        :rtype: bytes
+        """
+        if not isinstance(values, tuple):
+            raise TypeError("Key values must be a tuple")
+        if len(values) > len(self._fields):
+            raise ValueError("Key has %d fields, got %d values"
+                             % (len(self._fields), len(values)))
+        parts = []
+        for (field, descending), value in zip(self._fields, values):
+            data = field.encode(value)
+            parts.append(_invert(data) if descending else data)
+        return b''.join(parts)
+
+    def decode(self, key):
+        """Decode a row key into a tuple of values.
+
+        :param bytes key: the row key
+        :rtype: tuple
+        """
+        values = []
+        pos = 0
+        for field, descending in self._fields:
+            if field.width is None:
+                value, pos = field.decode_from(key, pos, descending)
+            else:
+                data = key[pos:pos + field.width]
+                if len(data) != field.width:
+                    raise ValueError("Key %r is too short" % (key,))
+                value = field.decode(_invert(data) if descending else data)
+                pos += field.width
+            values.append(value)
+        if pos != len(key):
+            raise ValueError("Key %r is too long" % (key,))
+        return tuple(values)
@@ -0,0 +1,66 @@
+"""
+hbasepy map/reduce module.
+
+This module contains the worker side of :py:meth:`Table.map_reduce`, which
+runs sub-scans in a pool of worker processes so that decoding and
+aggregation are not limited to a single CPU core.
+
+These functions are not part of the public API.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Connections opened by this worker process, keyed by the connection
+# arguments, so that consecutive tasks reuse the same connection.
+_connections = {}
+
+
+def connection_kwargs(connection):
+    """Return the arguments needed to open a similar connection."""
+    return dict(
+        host=connection.host,
+        port=connection.port,
+        timeout=connection.timeout,
+        protocol=connection._protocol,
+        compat=connection.compat,
+        schema_ttl=connection.schema_ttl,
+        api=connection.api,
+        fast_decode=connection.fast_decode,
+    )
+
+
+def _worker_connection(kwargs):
+    from .connection import Connection
+
+    key = tuple(sorted(kwargs.items()))
+    connection = _connections.get(key)
+    if connection is None:
+        connection = _connections[key] = Connection(**kwargs)
+    return connection
+
+
+def run_task(task):
+    """Scan a key range and reduce the mapped rows (runs in a worker).
+
+    Returns a `(n_rows, result)` tuple; `result` is `None` if no rows were
+    scanned.
+    """
+    (kwargs, table_name, key_range, scan_kwargs, mapper, reducer) = task
+    table = _worker_connection(kwargs).table(table_name)
+
+    n_rows = 0
+    result = None
+    for key, data in table.scan(row_start=key_range[0],
+                                row_stop=key_range[1], **scan_kwargs):
+        value = mapper(key, data)
+        if n_rows:
+            result = reducer(result, value)
+        else:
+            result = value
+        n_rows += 1
+
+    logger.debug("Reduced %d rows of '%s' in range %r",
+                 n_rows, table_name, key_range)
+    return n_rows, result
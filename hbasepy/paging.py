@@ -0,0 +1,163 @@
+"""
+hbasepy pagination module.
+
+:py:meth:`Table.page` returns a page of rows and an opaque token for the
+next page, which makes it easy to page through a table from a stateless
+web API, e.g.::
+
+    rows, token = table.page(50, row_prefix=b'user-',
+                             token=request.args.get('page'))
+
+Each page is read with a fresh scanner that starts right after the last
+row of the previous page, and is limited to the size of the page, so the
+cost of a page does not depend on how deep it is. The token encodes the
+last row key and the query (the end of the range, the direction, the
+filter, the columns and the timestamp); it is not encrypted or signed.
+"""
+
+import base64
+import binascii
+import json
+
+import six
+
+from .filters import compile_filter
+from .tool import bytes_increment, ensure_bytes
+
+TOKEN_VERSION = 1
+
+
+def _b64encode(data):
+    return None if data is None else \
+        base64.b64encode(data).decode('ascii')
+
+
+def _b64decode(data):
+    return None if data is None else \
+        base64.b64decode(data.encode('ascii'))
+
+
+def encode_token(last, query):
+    """Return the page token for the page after row key `last`."""
+    payload = {
+        'v': TOKEN_VERSION,
+        'last': _b64encode(last),
+        'stop': _b64encode(query['stop']),
+        'reverse': query['reverse'],
+        'filter': _b64encode(query['filter']),
+        'columns': (None if query['columns'] is None
+                    else [_b64encode(column) for column in query['columns']]),
+        'timestamp': query['timestamp'],
+    }
+    data = json.dumps(payload, sort_keys=True).encode('utf-8')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def decode_token(token):
+    """Return a `(last, query)` tuple for a page token."""
+    try:
+        data = ensure_bytes(token)
+        data = base64.urlsafe_b64decode(data + b'=' * (-len(data) % 4))
+        payload = json.loads(data.decode('utf-8'))
+        if payload['v'] != TOKEN_VERSION:
+            raise ValueError("Unsupported page token version")
+        columns = payload['columns']
+        query = {
+            'stop': _b64decode(payload['stop']),
+            'reverse': bool(payload['reverse']),
+            'filter': _b64decode(payload['filter']),
+            'columns': (None if columns is None
+                        else [_b64decode(column) for column in columns]),
+            'timestamp': payload['timestamp'],
+        }
+        return _b64decode(payload['last']), query
+    except (binascii.Error, AttributeError, KeyError, TypeError,
+            ValueError):
+        raise ValueError("Invalid page token %r" % (token,))
+
+
+def page(table, size, token=None, row_start=None, row_stop=None,
+         row_prefix=None, columns=None, filter=None, timestamp=None,
+         include_timestamp=False, sorted_columns=False, reverse=None,
+         key_codec=None, deadline=None):
+    """Return a page of rows and the token for the next page.
+
+    See :py:meth:`Table.page`.
+    """
+    if not isinstance(size, int):
+        raise TypeError("'size' must be an integer")
+    if size < 1:
+        raise ValueError("'size' must be >= 1")
+
+    if key_codec is not None:
+        if isinstance(row_start, tuple):
+            row_start = key_codec.encode(row_start)
+        if isinstance(row_stop, tuple):
+            row_stop = key_codec.encode(row_stop)
+        if isinstance(row_prefix, tuple):
+            row_prefix = key_codec.encode(row_prefix)
+
+    if row_prefix is not None:
+        if row_start is not None or row_stop is not None:
+            raise TypeError(
+                "'row_prefix' cannot be combined with 'row_start' "
+                "or 'row_stop'")
+        row_prefix = ensure_bytes(row_prefix)
+        if reverse:
+            row_start = bytes_increment(row_prefix)
+            row_stop = row_prefix
+        else:
+            row_start = row_prefix
+            row_stop = bytes_increment(row_prefix)
+
+    filter = compile_filter(filter)
+    query = {
+        'stop': None if row_stop is None else ensure_bytes(row_stop),
+        'reverse': reverse,
+        'filter': None if filter is None else ensure_bytes(filter),
+        'columns': (None if columns is None
+                    else [ensure_bytes(column) for column in columns]),
+        'timestamp': timestamp,
+    }
+
+    skip = None
+    if token is None:
+        query['reverse'] = bool(reverse)
+        start = row_start
+    else:
+        # The query arguments may be repeated, but must match the token.
+        last, token_query = decode_token(token)
+        for name, value in six.iteritems(query):
+            if value is not None and value != token_query[name]:
+                raise ValueError("'%s' does not match the page token"
+                                 % name)
+        query = token_query
+        if query['reverse']:
+            # Reverse scans cannot start right before a row key, so the
+            # last row of the previous page is read again, and skipped.
+            start = skip = last
+        else:
+            start = last + b'\x00'
+
+    # One more row than needed tells whether there is a next page.
+    limit = size + 1 if skip is None else size + 2
+    rows = []
+    for key, data in table.scan(
+            row_start=start, row_stop=query['stop'],
+            columns=query['columns'], filter=query['filter'],
+            timestamp=query['timestamp'],
+            include_timestamp=include_timestamp, batch_size=limit,
+            limit=limit, sorted_columns=sorted_columns,
+            reverse=query['reverse'], deadline=deadline):
+        if key == skip:
+            continue
+        rows.append((key, data))
+
+    next_token = None
+    if len(rows) > size:
+        del rows[size:]
+        next_token = encode_token(rows[-1][0], query)
+
+    if key_codec is not None:
+        rows = [(key_codec.decode(key), data) for key, data in rows]
+    return rows, next_token
@@ -2,19 +2,37 @@
 HappyBase connection pool module.
 """
 
+import bisect
 import contextlib
+import itertools
 import logging
 import socket
+import sys
 import threading
+import time
 
+import six
 from six import moves
 
 from thrift.Thrift import TException
 
 from .connection import Connection
+from .deadline import (
+    DeadlineExceeded, current as current_deadline,
+    resolve as resolve_deadline, scope as deadline_scope)
+from .stats import LaneStats
+from .traffic import aggregate
+from .table import Table
+from .throttle import HedgePolicy
 
 logger = logging.getLogger(__name__)
 
+# Idempotent Thrift calls that are hedged by a PooledTable with a hedge
+# policy; decodeRows is only used for these outside of scanners.
+HEDGED_METHODS = frozenset([
+    'getRowWithColumns', 'getRowWithColumnsTs', 'getRowsWithColumns',
+    'getRowsWithColumnsTs', 'getVer', 'getVerTs', 'decodeRows'])
+
 
 class NoConnectionsAvailable(RuntimeError):
     """
@@ -28,6 +46,55 @@ class NoConnectionsAvailable(RuntimeError):
     pass
 
 
+class Lane(object):
+    """Class of pool users, with its own priority, quota and cap.
+
+    See :py:class:`ConnectionPool`. Lanes with a lower `priority` value
+    are served first when several threads wait for a connection.
+    A lane can use up to `limit` connections at the same time, and
+    `reserved` connections are kept for the lane, i.e. other lanes do not
+    use them even when they are idle.
+
+    :param int priority: the priority of the lane (lower goes first)
+    :param int reserved: number of connections reserved for the lane
+    :param int limit: maximum number of connections used (optional)
+    """
+
+    def __init__(self, priority=0, reserved=0, limit=None):
+        if not isinstance(priority, int):
+            raise TypeError("'priority' must be an integer")
+        if not isinstance(reserved, int):
+            raise TypeError("'reserved' must be an integer")
+        if reserved < 0:
+            raise ValueError("'reserved' must be >= 0")
+        if limit is not None:
+            if not isinstance(limit, int):
+                raise TypeError("'limit' must be an integer or None")
+            if limit < max(1, reserved):
+                raise ValueError("'limit' must be >= 1 and >= 'reserved'")
+        self.priority = priority
+        self.reserved = reserved
+        self.limit = limit
+
+    def __repr__(self):
+        return '<%s.%s priority=%d reserved=%d limit=%r>' % (
+            __name__,
+            self.__class__.__name__,
+            self.priority,
+            self.reserved,
+            self.limit,
+        )
+
+
+class _Waiter(object):
+    """A thread waiting for a pool connection."""
+
+    def __init__(self, lane):
+        self.lane = lane
+        self.connection = None
+        self.event = threading.Event()
+
+
 class ConnectionPool(object):
     """
     Thread-safe connection pool.
@@ -40,52 +107,460 @@ class ConnectionPool(object):
     the `autoconnect` argument, since maintaining connections is the
     task of the pool.
 
+    By default, the first connection is opened immediately and the others
+    are opened lazily, on first use. If `preconnect` is true, all
+    connections are opened concurrently in background threads instead, and
+    the constructor returns without waiting for them; each connection
+    becomes available as soon as it is open, so the first request only
+    waits for the fastest connection. Connections that fail to open are
+    still added to the pool, and opened again on first use.
+
+    Users of the pool can be divided into `lanes`, e.g. to keep bulk scans
+    from starving latency sensitive reads::
+
+        pool = ConnectionPool(size=10, lanes={
+            'interactive': Lane(priority=0, reserved=2),
+            'batch': Lane(priority=1, limit=6),
+            'background': Lane(priority=2, limit=2),
+        }, default_lane='interactive')
+
+        with pool.connection(lane='batch') as connection:
+            pass
+
+        table = pool.table('users', lane='background')
+
+    `lanes` maps lane names to :py:class:`Lane` instances. Each lane can
+    have connections reserved for it and a cap on the number of connections
+    it uses at once, and waiting threads are served in order of the
+    priority of their lane (and first come, first served within a lane).
+    Requests that do not name a lane use `default_lane`; without lanes, the
+    pool has a single lane named ``'default'``, which is also added with
+    default settings if `default_lane` is not given. The time spent waiting
+    for connections is reported per lane by :py:meth:`lane_stats`.
+
     :param int size: the maximum number of concurrently open connections
+    :param bool preconnect: open all connections in the background
+    :param dict lanes: lane names and settings (optional)
+    :param str default_lane: the lane for requests without one (optional)
     :param kwargs: keyword arguments passed to
                    :py:class:`hbasepy.Connection`
     """
-    def __init__(self, size, **kwargs):
+    def __init__(self, size, preconnect=False, lanes=None, default_lane=None,
+                 **kwargs):
         if not isinstance(size, int):
             raise TypeError("Pool 'size' arg must be an integer")
 
         if not size > 0:
             raise ValueError("Pool 'size' arg must be greater than zero")
 
+        lanes = dict(lanes or {})
+        for lane in six.itervalues(lanes):
+            if not isinstance(lane, Lane):
+                raise TypeError("'lanes' must map names to Lane instances")
+        if default_lane is None:
+            default_lane = 'default'
+            lanes.setdefault(default_lane, Lane())
+        elif default_lane not in lanes:
+            raise ValueError("Unknown default lane %r" % (default_lane,))
+        reserved = sum(lane.reserved for lane in six.itervalues(lanes))
+        if reserved > size:
+            raise ValueError("Pool lanes reserve more than 'size' "
+                             "connections")
+        if reserved == size and any(lane.reserved == 0
+                                    for lane in six.itervalues(lanes)):
+            raise ValueError("Pool lanes reserve all connections, leaving "
+                             "none for lanes without reserved connections")
+
         logger.debug(
             "Initializing connection pool with %d connections", size)
 
+        self.size = size
+        self.lanes = lanes
+        self.default_lane = default_lane
         self._lock = threading.Lock()
-        self._queue = moves.queue.LifoQueue(maxsize=size)
         self._thread_connections = threading.local()
 
+        # Idle connections (used last in, first out), the number of
+        # connections in use per lane, the lane of each connection in use,
+        # and the waiting threads, ordered by priority and arrival.
+        self._idle_lock = threading.Lock()
+        self._idle = []
+        self._in_use = dict.fromkeys(lanes, 0)
+        self._owners = {}
+        self._waiters = []
+        self._arrivals = itertools.count()
+        self._lane_stats = dict((name, LaneStats()) for name in lanes)
+
         connection_kwargs = kwargs
         connection_kwargs['autoconnect'] = False
 
-        for i in range(size):
-            connection = Connection(**connection_kwargs)
-            self._queue.put(connection)
+        connections = [Connection(**connection_kwargs) for i in range(size)]
+        self._connections = connections
+        self._template = connections[0]
+
+        if preconnect:
+            for connection in connections:
+                thread = threading.Thread(target=self._preconnect,
+                                          args=(connection,))
+                thread.daemon = True
+                thread.start()
+            return
+
+        self._idle.extend(connections)
 
         # The first connection is made immediately so that trivial
         # mistakes like unresolvable host names are raised immediately.
         # Subsequent connections are connected lazily.
-        with self.connection():
-            pass
+        self._idle[-1].open()
 
-    def _acquire_connection(self, timeout=None):
-        """Acquire a connection from the pool."""
+    def _preconnect(self, connection):
+        """Open a connection and add it to the pool (runs in a thread)."""
         try:
-            return self._queue.get(True, timeout)
-        except moves.queue.Empty:
-            raise NoConnectionsAvailable(
-                "No connection available from pool within specified "
-                "timeout")
+            connection.open()
+        except (TException, socket.error):
+            logger.warning("Failed to open pool connection to %s:%d",
+                           connection.host, connection.port, exc_info=True)
+        finally:
+            self._return_connection(connection)
+
+    def _resolve_lane(self, lane):
+        if lane is None:
+            return self.default_lane
+        if lane not in self.lanes:
+            raise ValueError("Unknown pool lane %r" % (lane,))
+        return lane
+
+    def _may_take(self, lane):
+        """Return whether `lane` may take an idle connection.
+
+        Must be called with `_idle_lock` held.
+        """
+        if not self._idle:
+            return False
+        settings = self.lanes[lane]
+        in_use = self._in_use[lane]
+        if settings.limit is not None and in_use >= settings.limit:
+            return False
+        if in_use < settings.reserved:
+            return True
+        # Idle connections that are held back for other lanes
+        held = sum(max(0, other.reserved - self._in_use[name])
+                   for name, other in six.iteritems(self.lanes)
+                   if name != lane)
+        return len(self._idle) > held
+
+    def _take(self, lane):
+        """Take an idle connection for `lane` (with `_idle_lock` held)."""
+        connection = self._idle.pop()
+        self._in_use[lane] += 1
+        self._owners[connection] = lane
+        return connection
+
+    def _dispatch(self):
+        """Hand idle connections to waiting threads, by priority.
+
+        Must be called with `_idle_lock` held. Waiters whose lane may not
+        take a connection (e.g. because of its cap) do not hold up the
+        waiters behind them.
+        """
+        while self._idle:
+            for i, (_, _, waiter) in enumerate(self._waiters):
+                if self._may_take(waiter.lane):
+                    break
+            else:
+                return
+            del self._waiters[i]
+            waiter.connection = self._take(waiter.lane)
+            waiter.event.set()
+
+    def _acquire_connection(self, timeout=None, lane=None):
+        """Acquire a connection from the pool for `lane`.
+
+        The wait is limited by the current deadline, if any (see
+        :py:func:`hbasepy.deadline.scope`).
+        """
+        lane = self._resolve_lane(lane)
+        deadline = current_deadline()
+        limited = False
+        if deadline is not None:
+            remaining = deadline.remaining()
+            if timeout is None or remaining < timeout:
+                timeout = remaining
+                limited = True
+
+        stats = self._lane_stats[lane]
+        with self._idle_lock:
+            if self._may_take(lane):
+                stats.record(0.0)
+                return self._take(lane)
+            started = time.time()
+            waiter = _Waiter(lane)
+            bisect.insort(self._waiters, (self.lanes[lane].priority,
+                                          next(self._arrivals), waiter))
+
+        waiter.event.wait(timeout)
+
+        with self._idle_lock:
+            connection = waiter.connection
+            if connection is None:
+                self._waiters = [item for item in self._waiters
+                                 if item[2] is not waiter]
+            stats.record(time.time() - started, connection is not None)
+
+        if connection is not None:
+            return connection
+        if limited:
+            raise DeadlineExceeded(
+                "Deadline exceeded waiting for a pool connection")
+        raise NoConnectionsAvailable(
+            "No connection available from pool within specified "
+            "timeout")
+
+    def _acquire_connections(self, n, timeout=None, lane=None):
+        """Acquire `n` connections from the pool for `lane` at once.
+
+        Either all or none of the connections are taken, so that callers
+        that need several connections at the same time never hold some of
+        them while waiting for the others, which could deadlock.
+        """
+        lane = self._resolve_lane(lane)
+        stats = self._lane_stats[lane]
+        started = time.time()
+        delay = 0.001
+        while True:
+            with self._idle_lock:
+                connections = []
+                while len(connections) < n and self._may_take(lane):
+                    connections.append(self._take(lane))
+                if len(connections) == n:
+                    stats.record(time.time() - started)
+                    return connections
+                for connection in reversed(connections):
+                    del self._owners[connection]
+                    self._in_use[lane] -= 1
+                    self._idle.append(connection)
+
+            waited = time.time() - started
+            if timeout is not None and waited >= timeout:
+                with self._idle_lock:
+                    stats.record(waited, False)
+                raise NoConnectionsAvailable(
+                    "No %d connections available from pool within "
+                    "specified timeout" % n)
+
+            # Returned connections are handed to single waiters first, so
+            # poll instead of waiting in line.
+            if timeout is not None:
+                delay = min(delay, started + timeout - time.time())
+            time.sleep(max(delay, 0))
+            delay = min(delay * 2, 0.05)
 
     def _return_connection(self, connection):
         """Return a connection to the pool."""
-        self._queue.put(connection)
+        with self._idle_lock:
+            lane = self._owners.pop(connection, None)
+            if lane is not None:
+                self._in_use[lane] -= 1
+            self._idle.append(connection)
+            self._dispatch()
+
+    def lane_stats(self):
+        """Return the wait statistics of each lane of this pool.
+
+        :return: lane names mapped to their statistics
+        :rtype: dict of :py:class:`hbasepy.stats.LaneStats`
+        """
+        with self._idle_lock:
+            return dict(self._lane_stats)
+
+    def reset_lane_stats(self):
+        """Reset the wait statistics of all lanes of this pool."""
+        with self._idle_lock:
+            for name in self._lane_stats:
+                self._lane_stats[name] = LaneStats()
+
+    def traffic(self, by=None):
+        """Return the traffic of all connections in this pool.
+
+        See :py:meth:`Connection.traffic` for the format of the result.
+
+        :param str by: ``'method'`` or ``'table'`` (optional)
+        :rtype: dict
+        """
+        return aggregate([connection._traffic.snapshot()
+                          for connection in self._connections], by=by)
+
+    def reset_traffic(self):
+        """Reset the traffic counters of all connections in this pool."""
+        for connection in self._connections:
+            connection.reset_traffic()
+
+    def table(self, name, indexes=None, hedge=None, lane=None):
+        """
+        Return a table object that is safe to share between threads.
+
+        See :py:class:`PooledTable` for details. If `hedge` is `True` or
+        a :py:class:`hbasepy.throttle.HedgePolicy` instance, reads are
+        hedged; see :py:class:`PooledTable`. The table borrows its
+        connections in the given `lane` (by default the default lane).
+
+        :param str name: the name of the table
+        :param list indexes: secondary indexes on the table (optional)
+        :param hedge: hedged read policy (optional)
+        :param str lane: the pool lane (optional)
+        :rtype: :py:class:`PooledTable`
+        """
+        return PooledTable(self, name, indexes=indexes, hedge=hedge,
+                           lane=lane)
 
     @contextlib.contextmanager
-    def connection(self, timeout=None):
+    def _checkout(self, deadline=None, lane=None):
+        """Obtain a connection without binding it to the current thread.
+
+        This is used for scanners, which may be consumed (and closed) from
+        another thread than the one that opened them. If the current thread
+        already holds a connection, that connection is used. Waiting for
+        a connection is limited by `deadline`.
+        """
+        connection = getattr(self._thread_connections, 'current', None)
+        if connection is not None:
+            yield connection
+            return
+
+        with deadline_scope(deadline):
+            connection = self._acquire_connection(lane=lane)
+        try:
+            connection.open()
+            yield connection
+        except (TException, socket.error):
+            logger.info("Replacing tainted pool connection")
+            connection._refresh_thrift_client()
+            connection.open()
+            raise
+        finally:
+            self._return_connection(connection)
+
+    @contextlib.contextmanager
+    def _hedged(self, policy, func, discard=None, deadline=None,
+                lane=None):
+        """Run `func(connection)` on a pool connection, hedged by `policy`.
+
+        This context manager yields a `(connection, result)` tuple for the
+        attempt that succeeded first, and keeps its connection checked out
+        until the block ends (like :py:meth:`_checkout`). The other attempt,
+        if any, is abandoned; `discard` is called with its result, if it
+        has one. `deadline` defaults to the current deadline, and applies
+        to both attempts. Both connections are taken from `lane`.
+        """
+        if deadline is None:
+            deadline = current_deadline()
+        if deadline is not None:
+            # Attempts run in their own threads, outside the caller's scope.
+            unscoped = func
+
+            def func(connection):
+                with deadline_scope(deadline):
+                    return unscoped(connection)
+
+        started = time.time()
+        delay = policy.delay()
+        with self._checkout(deadline, lane) as primary:
+            if delay is None:
+                result = func(primary)
+                policy.record(time.time() - started)
+                yield primary, result
+                return
+
+            results = moves.queue.Queue()
+            attempts = [_Attempt(primary, func, results)]
+            finished = []
+            try:
+                finished.append(results.get(True, delay))
+            except moves.queue.Empty:
+                hedge = None
+                if policy.allow_hedge():
+                    hedge = self._try_acquire_connection(lane)
+                if hedge is not None:
+                    logger.debug("Hedging read after %.3fs", delay)
+                    attempts.append(_Attempt(hedge, func, results))
+
+            # Use the first attempt that succeeds, or fail if all fail.
+            while len(finished) < len(attempts) and all(
+                    attempt.error is not None for attempt in finished):
+                finished.append(results.get())
+            winner = attempts[0]
+            for attempt in finished:
+                if attempt.error is None:
+                    winner = attempt
+                    break
+
+            for attempt in attempts:
+                if attempt is not winner:
+                    self._abandon(attempt, discard)
+            policy.record(time.time() - started,
+                          hedged=len(attempts) > 1,
+                          hedge_won=winner is not attempts[0])
+
+            if winner is attempts[0]:
+                if len(attempts) > 1:
+                    self._return_connection(attempts[1].connection)
+                if winner.error is not None:
+                    six.reraise(*winner.error)
+                yield primary, winner.result
+                return
+
+        # The hedge won, and the primary connection is back in the pool.
+        connection = winner.connection
+        try:
+            yield connection, winner.result
+        except (TException, socket.error):
+            logger.info("Replacing tainted pool connection")
+            connection._refresh_thrift_client()
+            raise
+        finally:
+            self._return_connection(connection)
+
+    def _try_acquire_connection(self, lane=None):
+        """Acquire and open a connection, if one is available right away."""
+        lane = self._resolve_lane(lane)
+        with self._idle_lock:
+            if not self._may_take(lane):
+                return None
+            connection = self._take(lane)
+        try:
+            connection.open()
+        except (TException, socket.error):
+            logger.info("Replacing tainted pool connection")
+            connection._refresh_thrift_client()
+            self._return_connection(connection)
+            return None
+        return connection
+
+    def _abandon(self, attempt, discard=None):
+        """Clean up after an attempt that lost the race.
+
+        An attempt that is still running is stopped by shutting down its
+        socket, after which its connection is replaced.
+        """
+        tainted = not attempt.done.is_set()
+        if tainted:
+            attempt.connection._abort()
+            attempt.thread.join()
+        elif attempt.error is not None:
+            tainted = issubclass(attempt.error[0], (TException, socket.error))
+
+        if attempt.error is None and discard is not None:
+            try:
+                discard(attempt.result)
+            except (TException, socket.error):
+                tainted = True
+
+        if tainted:
+            logger.debug("Replacing abandoned pool connection")
+            attempt.connection._refresh_thrift_client()
+
+    @contextlib.contextmanager
+    def connection(self, timeout=None, deadline=None, lane=None):
         """
         Obtain a connection from the pool.
 
@@ -100,10 +575,26 @@ class ConnectionPool(object):
         :py:exc:`NoConnectionsAvailable` is raised. If omitted, this
         method waits forever for a connection to become available.
 
+        If `deadline` (a :py:class:`hbasepy.deadline.Deadline` or a number
+        of seconds) is specified and passes while waiting,
+        :py:exc:`hbasepy.deadline.DeadlineExceeded` is raised instead. The
+        deadline only applies to obtaining the connection; pass it to the
+        table methods called in the block to limit those as well. The
+        current deadline, if any, applies too, e.g. to the connections
+        borrowed by :py:class:`PooledTable`.
+
+        The connection is taken from the given `lane` (see
+        :py:class:`ConnectionPool`), or from the default lane. Nested
+        requests from the same thread return the same connection,
+        regardless of their lane.
+
         :param int timeout: number of seconds to wait (optional)
+        :param deadline: time limit (optional)
+        :param str lane: the pool lane (optional)
         :return: active connection from the pool
         :rtype: :py:class:`hbaspy.Connection`
         """
+        deadline = resolve_deadline(deadline)
 
         connection = getattr(self._thread_connections, 'current', None)
 
@@ -113,13 +604,25 @@ class ConnectionPool(object):
             # Obtain a new connection from the pool and keep a reference
             # in a thread local so that nested connection requests from
             # the same thread can return the same connection instance.
-            #
+            return_after_use = True
+            with deadline_scope(deadline):
+                connection = self._acquire_connection(timeout, lane)
+
+        with self._use(connection, return_after_use) as connection:
+            yield connection
+
+    @contextlib.contextmanager
+    def _use(self, connection, return_after_use=True):
+        """Use an acquired connection in this thread.
+
+        If `return_after_use` is true, this thread owns the connection
+        until the block ends, after which it is returned to the pool.
+        """
+        if return_after_use:
             # Note: this code acquires a lock before assigning to the
             # thread local; see
             # http://emptysquare.net/blog/another-thing-about-pythons-
             # threadlocals/
-            return_after_use = True
-            connection = self._acquire_connection(timeout)
             with self._lock:
                 self._thread_connections.current = connection
 
@@ -149,3 +652,184 @@ class ConnectionPool(object):
             if return_after_use:
                 del self._thread_connections.current
                 self._return_connection(connection)
+
+
+class _Attempt(object):
+    """A call running on a pool connection in a separate thread."""
+
+    def __init__(self, connection, func, results):
+        self.connection = connection
+        self.result = self.error = None
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._run,
+                                       args=(func, results))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self, func, results):
+        try:
+            self.result = func(self.connection)
+        except Exception:
+            self.error = sys.exc_info()
+        self.done.set()
+        results.put(self)
+
+
+class _PooledClient(object):
+    """Thrift client proxy that borrows a pool connection for each call.
+
+    If `hedge` is a :py:class:`HedgePolicy`, idempotent reads are hedged.
+    Connections are borrowed in the given pool `lane`.
+    """
+
+    def __init__(self, pool, hedge=None, lane=None):
+        self._pool = pool
+        self._hedge = hedge
+        self._lane = lane
+
+    def __getattr__(self, name):
+        if self._hedge is not None and name in HEDGED_METHODS:
+            def call(*args):
+                def run(connection):
+                    return getattr(connection.client, name)(*args)
+                with self._pool._hedged(self._hedge, run,
+                                        lane=self._lane) as (_, result):
+                    return result
+        else:
+            def call(*args):
+                with self._pool.connection(lane=self._lane) as connection:
+                    return getattr(connection.client, name)(*args)
+        call.__name__ = name
+        return call
+
+
+class _PooledConnection(object):
+    """Connection stand-in used by :py:class:`PooledTable`."""
+
+    def __init__(self, pool, hedge=None, lane=None):
+        template = pool._template
+        self.host = template.host
+        self.port = template.port
+        self.timeout = template.timeout
+        self.compat = template.compat
+        self.schema_ttl = template.schema_ttl
+        self.api = template.api
+        self.fast_decode = template.fast_decode
+        self._protocol = template._protocol
+        self._pool = pool
+        self._lane = lane
+        self.client = _PooledClient(pool, hedge, lane)
+
+    def table(self, name, indexes=None):
+        return PooledTable(self._pool, name, indexes=indexes,
+                           lane=self._lane)
+
+    def _column_descriptors(self, name):
+        with self._pool.connection(lane=self._lane) as connection:
+            return connection._column_descriptors(name)
+
+
+class PooledTable(Table):
+    """Table that borrows connections from a pool, and is thread-safe.
+
+    This class cannot be instantiated directly; use
+    :py:meth:`ConnectionPool.table` instead.
+
+    A pooled table can be shared by any number of threads. Each call, e.g.
+    :py:meth:`Table.row`, :py:meth:`Table.put` or
+    :py:meth:`Table.counter_inc`, borrows a connection from the pool for
+    the duration of a single Thrift call, and each scan pins a connection
+    for as long as the scanner is open. Batches borrow a connection for
+    each send; a batch object itself must not be shared between threads.
+
+    If the calling thread already holds a connection (inside
+    a :py:meth:`ConnectionPool.connection` block), that connection is used.
+    Otherwise, a thread that issues calls while one of its scans is still
+    open needs a second connection, so the pool should have more
+    connections than the number of scans that are open at the same time.
+
+    If `hedge` is given (see :py:class:`hbasepy.throttle.HedgePolicy`), the
+    idempotent reads :py:meth:`Table.row`, :py:meth:`Table.rows` and
+    :py:meth:`Table.cells`, and the opening and first batch of each scan,
+    are hedged: if the reply takes longer than the hedge delay, the read is
+    repeated on another connection, if one is available right away, and
+    the first reply wins. The loser's connection is shut down and replaced;
+    an abandoned scanner is left to expire on the server. Each hedged read
+    uses a thread, so hedging is meant for latency sensitive reads, not for
+    bulk reads. Use separate policies for tables or read types with
+    different latencies, since the policy derives its delay from them.
+
+    All connections are borrowed in the pool lane `lane` (see
+    :py:class:`ConnectionPool`), except for the concurrent operations that
+    take a `pool` argument, which use the default lane of that pool.
+    """
+
+    def __init__(self, pool, name, indexes=None, hedge=None, lane=None):
+        if hedge is True:
+            hedge = HedgePolicy()
+        elif hedge is not None and not isinstance(hedge, HedgePolicy):
+            raise TypeError("'hedge' must be True or a HedgePolicy instance")
+        lane = pool._resolve_lane(lane)
+        super(PooledTable, self).__init__(
+            name, _PooledConnection(pool, hedge, lane), indexes=indexes)
+        self.pool = pool
+        self.hedge = hedge
+        self.lane = lane
+
+    def cells_many(self, requests, versions=None, timestamp=None,
+                   include_timestamp=False, window=32, pool=None,
+                   workers=None):
+        """Retrieve multiple versions of many cells from the table.
+
+        See :py:meth:`Table.cells_many`. Since pipelined calls must use
+        a single connection, the calls are always spread over connections
+        from a pool, by default the pool of this table.
+        """
+        if pool is None:
+            pool = self.pool
+        return super(PooledTable, self).cells_many(
+            requests, versions=versions, timestamp=timestamp,
+            include_timestamp=include_timestamp, window=window, pool=pool,
+            workers=workers)
+
+    def _scanner(self, *args, **kwargs):
+        if self.hedge is not None:
+            return self._hedged_scanner(args, kwargs)
+        return self._pinned_scanner(args, kwargs)
+
+    def _pinned_scanner(self, args, kwargs):
+        # Scanner ids are only valid on the connection that opened them,
+        # so the whole scan uses a single connection.
+        with self.pool._checkout(kwargs.get('deadline'),
+                                 self.lane) as connection:
+            scanner = Table(self.name, connection)._scanner(*args, **kwargs)
+            try:
+                for item in scanner:
+                    yield item
+            finally:
+                scanner.close()
+
+    def _hedged_scanner(self, args, kwargs):
+        # Opening the scanner and fetching the first batch is hedged; the
+        # rest of the scan uses the connection that replied first.
+        def start(connection):
+            scanner = Table(self.name, connection)._scanner(*args, **kwargs)
+            for item in scanner:
+                return scanner, item
+            return scanner, None
+
+        def discard(result):
+            result[0].close()
+
+        with self.pool._hedged(self.hedge, start, discard,
+                               kwargs.get('deadline'),
+                               self.lane) as (_, result):
+            scanner, item = result
+            try:
+                if item is None:
+                    return
+                yield item
+                for item in scanner:
+                    yield item
+            finally:
+                scanner.close()
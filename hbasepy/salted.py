@@ -0,0 +1,274 @@
+"""
+hbasepy salted table module.
+"""
+
+import logging
+import struct
+import zlib
+
+from .tool import bytes_increment, ensure_bytes, FanOut, merge_sorted
+
+logger = logging.getLogger(__name__)
+
+
+class SaltedTable(object):
+    """Table wrapper that distributes rows over a number of salt buckets.
+
+    Monotonically increasing row keys, like timestamps or sequence numbers,
+    cause all writes to go to a single region. This wrapper prefixes each
+    row key with a deterministic bucket number derived from a hash of the
+    key, so that consecutive keys end up in different regions. For best
+    results, the table should be pre-split at the bucket boundaries, see
+    :py:meth:`split_keys`.
+
+    Reads and writes use the logical (unsalted) row keys. A scan is turned
+    into one scan per bucket, and the results are merged back into logical
+    row key order. If a `pool` is given, the bucket scans run concurrently,
+    each using its own connection from the pool; the pool must therefore
+    have at least `buckets` connections. Since a scan needs all of these
+    connections at the same time, they are taken from the pool at once,
+    waiting up to `timeout` seconds (or forever if omitted) until that many
+    are idle, after which :py:exc:`NoConnectionsAvailable` is raised. No
+    connections are held while waiting, so concurrent scans and other users
+    of the pool cannot deadlock; however, a thread that already holds
+    a connection from the pool should pass a `timeout`, since its own
+    connection is not available to the scan.
+
+    Note that server-side filters see the salted row keys, so row key based
+    filters (e.g. `PrefixFilter`) should not be used; use the `row_prefix`
+    argument of :py:meth:`scan` instead.
+
+    :param table: the underlying table
+    :type table: :py:class:`Table`
+    :param int buckets: the number of salt buckets (at most 65536)
+    :param pool: connection pool for concurrent scans (optional)
+    :type pool: :py:class:`ConnectionPool`
+    :param float timeout: seconds to wait for pool connections (optional)
+    """
+
+    def __init__(self, table, buckets, pool=None, timeout=None):
+        if not isinstance(buckets, int):
+            raise TypeError("'buckets' must be an integer")
+        if not 0 < buckets <= 0x10000:
+            raise ValueError("'buckets' must be between 1 and 65536")
+        if pool is not None and pool.size < buckets:
+            raise ValueError(
+                "'pool' must have at least as many connections as 'buckets'")
+
+        self.table = table
+        self.buckets = buckets
+        self.pool = pool
+        self.timeout = timeout
+        self._salt_format = struct.Struct('>B' if buckets <= 0x100 else '>H')
+        self._salt_length = self._salt_format.size
+
+    def __repr__(self):
+        return '<%s.%s name=%r buckets=%d>' % (
+            __name__,
+            self.__class__.__name__,
+            self.table.name,
+            self.buckets,
+        )
+
+    #
+    # Key handling
+    #
+
+    def bucket(self, row):
+        """Return the bucket number for a (logical) row key."""
+        return (zlib.crc32(ensure_bytes(row)) & 0xffffffff) % self.buckets
+
+    def salt_key(self, row):
+        """Return the salted row key for a (logical) row key."""
+        row = ensure_bytes(row)
+        return self._salt_format.pack(self.bucket(row)) + row
+
+    def unsalt_key(self, key):
+        """Return the logical row key for a salted row key."""
+        return key[self._salt_length:]
+
+    def split_keys(self):
+        """Return the bucket boundaries, for pre-splitting the table."""
+        return [self._salt_format.pack(i) for i in range(1, self.buckets)]
+
+    #
+    # Reads
+    #
+
+    def row(self, row, columns=None, timestamp=None, include_timestamp=False):
+        """Retrieve a single row of data; see :py:meth:`Table.row`."""
+        return self.table.row(self.salt_key(row), columns=columns,
+                              timestamp=timestamp,
+                              include_timestamp=include_timestamp)
+
+    def cells(self, row, column, versions=None, timestamp=None,
+              include_timestamp=False):
+        """Retrieve multiple versions of a cell; see :py:meth:`Table.cells`."""
+        return self.table.cells(self.salt_key(row), column, versions=versions,
+                                timestamp=timestamp,
+                                include_timestamp=include_timestamp)
+
+    def scan(self, row_start=None, row_stop=None, row_prefix=None,
+             columns=None, filter=None, timestamp=None,
+             include_timestamp=False, batch_size=1000, limit=None,
+             sorted_columns=False, reverse=False):
+        """Scan the table in logical row key order.
+
+        This runs one scan per bucket, and merges the results. The arguments
+        behave exactly the same as for :py:meth:`Table.scan`, and the
+        returned row keys are the logical (unsalted) row keys.
+        """
+        if limit is not None and limit < 1:
+            raise ValueError("'limit' must be >= 1")
+
+        if row_prefix is not None:
+            if row_start is not None or row_stop is not None:
+                raise TypeError(
+                    "'row_prefix' cannot be combined with 'row_start' "
+                    "or 'row_stop'")
+            row_prefix = ensure_bytes(row_prefix)
+            if reverse:
+                row_start = bytes_increment(row_prefix)
+                row_stop = row_prefix
+            else:
+                row_start = row_prefix
+                row_stop = bytes_increment(row_prefix)
+
+        scans = []
+        for i in range(self.buckets):
+            salt = self._salt_format.pack(i)
+            if reverse:
+                bucket_start, bucket_stop = bytes_increment(salt), salt
+            else:
+                bucket_start, bucket_stop = salt, bytes_increment(salt)
+            scans.append(dict(
+                salt=salt,
+                row_start=(bucket_start if row_start is None
+                           else salt + ensure_bytes(row_start)),
+                row_stop=(bucket_stop if row_stop is None
+                          else salt + ensure_bytes(row_stop)),
+            ))
+
+        scan_kwargs = dict(
+            columns=columns,
+            filter=filter,
+            timestamp=timestamp,
+            include_timestamp=include_timestamp,
+            batch_size=batch_size,
+            # The bounds of reverse scans may include a row outside the
+            # requested range, which is skipped below.
+            limit=None if limit is None else limit + 1,
+            sorted_columns=sorted_columns,
+            reverse=reverse,
+        )
+
+        def run(connection, kwargs):
+            kwargs = dict(kwargs)
+            salt = kwargs.pop('salt')
+            table = self.table if connection is None else \
+                connection.table(self.table.name)
+            for key, data in table.scan(**dict(scan_kwargs, **kwargs)):
+                if not key.startswith(salt):
+                    continue
+                key = self.unsalt_key(key)
+                if row_prefix is not None and not key.startswith(row_prefix):
+                    continue
+                yield key, data
+
+        fan = None
+        if self.pool is None:
+            streams = [run(None, kwargs) for kwargs in scans]
+        else:
+            # Each worker takes one of the connections acquired here
+            connections = self.pool._acquire_connections(len(scans),
+                                                         self.timeout)
+            fan = FanOut(run, scans, len(scans),
+                         context=lambda: self.pool._use(connections.pop()),
+                         buffer_size=batch_size if isinstance(batch_size, int)
+                         else 1000)
+            streams = [fan.results(i) for i in range(len(scans))]
+
+        n_returned = 0
+        try:
+            for item in merge_sorted(streams, key=lambda item: item[0],
+                                     reverse=reverse):
+                yield item
+                n_returned += 1
+                if limit is not None and n_returned == limit:
+                    return
+        finally:
+            for stream in streams:
+                stream.close()
+            if fan is not None:
+                fan.close()
+
+    #
+    # Writes
+    #
+
+    def put(self, row, data, timestamp=None):
+        """Store data in the table; see :py:meth:`Table.put`."""
+        self.table.put(self.salt_key(row), data, timestamp=timestamp)
+
+    def delete(self, row, columns=None, timestamp=None):
+        """Delete data from the table; see :py:meth:`Table.delete`."""
+        self.table.delete(self.salt_key(row), columns=columns,
+                          timestamp=timestamp)
+
+    def batch(self, timestamp=None, batch_size=None, transaction=False):
+        """Create a new batch operation; see :py:meth:`Table.batch`.
+
+        :rtype: :py:class:`SaltedBatch`
+        """
+        return SaltedBatch(self, self.table.batch(
+            timestamp=timestamp, batch_size=batch_size,
+            transaction=transaction))
+
+    def counter_get(self, row, column):
+        """Retrieve a counter value; see :py:meth:`Table.counter_get`."""
+        return self.table.counter_get(self.salt_key(row), column)
+
+    def counter_set(self, row, column, value=0):
+        """Set a counter value; see :py:meth:`Table.counter_set`."""
+        self.table.counter_set(self.salt_key(row), column, value=value)
+
+    def counter_inc(self, row, column, value=1):
+        """Increment a counter; see :py:meth:`Table.counter_inc`."""
+        return self.table.counter_inc(self.salt_key(row), column, value=value)
+
+    def counter_dec(self, row, column, value=1):
+        """Decrement a counter; see :py:meth:`Table.counter_dec`."""
+        return self.table.counter_dec(self.salt_key(row), column, value=value)
+
+
+class SaltedBatch(object):
+    """Batch wrapper that salts row keys.
+
+    This class cannot be instantiated directly; use
+    :py:meth:`SaltedTable.batch` instead.
+    """
+
+    def __init__(self, salted_table, batch):
+        self._salted_table = salted_table
+        self._batch = batch
+
+    def put(self, row, data):
+        """Store data in the table; see :py:meth:`Batch.put`."""
+        self._batch.put(self._salted_table.salt_key(row), data)
+
+    def delete(self, row, columns=None):
+        """Delete data from the table; see :py:meth:`Batch.delete`."""
+        self._batch.delete(self._salted_table.salt_key(row), columns)
+
+    def send(self):
+        """Send the batch to the server."""
+        self._batch.send()
+
+    def __enter__(self):
+        """Called upon entering a ``with`` block"""
+        self._batch.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Called upon exiting a ``with`` block"""
+        return self._batch.__exit__(exc_type, exc_value, traceback)
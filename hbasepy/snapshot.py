@@ -0,0 +1,376 @@
+"""
+hbasepy snapshot module.
+
+A snapshot is an immutable local file with the results of a scan, e.g.::
+
+    write_snapshot('users.snap', table.scan(columns=[b'cf:name']))
+
+    with Snapshot('users.snap') as snapshot:
+        data = snapshot.row(b'user-123')
+        for key, data in snapshot.scan(row_prefix=b'user-1'):
+            pass
+
+The file contains the rows in row key order, split into blocks of about
+`block_size` bytes, followed by an index with the first row key of each
+block, an optional Bloom filter over the row keys, and a fixed size footer.
+:py:class:`Snapshot` memory-maps the file and finds rows using a binary
+search over the block index, so lookups and scans do not touch the cluster
+and only read the blocks they need.
+"""
+
+import binascii
+import bisect
+import hashlib
+import math
+import mmap
+import os
+from struct import Struct
+
+import six
+
+from .tool import bytes_increment, ensure_bytes
+
+MAGIC = b'HBPYSNAP'
+VERSION = 1
+
+_header = Struct('>8sI')
+# index offset, number of blocks, Bloom filter offset, number of Bloom
+# filter bits, number of hash functions, number of rows, magic
+_footer = Struct('>QIQQIQ8s')
+_u32 = Struct('>I')
+_block_entry = Struct('>QI')
+
+
+def _bloom_positions(key, n_bits, n_hashes):
+    """Return the Bloom filter bit positions for `key` (double hashing)."""
+    digest = binascii.hexlify(hashlib.md5(key).digest())
+    h1 = int(digest[:16], 16)
+    h2 = int(digest[16:], 16)
+    return [(h1 + i * h2) % n_bits for i in range(n_hashes)]
+
+
+def _encode_row(key, data):
+    parts = [_u32.pack(len(key)), key, _u32.pack(len(data))]
+    for column in sorted(data):
+        value = data[column]
+        if not isinstance(value, six.binary_type):
+            raise TypeError("snapshot values must be byte strings (scans "
+                            "with 'include_timestamp' cannot be saved)")
+        parts.extend((_u32.pack(len(column)), column,
+                      _u32.pack(len(value)), value))
+    return b''.join(parts)
+
+
+def write_snapshot(path, rows, block_size=64 * 1024, bloom_filter=True,
+                   false_positive_rate=0.01):
+    """Write rows to a snapshot file.
+
+    `rows` is an iterable of `(row_key, row_data)` tuples in ascending row
+    key order, like the results of :py:meth:`Table.scan`. The file is
+    written to a temporary file first and renamed into place, so readers
+    never see a partial snapshot.
+
+    :param str path: the path of the snapshot file
+    :param rows: the rows to write
+    :param int block_size: the approximate size of a block in bytes
+    :param bool bloom_filter: whether to add a Bloom filter over row keys
+    :param float false_positive_rate: target Bloom filter false positive rate
+
+    :return: the number of rows written
+    :rtype: int
+    """
+    if block_size < 1:
+        raise ValueError("'block_size' must be >= 1")
+    if not 0 < false_positive_rate < 1:
+        raise ValueError("'false_positive_rate' must be between 0 and 1")
+
+    tmp_path = path + '.tmp'
+    keys = []
+    index = []
+    n_rows = 0
+    previous = None
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(_header.pack(MAGIC, VERSION))
+            offset = _header.size
+
+            block = []
+            block_bytes = 0
+            for key, data in rows:
+                key = ensure_bytes(key)
+                if previous is not None and key <= previous:
+                    raise ValueError("rows must be in ascending row key "
+                                     "order (%r after %r)" % (key, previous))
+                previous = key
+                n_rows += 1
+                if bloom_filter:
+                    keys.append(key)
+
+                if not block:
+                    index.append((key, offset))
+                record = _encode_row(key, data)
+                block.append(record)
+                block_bytes += len(record)
+
+                if block_bytes >= block_size:
+                    f.write(b''.join(block))
+                    offset += block_bytes
+                    block = []
+                    block_bytes = 0
+
+            if block:
+                f.write(b''.join(block))
+                offset += block_bytes
+
+            # Block index; the length of each block follows from the offset
+            # of the next block (or of the index, for the last block).
+            index_offset = offset
+            for i, (first_key, block_offset) in enumerate(index):
+                end = index[i + 1][1] if i + 1 < len(index) else index_offset
+                entry = (_u32.pack(len(first_key)) + first_key +
+                         _block_entry.pack(block_offset, end - block_offset))
+                f.write(entry)
+                offset += len(entry)
+
+            bloom_offset = offset
+            n_bits = n_hashes = 0
+            if keys:
+                n_bits = int(math.ceil(
+                    -len(keys) * math.log(false_positive_rate)
+                    / math.log(2) ** 2))
+                n_bits += -n_bits % 8
+                n_hashes = max(1, int(round(float(n_bits) / len(keys)
+                                            * math.log(2))))
+                bits = bytearray(n_bits // 8)
+                for key in keys:
+                    for position in _bloom_positions(key, n_bits, n_hashes):
+                        bits[position >> 3] |= 1 << (position & 7)
+                f.write(bytes(bits))
+
+            f.write(_footer.pack(index_offset, len(index), bloom_offset,
+                                 n_bits, n_hashes, n_rows, MAGIC))
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    os.rename(tmp_path, path)
+    return n_rows
+
+
+class Snapshot(object):
+    """Read-only, memory-mapped snapshot file.
+
+    The `row`, `rows` and `scan` methods behave like those of
+    :py:class:`Table` (with fewer options). Snapshot objects are
+    thread-safe, and should be closed when no longer needed, e.g. by
+    using them as a context manager.
+
+    :param str path: the path of the snapshot file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        buf = self._mmap
+        if len(buf) < _header.size + _footer.size:
+            raise ValueError("%r is not a snapshot file" % path)
+        magic, version = _header.unpack_from(buf, 0)
+        (index_offset, n_blocks, bloom_offset, self._bloom_bits,
+         self._bloom_hashes, self._n_rows, footer_magic) = \
+            _footer.unpack_from(buf, len(buf) - _footer.size)
+        if magic != MAGIC or footer_magic != MAGIC:
+            raise ValueError("%r is not a snapshot file" % path)
+        if version != VERSION:
+            raise ValueError("Unsupported snapshot version %d" % version)
+
+        self._first_keys = []
+        self._blocks = []
+        pos = index_offset
+        for _ in range(n_blocks):
+            (length,) = _u32.unpack_from(buf, pos)
+            pos += _u32.size
+            self._first_keys.append(buf[pos:pos + length])
+            pos += length
+            self._blocks.append(_block_entry.unpack_from(buf, pos))
+            pos += _block_entry.size
+        self._bloom_offset = bloom_offset
+
+    def __repr__(self):
+        return '<%s.%s path=%r rows=%d>' % (
+            __name__,
+            self.__class__.__name__,
+            self.path,
+            self._n_rows,
+        )
+
+    def __len__(self):
+        return self._n_rows
+
+    def close(self):
+        """Close the snapshot file."""
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    #
+    # Internals
+    #
+
+    def _might_contain(self, key):
+        """Return whether `key` may be in the snapshot (Bloom filter)."""
+        if not self._bloom_bits:
+            return True
+        buf = self._mmap
+        for position in _bloom_positions(key, self._bloom_bits,
+                                         self._bloom_hashes):
+            byte = six.indexbytes(buf[self._bloom_offset + (position >> 3):
+                                      self._bloom_offset + (position >> 3)
+                                      + 1], 0)
+            if not byte & (1 << (position & 7)):
+                return False
+        return True
+
+    def _rows_from(self, block, key=None):
+        """Yield `(row_key, offset)` pairs from `block` onwards, skipping
+        rows before `key`. `offset` points at the cells of the row."""
+        buf = self._mmap
+        unpack = _u32.unpack_from
+        for offset, length in self._blocks[block:]:
+            pos = offset
+            end = offset + length
+            while pos < end:
+                (key_length,) = unpack(buf, pos)
+                pos += 4
+                row_key = buf[pos:pos + key_length]
+                pos += key_length
+                cells_offset = pos
+                (n_cells,) = unpack(buf, pos)
+                pos += 4
+                for _ in range(n_cells):
+                    (length,) = unpack(buf, pos)
+                    pos += 4 + length
+                    (length,) = unpack(buf, pos)
+                    pos += 4 + length
+                if key is None or row_key >= key:
+                    yield row_key, cells_offset
+
+    def _decode_cells(self, pos, families, columns):
+        buf = self._mmap
+        unpack = _u32.unpack_from
+        (n_cells,) = unpack(buf, pos)
+        pos += 4
+        data = {}
+        for _ in range(n_cells):
+            (length,) = unpack(buf, pos)
+            column = buf[pos + 4:pos + 4 + length]
+            pos += 4 + length
+            (length,) = unpack(buf, pos)
+            if (columns is None or column in columns
+                    or column.partition(b':')[0] in families):
+                data[column] = buf[pos + 4:pos + 4 + length]
+            pos += 4 + length
+        return data
+
+    @staticmethod
+    def _column_filter(columns):
+        if columns is None:
+            return None, None
+        if not isinstance(columns, (tuple, list)):
+            raise TypeError("'columns' must be a tuple or list")
+        columns = [ensure_bytes(column) for column in columns]
+        return (set(column for column in columns if b':' not in column),
+                set(column for column in columns if b':' in column))
+
+    def _block_for(self, key):
+        return max(0, bisect.bisect_right(self._first_keys, key) - 1)
+
+    #
+    # Public API
+    #
+
+    def row(self, row, columns=None):
+        """Retrieve a single row of data; see :py:meth:`Table.row`.
+
+        :param str row: the row key
+        :param list_or_tuple columns: list of columns (optional)
+
+        :return: Mapping of columns (both qualifier and family) to values
+        :rtype: dict
+        """
+        families, columns = self._column_filter(columns)
+        row = ensure_bytes(row)
+        if not self._blocks or not self._might_contain(row):
+            return {}
+        for key, pos in self._rows_from(self._block_for(row), row):
+            if key == row:
+                return self._decode_cells(pos, families, columns)
+            return {}
+        return {}
+
+    def rows(self, rows, columns=None):
+        """Retrieve multiple rows of data; see :py:meth:`Table.rows`.
+
+        :param list rows: list of row keys
+        :param list_or_tuple columns: list of columns (optional)
+
+        :return: List of rows
+        :rtype: list of `(row_key, row_dict)` tuples
+        """
+        result = []
+        for row in rows:
+            data = self.row(row, columns)
+            if data:
+                result.append((ensure_bytes(row), data))
+        return result
+
+    def scan(self, row_start=None, row_stop=None, row_prefix=None,
+             columns=None, limit=None):
+        """Scan the snapshot; see :py:meth:`Table.scan`.
+
+        :param str row_start: the row key to start at (inclusive)
+        :param str row_stop: the row key to stop at (exclusive)
+        :param str row_prefix: a prefix of the row key that must match
+        :param list_or_tuple columns: list of columns (optional)
+        :param int limit: max number of rows to return
+
+        :return: generator yielding the rows matching the scan
+        :rtype: iterable of `(row_key, row_data)` tuples
+        """
+        if limit is not None and limit < 1:
+            raise ValueError("'limit' must be >= 1")
+
+        if row_prefix is not None:
+            if row_start is not None or row_stop is not None:
+                raise TypeError(
+                    "'row_prefix' cannot be combined with 'row_start' "
+                    "or 'row_stop'")
+            row_start = ensure_bytes(row_prefix)
+            row_stop = bytes_increment(row_start)
+
+        families, columns = self._column_filter(columns)
+        if row_start is not None:
+            row_start = ensure_bytes(row_start)
+        if row_stop is not None:
+            row_stop = ensure_bytes(row_stop)
+
+        if not self._blocks:
+            return
+
+        block = 0 if row_start is None else self._block_for(row_start)
+        n_returned = 0
+        for key, pos in self._rows_from(block, row_start):
+            if row_stop is not None and key >= row_stop:
+                return
+            data = self._decode_cells(pos, families, columns)
+            if not data:
+                continue
+            yield key, data
+            n_returned += 1
+            if limit is not None and n_returned == limit:
+                return
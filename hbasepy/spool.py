@@ -0,0 +1,633 @@
+"""
+hbasepy spool module.
+
+A :py:class:`Spool` is a local write-ahead log for batch mutations. Instead of
+sending mutations to HBase directly, a :py:class:`Batch` created with
+a `spool` appends them to the spool, which returns as soon as they are
+stored in a local memory-mapped log file. A background thread replays the
+logged mutations into HBase, in order, and records its progress in
+a checkpoint file, so that mutations that were not yet replayed survive
+a restart of the process.
+"""
+
+import glob
+import logging
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+import zlib
+
+import six
+
+from thrift.Thrift import TApplicationException, TException
+
+from .tool import LazyModule, ensure_bytes
+
+logger = logging.getLogger(__name__)
+
+ttypes = LazyModule('hbase_thrift.ttypes')
+
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+SEGMENT_PATTERN = 'segment-%016d.spool'
+CHECKPOINT_NAME = 'checkpoint'
+DEAD_LETTER_NAME = 'dead-letters'
+
+# Each record starts with the length of its payload and the CRC32 checksum
+# of the payload. A zero length marks the end of the data in a segment.
+record_header = struct.Struct('>II')
+checkpoint_format = struct.Struct('>QQ')
+
+_u8 = struct.Struct('>B')
+_u32 = struct.Struct('>I')
+_i64 = struct.Struct('>q')
+
+
+class SpoolFull(RuntimeError):
+    """
+    Exception raised when the spool has no room for new mutations.
+
+    This happens if a timeout was specified when appending to the spool,
+    and the background thread did not replay enough mutations to free up
+    space within the specified timeout.
+    """
+    pass
+
+
+def _pack_bytes(value):
+    value = ensure_bytes(value)
+    return _u32.pack(len(value)) + value
+
+
+def encode_record(sections, timestamp):
+    """Encode the mutations for one or more tables as a spool record.
+
+    `sections` is a list of `(table_name, mutations)` tuples, where
+    `mutations` maps row keys to lists of `Mutation` instances.
+    """
+    parts = [_u32.pack(len(sections))]
+    if timestamp is None:
+        parts.append(_u8.pack(0))
+    else:
+        parts.append(_u8.pack(1) + _i64.pack(timestamp))
+
+    for table_name, mutations in sections:
+        parts.append(_pack_bytes(table_name))
+        parts.append(_u32.pack(len(mutations)))
+        for row, row_mutations in six.iteritems(mutations):
+            parts.append(_pack_bytes(row))
+            parts.append(_u32.pack(len(row_mutations)))
+            for m in row_mutations:
+                if m.isDelete:
+                    parts.append(_u8.pack(1) + _pack_bytes(m.column))
+                else:
+                    parts.append(_u8.pack(0) + _pack_bytes(m.column) +
+                                 _pack_bytes(m.value))
+    return b''.join(parts)
+
+
+def decode_record(payload):
+    """Decode a spool record.
+
+    :return: `(sections, timestamp)`, where `sections` is a list of
+             `(table_name, rows)` tuples, and `rows` is a list of
+             `(row, [(is_delete, column, value)])` tuples.
+    """
+    pos = [0]
+
+    def read(fmt):
+        (value,) = fmt.unpack_from(payload, pos[0])
+        pos[0] += fmt.size
+        return value
+
+    def read_bytes():
+        length = read(_u32)
+        value = payload[pos[0]:pos[0] + length]
+        pos[0] += length
+        return value
+
+    n_sections = read(_u32)
+    timestamp = read(_i64) if read(_u8) else None
+
+    sections = []
+    for _ in range(n_sections):
+        table_name = read_bytes()
+        if not isinstance(table_name, str):
+            table_name = table_name.decode('utf-8')
+        rows = []
+        for _ in range(read(_u32)):
+            row = read_bytes()
+            mutations = []
+            for _ in range(read(_u32)):
+                is_delete = bool(read(_u8))
+                column = read_bytes()
+                value = None if is_delete else read_bytes()
+                mutations.append((is_delete, column, value))
+            rows.append((row, mutations))
+        sections.append((table_name, rows))
+    return sections, timestamp
+
+
+class _Segment(object):
+    """A memory-mapped, preallocated segment file."""
+
+    def __init__(self, path, number, size):
+        self.path = path
+        self.number = number
+        mode = 'r+b' if os.path.exists(path) else 'w+b'
+        with open(path, mode) as f:
+            if os.fstat(f.fileno()).st_size < size:
+                f.truncate(size)
+            self.map = mmap.mmap(f.fileno(), size)
+        self.size = size
+
+    def close(self):
+        self.map.close()
+
+    def read(self, offset):
+        """Read the record at `offset`.
+
+        :return: `(payload, next_offset)`, or `None` if there is no valid
+                 record at `offset`.
+        """
+        if offset + record_header.size > self.size:
+            return None
+        length, checksum = record_header.unpack_from(self.map, offset)
+        end = offset + record_header.size + length
+        if length == 0 or end > self.size:
+            return None
+        payload = self.map[offset + record_header.size:end]
+        if zlib.crc32(payload) & 0xffffffff != checksum:
+            return None
+        return payload, end
+
+
+def permanent_error(exc):
+    """Return whether replaying mutations can never succeed after `exc`.
+
+    Transport errors, and the `IOError` the server returns for busy or
+    moving regions, are transient; invalid arguments, unknown methods and
+    missing tables are not.
+    """
+    if isinstance(exc, ttypes.IllegalArgument):
+        return True
+    if isinstance(exc, ttypes.IOError):
+        return 'TableNotFoundException' in (exc.message or '')
+    if isinstance(exc, TApplicationException):
+        return exc.type != TApplicationException.INTERNAL_ERROR
+    return False
+
+
+class Spool(object):
+    """Durable local write-ahead spool for batch mutations.
+
+    Mutations are appended to segment files of `segment_size` bytes in
+    `directory`, and replayed in order by a background thread using
+    connections from `pool`. If replaying fails, e.g. because the Thrift
+    server is unavailable or a region is busy or moving, the thread keeps
+    retrying the same mutations, waiting up to `max_retry_interval` seconds
+    between attempts. Mutations that can never be applied, e.g. because the
+    table does not exist (see :py:func:`permanent_error`), are moved to
+    a dead letter file in `directory` instead, so that they do not block
+    the spool; see :py:meth:`dead_letters`. Mutations that still fail
+    after `max_retries` retries, or `max_retry_age` seconds after their
+    first failure, are moved there as well; by default, they are retried
+    forever.
+
+    At most `max_bytes` of unreplayed mutations are kept; when this limit
+    is reached, :py:meth:`append` blocks until enough mutations have been
+    replayed (or raises :py:exc:`SpoolFull` after its `timeout`).
+
+    If `sync` is `True`, each append is flushed to disk before it is
+    acknowledged, so that it survives an operating system crash as well as
+    a process crash. This is much slower.
+
+    When a spool is opened on a directory containing segments from an
+    earlier run, the mutations after the last checkpoint are replayed.
+
+    :param str directory: directory for the segment and checkpoint files
+    :param pool: connection pool used to replay mutations
+    :type pool: :py:class:`ConnectionPool`
+    :param int segment_size: size of each segment file in bytes
+    :param int max_bytes: max number of bytes of unreplayed mutations
+    :param bool sync: whether to flush each append to disk
+    :param float max_retry_interval: max seconds between replay attempts
+    :param int max_retries: max number of retries (optional)
+    :param float max_retry_age: max seconds of retrying (optional)
+    """
+
+    def __init__(self, directory, pool, segment_size=DEFAULT_SEGMENT_SIZE,
+                 max_bytes=DEFAULT_MAX_BYTES, sync=False,
+                 max_retry_interval=30.0, max_retries=None,
+                 max_retry_age=None):
+        if segment_size <= record_header.size:
+            raise ValueError("'segment_size' is too small")
+
+        if max_bytes < segment_size:
+            raise ValueError("'max_bytes' must be >= 'segment_size'")
+
+        if max_retries is not None and max_retries < 0:
+            raise ValueError("'max_retries' must be >= 0")
+
+        if max_retry_age is not None and max_retry_age <= 0:
+            raise ValueError("'max_retry_age' must be > 0")
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.directory = directory
+        self._pool = pool
+        self._segment_size = segment_size
+        self._max_bytes = max_bytes
+        self._sync = sync
+        self._max_retry_interval = max_retry_interval
+        self._max_retries = max_retries
+        self._max_retry_age = max_retry_age
+
+        self._cond = threading.Condition()
+        self._segments = {}
+        self._closed = False
+
+        #: Number of records appended and replayed by this instance
+        self.appended = self.replayed = 0
+        #: Number of records that could not be replayed and were moved to
+        #: the dead letter file by this instance
+        self.rejected = 0
+
+        self._recover()
+
+        self._thread = threading.Thread(target=self._drain)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __repr__(self):
+        return '<%s.%s directory=%r pending_bytes=%d>' % (
+            __name__,
+            self.__class__.__name__,
+            self.directory,
+            self.pending_bytes,
+        )
+
+    #
+    # Segment and checkpoint handling
+    #
+
+    def _segment(self, number):
+        segment = self._segments.get(number)
+        if segment is None:
+            path = os.path.join(self.directory, SEGMENT_PATTERN % number)
+            segment = self._segments[number] = _Segment(
+                path, number, self._segment_size)
+        return segment
+
+    def _remove_segment(self, number):
+        segment = self._segments.pop(number)
+        segment.close()
+        os.remove(segment.path)
+
+    def _read_checkpoint(self):
+        path = os.path.join(self.directory, CHECKPOINT_NAME)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            return None
+        if len(data) != checkpoint_format.size + _u32.size:
+            return None
+        data, (checksum,) = data[:-_u32.size], _u32.unpack(data[-_u32.size:])
+        if zlib.crc32(data) & 0xffffffff != checksum:
+            return None
+        return checkpoint_format.unpack(data)
+
+    def _write_checkpoint(self, number, offset):
+        path = os.path.join(self.directory, CHECKPOINT_NAME)
+        data = checkpoint_format.pack(number, offset)
+        data += _u32.pack(zlib.crc32(data) & 0xffffffff)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            if self._sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.rename(tmp_path, path)
+
+    def _recover(self):
+        """Find the read and write positions after a (re)start."""
+        numbers = sorted(
+            int(os.path.basename(path)[len('segment-'):-len('.spool')])
+            for path in glob.glob(os.path.join(self.directory,
+                                               'segment-*.spool')))
+
+        checkpoint = self._read_checkpoint()
+        if checkpoint is None or (numbers and checkpoint[0] not in numbers):
+            # No checkpoint yet, or the checkpointed segment was completely
+            # replayed and removed.
+            checkpoint = (numbers[0], 0) if numbers else (0, 0)
+
+        # Segments before the checkpoint have been replayed already
+        for number in numbers:
+            if number < checkpoint[0]:
+                os.remove(os.path.join(self.directory,
+                                       SEGMENT_PATTERN % number))
+        numbers = [n for n in numbers if n >= checkpoint[0]] or [checkpoint[0]]
+
+        self._read_pos = checkpoint
+        self._pending = 0
+        write_number, write_offset = checkpoint
+        for number in numbers:
+            segment = self._segment(number)
+            offset = checkpoint[1] if number == checkpoint[0] else 0
+            while True:
+                record = segment.read(offset)
+                if record is None:
+                    break
+                self._pending += record[1] - offset
+                offset = record[1]
+            write_number, write_offset = number, offset
+
+        # Clear any partially written record after the last valid one
+        segment = self._segment(write_number)
+        segment.map[write_offset:] = b'\0' * (self._segment_size - write_offset)
+        self._write_pos = (write_number, write_offset)
+
+        if self._pending:
+            logger.info("Recovered %d bytes of unreplayed mutations from "
+                        "spool in %r", self._pending, self.directory)
+
+    #
+    # Appending
+    #
+
+    @property
+    def pending_bytes(self):
+        """Number of bytes of mutations that have not been replayed yet."""
+        with self._cond:
+            return self._pending
+
+    def append(self, sections, timestamp=None, timeout=None):
+        """Append mutations to the spool.
+
+        This is used by :py:meth:`Batch.send` for batches created with
+        a `spool`. `sections` is a list of `(table_name, mutations)` tuples,
+        where `mutations` maps row keys to lists of `Mutation` instances.
+        All sections are stored in a single record, and replayed in order.
+
+        If the spool is full, this method waits for up to `timeout` seconds
+        (or forever if omitted) before :py:exc:`SpoolFull` is raised.
+
+        :param list sections: mutations to append
+        :param int timestamp: timestamp (optional)
+        :param float timeout: number of seconds to wait (optional)
+        """
+        payload = encode_record(sections, timestamp)
+        size = record_header.size + len(payload)
+        if size + record_header.size > self._segment_size:
+            raise ValueError(
+                "Batch of %d bytes does not fit in a spool segment" % size)
+
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._pending + size > self._max_bytes:
+                if self._closed:
+                    raise ValueError("Spool is closed")
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise SpoolFull(
+                            "No room in spool within specified timeout")
+                self._cond.wait(remaining)
+
+            if self._closed:
+                raise ValueError("Spool is closed")
+
+            number, offset = self._write_pos
+            if offset + size + record_header.size > self._segment_size:
+                # Leave the zeroed remainder as end marker, and continue in
+                # a new segment.
+                number, offset = number + 1, 0
+            segment = self._segment(number)
+
+            # Write the header last, so that a partially written record is
+            # never considered valid.
+            end = offset + size
+            segment.map[offset + record_header.size:end] = payload
+            segment.map[offset:offset + record_header.size] = \
+                record_header.pack(len(payload),
+                                   zlib.crc32(payload) & 0xffffffff)
+            if self._sync:
+                segment.map.flush()
+
+            self._write_pos = (number, end)
+            self._pending += size
+            self.appended += 1
+            self._cond.notify_all()
+
+    #
+    # Replaying
+    #
+
+    def _next_record(self):
+        """Wait for the next record to replay (called with lock held)."""
+        while True:
+            if self._closed:
+                return None
+            if self._read_pos == self._write_pos:
+                self._cond.wait()
+                continue
+
+            number, offset = self._read_pos
+            record = self._segment(number).read(offset)
+            if record is not None:
+                return number, offset, record[0], record[1]
+
+            # End of this segment; continue with the next one
+            self._remove_segment(number)
+            self._read_pos = (number + 1, 0)
+
+    def _replay(self, payload):
+        from hbase_thrift.ttypes import BatchMutation, Mutation
+
+        sections, timestamp = decode_record(payload)
+        with self._pool.connection() as connection:
+            for table_name, rows in sections:
+                bms = [
+                    BatchMutation(row, [
+                        Mutation(isDelete=is_delete, column=column,
+                                 value=value)
+                        for is_delete, column, value in mutations])
+                    for row, mutations in rows
+                ]
+                if timestamp is None:
+                    connection.client.mutateRows(table_name, bms, {})
+                else:
+                    connection.client.mutateRowsTs(
+                        table_name, bms, timestamp, {})
+
+    def _write_dead_letter(self, payload):
+        path = os.path.join(self.directory, DEAD_LETTER_NAME)
+        with open(path, 'ab') as f:
+            f.write(record_header.pack(len(payload),
+                                       zlib.crc32(payload) & 0xffffffff))
+            f.write(payload)
+            if self._sync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _retry_wait(self, retry_interval):
+        """Wait before retrying; return `False` if the spool was closed."""
+        with self._cond:
+            if self._closed:
+                return False
+            self._cond.wait(retry_interval)
+        return True
+
+    def _retries_exhausted(self, failures, first_failure):
+        if self._max_retries is not None and failures > self._max_retries:
+            return True
+        return (self._max_retry_age is not None and
+                time.time() - first_failure >= self._max_retry_age)
+
+    def _drain(self):
+        retry_interval = 0.1
+        failures = 0
+        first_failure = None
+        while True:
+            with self._cond:
+                record = self._next_record()
+            if record is None:
+                return
+
+            number, offset, payload, end = record
+            rejected = False
+            try:
+                self._replay(payload)
+            except Exception as exc:
+                failures += 1
+                if first_failure is None:
+                    first_failure = time.time()
+
+                # Retrying a record that can never be applied would block
+                # the spool forever, so it is set aside.
+                if permanent_error(exc):
+                    logger.error("Server rejected spooled mutations, "
+                                 "moving them to %r: %s",
+                                 DEAD_LETTER_NAME, exc)
+                elif self._retries_exhausted(failures, first_failure):
+                    logger.error("Replaying spooled mutations failed %d "
+                                 "times, moving them to %r: %s",
+                                 failures, DEAD_LETTER_NAME, exc)
+                else:
+                    if not isinstance(exc, (TException, socket.error)):
+                        logger.exception("Unexpected error replaying spool")
+                    logger.warning("Replaying spool failed, retrying in "
+                                   "%.1fs: %s", retry_interval, exc)
+                    if not self._retry_wait(retry_interval):
+                        return
+                    retry_interval = min(retry_interval * 2,
+                                         self._max_retry_interval)
+                    continue
+
+                try:
+                    self._write_dead_letter(payload)
+                except (IOError, OSError):
+                    logger.exception("Writing spool dead letter failed, "
+                                     "retrying in %.1fs", retry_interval)
+                    if not self._retry_wait(retry_interval):
+                        return
+                    retry_interval = min(retry_interval * 2,
+                                         self._max_retry_interval)
+                    continue
+                rejected = True
+
+            retry_interval = 0.1
+            failures = 0
+            first_failure = None
+            with self._cond:
+                self._read_pos = (number, end)
+                self._pending -= end - offset
+                if rejected:
+                    self.rejected += 1
+                else:
+                    self.replayed += 1
+                self._write_checkpoint(number, end)
+                self._cond.notify_all()
+
+    def dead_letters(self):
+        """Return the records that could not be replayed.
+
+        Rejected records are kept in the dead letter file until it is
+        removed, also across restarts.
+
+        :return: list of `(sections, timestamp)` tuples, as returned by
+                 :py:func:`decode_record`
+        :rtype: list
+        """
+        path = os.path.join(self.directory, DEAD_LETTER_NAME)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            return []
+
+        records = []
+        offset = 0
+        while offset + record_header.size <= len(data):
+            length, checksum = record_header.unpack_from(data, offset)
+            end = offset + record_header.size + length
+            payload = data[offset + record_header.size:end]
+            if (len(payload) != length or
+                    zlib.crc32(payload) & 0xffffffff != checksum):
+                # Partially written by a crash
+                break
+            records.append(decode_record(payload))
+            offset = end
+        return records
+
+    def flush(self, timeout=None):
+        """Wait until all appended mutations have been replayed.
+
+        :param float timeout: number of seconds to wait (optional)
+        :return: whether all mutations have been replayed
+        :rtype: bool
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._pending:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=None):
+        """Close the spool.
+
+        This waits for up to `timeout` seconds (or forever if omitted) for
+        the pending mutations to be replayed, and then stops the background
+        thread. Mutations that have not been replayed by then remain in the
+        spool directory, and are replayed when the spool is opened again.
+
+        :param float timeout: number of seconds to wait (optional)
+        """
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        with self._cond:
+            for segment in self._segments.values():
+                segment.close()
+            self._segments.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
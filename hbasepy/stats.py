@@ -0,0 +1,147 @@
+"""
+hbasepy execution statistics module.
+"""
+
+
+class ScanStats(object):
+    """Execution statistics of a scan.
+
+    Pass an instance as the `stats` argument of :py:meth:`Table.scan` to
+    have it filled in while the scan runs; the numbers are final once the
+    scanner is exhausted or closed. Reusing an instance for multiple scans
+    adds up the counters and times.
+
+    The time spent in Thrift calls (`server_time`) includes the time spent
+    in the Thrift layer receiving and deserializing the replies, while
+    `decode_time` is the time spent turning the Thrift results into row
+    dictionaries. Byte counts are estimates based on the sizes of the row
+    keys, column names and values.
+    """
+
+    def __init__(self):
+        #: Number of scanners opened
+        self.scans = 0
+        #: Number of Thrift calls (open, fetch and close)
+        self.round_trips = 0
+        #: Number of rows and cells fetched from the server
+        self.rows = self.cells = 0
+        #: Estimated number of bytes fetched
+        self.bytes = 0
+        #: Seconds spent in Thrift calls, and decoding the results
+        self.server_time = self.decode_time = 0.0
+        #: Seconds from opening the (first) scanner to its first row
+        self.time_to_first_row = None
+        #: Total duration of the scan(s) in seconds
+        self.elapsed = 0.0
+
+    def __repr__(self):
+        return ('<%s.%s round_trips=%d rows=%d cells=%d bytes=%d '
+                'server_time=%.3f decode_time=%.3f>' % (
+                    __name__,
+                    self.__class__.__name__,
+                    self.round_trips,
+                    self.rows,
+                    self.cells,
+                    self.bytes,
+                    self.server_time,
+                    self.decode_time,
+                ))
+
+
+class BatchStats(object):
+    """Execution statistics of a batch.
+
+    Pass an instance as the `stats` argument of :py:meth:`Table.batch` to
+    have it updated after each send. Byte counts are estimates based on the
+    sizes of the row keys, column names and values.
+    """
+
+    def __init__(self):
+        #: Number of sends, and of mutations and rows sent
+        self.sends = self.mutations = self.rows = 0
+        #: Estimated number of bytes sent
+        self.bytes = 0
+        #: Total and maximum send latency in seconds
+        self.send_time = self.max_send_time = 0.0
+        #: Number of mutations saved by coalescing
+        self.coalesced = 0
+
+    def __repr__(self):
+        return ('<%s.%s sends=%d mutations=%d rows=%d bytes=%d '
+                'send_time=%.3f>' % (
+                    __name__,
+                    self.__class__.__name__,
+                    self.sends,
+                    self.mutations,
+                    self.rows,
+                    self.bytes,
+                    self.send_time,
+                ))
+
+    def record(self, n_mutations, n_rows, n_bytes, latency):
+        """Record a single send."""
+        self.sends += 1
+        self.mutations += n_mutations
+        self.rows += n_rows
+        self.bytes += n_bytes
+        self.send_time += latency
+        self.max_send_time = max(self.max_send_time, latency)
+
+
+class LaneStats(object):
+    """Connection pool statistics of a lane.
+
+    See :py:meth:`ConnectionPool.lane_stats`. Acquisitions that find
+    a connection available right away count as acquired without waiting.
+    """
+
+    def __init__(self):
+        #: Number of connections acquired, and of those that had to wait
+        self.acquired = self.waits = 0
+        #: Number of acquisitions that timed out
+        self.timeouts = 0
+        #: Total and maximum time spent waiting in seconds
+        self.wait_time = self.max_wait_time = 0.0
+
+    def __repr__(self):
+        return ('<%s.%s acquired=%d waits=%d timeouts=%d '
+                'wait_time=%.3f>' % (
+                    __name__,
+                    self.__class__.__name__,
+                    self.acquired,
+                    self.waits,
+                    self.timeouts,
+                    self.wait_time,
+                ))
+
+    @property
+    def mean_wait_time(self):
+        """Average wait per acquisition (including timed out ones)."""
+        n = self.acquired + self.timeouts
+        return self.wait_time / n if n else 0.0
+
+    def record(self, wait, acquired=True):
+        """Record a single acquisition that waited `wait` seconds."""
+        if acquired:
+            self.acquired += 1
+        else:
+            self.timeouts += 1
+        if wait > 0:
+            self.waits += 1
+            self.wait_time += wait
+            self.max_wait_time = max(self.max_wait_time, wait)
+
+
+def resolve(stats, factory):
+    """Return a `(stats, callback)` tuple for a `stats` argument.
+
+    `stats` may be `None`, a stats instance, or a callable that receives
+    a new stats instance created with `factory`.
+    """
+    if stats is None or isinstance(stats, factory):
+        return stats, None
+    if not callable(stats):
+        raise TypeError("'stats' must be a %s instance or a callable"
+                        % factory.__name__)
+    return factory(), stats
+
@@ -1,13 +1,30 @@
 """
 hbasepy table module.
 """
+from collections import deque
+import itertools
 import logging
 from numbers import Integral
+import random
 from struct import Struct
+import time
 from six import iteritems
-from .tool import thrift_type_to_dict, bytes_increment, OrderedDict
+from .tool import (
+    thrift_type_to_dict, bytes_increment, ensure_bytes, OrderedDict,
+    normalize_key_ranges, fan_out, LazyModule)
 from .batch import Batch
-from hbase_thrift.ttypes import TScan
+from . import blob
+from .deadline import (
+    DeadlineExceeded, resolve as resolve_deadline, scope as deadline_scope)
+from . import mapreduce
+from . import paging
+from .throttle import ScanTuner
+from .stats import ScanStats, resolve as resolve_stats
+from .filters import (
+    compile_filter, row_range_filter, FilterString, Or, And,
+    FirstKeyOnlyFilter, KeyOnlyFilter)
+
+ttypes = LazyModule('hbase_thrift.ttypes')
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +39,18 @@ def make_row(cell_map, include_timestamp):
     }
 
 
+def row_size(row_result):
+    """Estimate the size in bytes of a ttypes.TRowResult."""
+    # Each cell also has a timestamp, and some framing overhead.
+    if row_result.sortedColumns is not None:
+        return len(row_result.row) + sum(
+            len(column.columnName) + len(column.cell.value) + 16
+            for column in row_result.sortedColumns)
+    return len(row_result.row) + sum(
+        len(name) + len(cell.value) + 16
+        for name, cell in iteritems(row_result.columns))
+
+
 def make_ordered_row(sorted_columns, include_timestamp):
     """Make a row dict for sorted column results from scans."""
     od = OrderedDict()
@@ -41,9 +70,10 @@ class Table(object):
     instead.
     """
 
-    def __init__(self, name, connection):
+    def __init__(self, name, connection, indexes=None):
         self.name = name
         self.connection = connection
+        self.indexes = dict((index.name, index) for index in indexes or ())
 
     def __repr__(self):
         return '<%s.%s name=%r>' % (
@@ -58,7 +88,7 @@ class Table(object):
         :return: Mapping from column family name to settings dict
         :rtype: dict
         """
-        descriptors = self.connection.client.getColumnDescriptors(self.name)
+        descriptors = self.connection._column_descriptors(self.name)
         families = dict()
         for name, descriptor in descriptors.items():
             name = name.rstrip(b':')
@@ -67,15 +97,45 @@ class Table(object):
 
     def _column_family_names(self):
         """Retrieve the column family names for this table (internal use)"""
-        names = self.connection.client.getColumnDescriptors(self.name).keys()
+        names = self.connection._column_descriptors(self.name).keys()
         return [name.rstrip(b':') for name in names]
 
-    def row(self, row, columns=None, timestamp=None, include_timestamp=False):
+    def _check_time_range(self, timestamp, time_range):
+        """Validate a `time_range` argument (internal use)."""
+        if time_range is None:
+            return
+        if self.connection.api != 'thrift2':
+            raise NotImplementedError(
+                "'time_range' is only supported by the thrift2 API")
+        if timestamp is not None:
+            raise TypeError(
+                "'time_range' cannot be combined with 'timestamp'")
+        if not (isinstance(time_range, tuple) and len(time_range) == 2
+                and all(isinstance(t, Integral) for t in time_range)):
+            raise TypeError(
+                "'time_range' must be a (min_timestamp, max_timestamp) tuple")
+
+    def row(self, row, columns=None, timestamp=None, include_timestamp=False,
+            time_range=None, deadline=None):
         """Retrieve a single row of data.
+
+        If `time_range` is given, only cells with a timestamp in this
+        `(min_timestamp, max_timestamp)` range are returned; the minimum is
+        inclusive and the maximum exclusive. This requires the thrift2 API
+        (see :py:class:`Connection`).
+
+        If `deadline` is given, either as a number of seconds or as
+        a :py:class:`hbasepy.deadline.Deadline` instance, the call (including
+        waiting for a pool connection) is limited to that time, and
+        :py:exc:`hbasepy.deadline.DeadlineExceeded` is raised if it takes
+        longer.
+
         :param str row: the row key
         :param list_or_tuple columns: list of columns (optional)
         :param int timestamp: timestamp (optional)
         :param bool include_timestamp: whether timestamps are returned
+        :param tuple time_range: range of timestamps (optional)
+        :param deadline: time limit (optional)
 
         :return: Mapping of columns (both qualifier and family) to values
         :rtype: dict
@@ -83,22 +143,95 @@ class Table(object):
         if columns is not None and not isinstance(columns, (tuple, list)):
             raise TypeError("'columns' must be a tuple or list")
 
-        if timestamp is None:
-            rows = self.connection.client.getRowWithColumns(
-                self.name, row, columns, {})
+        self._check_time_range(timestamp, time_range)
+        deadline = resolve_deadline(deadline)
+
+        if time_range is not None:
+            rows = self._fetch_rows(
+                'getRowWithColumns', (self.name, row, columns, {}, time_range),
+                include_timestamp, deadline)
+        elif timestamp is None:
+            rows = self._fetch_rows(
+                'getRowWithColumns', (self.name, row, columns, {}),
+                include_timestamp, deadline)
         else:
             if not isinstance(timestamp, Integral):
                 raise TypeError("'timestamp' must be an integer")
-            rows = self.connection.client.getRowWithColumnsTs(
-                self.name, row, columns, timestamp, {})
+            rows = self._fetch_rows(
+                'getRowWithColumnsTs',
+                (self.name, row, columns, timestamp, {}), include_timestamp,
+                deadline)
 
         if not rows:
             return {}
 
-        return make_row(rows[0].columns, include_timestamp)
+        return rows[0][1]
+
+    def rows(self, rows, columns=None, timestamp=None,
+             include_timestamp=False, time_range=None, deadline=None):
+        """Retrieve multiple rows of data.
+
+        This method retrieves the rows with the row keys specified in the
+        `rows` argument, which should be a list (or tuple) of row
+        keys. The return value is a list of `(row_key, row_dict)` tuples.
+
+        The `columns`, `timestamp`, `include_timestamp`, `time_range` and
+        `deadline` arguments behave exactly the same as for :py:meth:`row`.
+
+        :param list rows: list of row keys
+        :param list_or_tuple columns: list of columns (optional)
+        :param int timestamp: timestamp (optional)
+        :param bool include_timestamp: whether timestamps are returned
+        :param tuple time_range: range of timestamps (optional)
+        :param deadline: time limit (optional)
+
+        :return: List of rows
+        :rtype: list of `(row_key, row_dict)` tuples
+        """
+        if columns is not None and not isinstance(columns, (tuple, list)):
+            raise TypeError("'columns' must be a tuple or list")
+
+        if not rows:
+            # Avoid round-trip if the result is empty anyway
+            return []
+
+        self._check_time_range(timestamp, time_range)
+        deadline = resolve_deadline(deadline)
+
+        if time_range is not None:
+            return self._fetch_rows(
+                'getRowsWithColumns',
+                (self.name, rows, columns, {}, time_range), include_timestamp,
+                deadline)
+        elif timestamp is None:
+            return self._fetch_rows(
+                'getRowsWithColumns', (self.name, rows, columns, {}),
+                include_timestamp, deadline)
+        else:
+            if not isinstance(timestamp, Integral):
+                raise TypeError("'timestamp' must be an integer")
+            return self._fetch_rows(
+                'getRowsWithColumnsTs',
+                (self.name, rows, columns, timestamp, {}), include_timestamp,
+                deadline)
+
+    def _fetch_rows(self, method, args, include_timestamp, deadline=None):
+        """Call a Thrift method returning rows and decode them (internal use).
+
+        Returns a list of `(row_key, row_dict)` tuples. The fast decoder is
+        used if it is enabled for the connection.
+        """
+        client = self.connection.client
+        with deadline_scope(deadline):
+            if self.connection.fast_decode:
+                return client.decodeRows(method, args, False,
+                                         include_timestamp)[0]
+            results = getattr(client, method)(*args)
+        return [(r.row, make_row(r.columns, include_timestamp))
+                for r in results]
 
     def cells(self, row, column, versions=None, timestamp=None,
-              include_timestamp=False):
+              include_timestamp=False, deadline=None):
         """Retrieve multiple versions of a single cell from the table.
 
         This method retrieves multiple versions of a cell (if any).
@@ -106,14 +239,15 @@ class Table(object):
         The `versions` argument defines how many cell versions to
         retrieve at most.
 
-        The `timestamp` and `include_timestamp` arguments behave exactly the
-        same as for :py:meth:`row`.
+        The `timestamp`, `include_timestamp` and `deadline` arguments behave
+        exactly the same as for :py:meth:`row`.
 
         :param str row: the row key
         :param str column: the column name
         :param int versions: the maximum number of versions to retrieve
         :param int timestamp: timestamp (optional)
         :param bool include_timestamp: whether timestamps are returned
+        :param deadline: time limit (optional)
 
         :return: cell values
         :rtype: list of values
@@ -126,20 +260,172 @@ class Table(object):
             raise ValueError(
                 "'versions' argument must be at least 1 (or None)")
 
-        if timestamp is None:
-            cells = self.connection.client.getVer(
-                self.name, row, column, versions, {})
-        else:
-            if not isinstance(timestamp, Integral):
-                raise TypeError("'timestamp' must be an integer")
-            cells = self.connection.client.getVerTs(
-                self.name, row, column, timestamp, versions, {})
+        if timestamp is not None and not isinstance(timestamp, Integral):
+            raise TypeError("'timestamp' must be an integer")
+
+        with deadline_scope(resolve_deadline(deadline)):
+            if timestamp is None:
+                cells = self.connection.client.getVer(
+                    self.name, row, column, versions, {})
+            else:
+                cells = self.connection.client.getVerTs(
+                    self.name, row, column, timestamp, versions, {})
 
         return [
             (c.value, c.timestamp) if include_timestamp else c.value
             for c in cells
             ]
 
+    def cells_many(self, requests, versions=None, timestamp=None,
+                   include_timestamp=False, window=32, pool=None,
+                   workers=None):
+        """Retrieve multiple versions of many cells from the table.
+
+        This is the bulk version of :py:meth:`cells`. `requests` is either
+        a dict mapping row keys to lists of columns, or an iterable of
+        `(row, columns)` tuples.
+
+        The Thrift1 API has no call that returns multiple versions of several
+        cells at once (and Thrift scans always return only the latest
+        version), so this method still makes one `getVer` call per cell, but
+        pipelines them: up to `window` calls are sent to the Thrift server
+        before the first reply is read, which hides most of the network
+        latency. With the thrift2 API, up to `window` cells are retrieved
+        with a single `getMultiple` call instead. If a `pool` is given, the
+        cells are split over `workers` connections from the pool (by default
+        all of them), each of which pipelines its own calls.
+
+        The `versions`, `timestamp` and `include_timestamp` arguments behave
+        exactly the same as for :py:meth:`cells`.
+
+        :param requests: the rows and columns to retrieve
+        :type requests: dict or iterable of `(row, columns)` tuples
+        :param int versions: the maximum number of versions to retrieve
+        :param int timestamp: timestamp (optional)
+        :param bool include_timestamp: whether timestamps are returned
+        :param int window: max number of calls in flight per connection
+        :param pool: connection pool to use concurrently (optional)
+        :type pool: :py:class:`ConnectionPool`
+        :param int workers: number of connections to use (optional)
+
+        :return: mapping from row key to a mapping from column name to the
+                 list of cell values, in the order of `requests`
+        :rtype: OrderedDict
+        """
+        if versions is None:
+            versions = (2 ** 31) - 1  # Thrift type is i32
+        elif not isinstance(versions, int):
+            raise TypeError("'versions' argument must be a number or None")
+        elif versions < 1:
+            raise ValueError(
+                "'versions' argument must be at least 1 (or None)")
+
+        if not (timestamp is None or isinstance(timestamp, Integral)):
+            raise TypeError("'timestamp' must be an integer")
+
+        if window < 1:
+            raise ValueError("'window' must be >= 1")
+
+        if isinstance(requests, dict):
+            requests = iteritems(requests)
+
+        result = OrderedDict()
+        calls = []
+        for row, columns in requests:
+            if not isinstance(columns, (tuple, list)):
+                raise TypeError("columns must be a tuple or list")
+            row_result = result.setdefault(row, OrderedDict())
+            for column in columns:
+                if column not in row_result:
+                    row_result[column] = None
+                    calls.append((row, column))
+
+        if not calls:
+            return result
+
+        def run(connection, chunk):
+            connection = connection or self.connection
+            if connection.api == 'thrift2':
+                return self._multi_get_versions(connection.client, chunk,
+                                                versions, timestamp, window)
+            return self._pipelined_versions(connection.client, chunk,
+                                            versions, timestamp, window)
+
+        if pool is None:
+            replies = run(None, calls)
+        else:
+            if workers is None:
+                workers = pool.size
+            workers = min(workers, len(calls))
+            chunk_size = -(-len(calls) // workers)
+            chunks = [calls[i:i + chunk_size]
+                      for i in range(0, len(calls), chunk_size)]
+            replies = fan_out(run, chunks, workers, context=pool.connection,
+                              ordered=False)
+
+        for row, column, cells in replies:
+            result[row][column] = [
+                (c.value, c.timestamp) if include_timestamp else c.value
+                for c in cells
+                ]
+
+        return result
+
+    def _multi_get_versions(self, client, calls, versions, timestamp, window):
+        """Retrieve `(row, column)` versions in batches (Thrift2 only)."""
+        replies = []
+        for i in range(0, len(calls), window):
+            chunk = calls[i:i + window]
+            results = client.getVerMultiple(self.name, chunk, versions,
+                                            timestamp)
+            replies.extend((row, column, cells)
+                           for (row, column), cells in zip(chunk, results))
+        return replies
+
+    def _pipelined_versions(self, client, calls, versions, timestamp, window):
+        """Make pipelined getVer calls for `(row, column)` pairs.
+
+        Returns a list of `(row, column, cells)` tuples. If the server
+        reports an error for a call, the remaining replies are still read,
+        so that the connection stays usable, and the first error is raised
+        afterwards.
+        """
+        if timestamp is None:
+            def send(row, column):
+                client.send_getVer(self.name, row, column, versions, {})
+            receive = client.recv_getVer
+        else:
+            def send(row, column):
+                client.send_getVerTs(self.name, row, column, timestamp,
+                                     versions, {})
+            receive = client.recv_getVerTs
+
+        server_errors = (ttypes.IOError, ttypes.IllegalArgument)
+        replies = []
+        error = None
+        pending = deque()
+        calls = iter(calls)
+        while True:
+            if len(pending) < window:
+                call = next(calls, None)
+                if call is not None:
+                    send(*call)
+                    pending.append(call)
+                    continue
+            if not pending:
+                break
+
+            row, column = pending.popleft()
+            try:
+                replies.append((row, column, receive()))
+            except server_errors as exc:
+                if error is None:
+                    error = exc
+
+        if error is not None:
+            raise error
+        return replies
+
     def regions(self):
         """Retrieve the regions for this table.
 
@@ -152,7 +438,8 @@ class Table(object):
     def scan(self, row_start=None, row_stop=None, row_prefix=None,
              columns=None, filter=None, timestamp=None,
              include_timestamp=False, batch_size=1000, scan_batching=None,
-             limit=None, sorted_columns=False, reverse=False):
+             limit=None, sorted_columns=False, reverse=False, stats=None,
+             time_range=None, deadline=None, key_codec=None):
         """Create a scanner for data in the table.
 
         This method returns an iterable that can be used for looping over the
@@ -174,10 +461,24 @@ class Table(object):
           matching the prefix will be returned. If given, `row_start` and
           `row_stop` cannot be used.
 
-        The `columns`, `timestamp` and `include_timestamp` arguments behave
-        exactly the same as for :py:meth:`row`.
+        The `columns`, `timestamp`, `include_timestamp` and `time_range`
+        arguments behave exactly the same as for :py:meth:`row`.
 
-        The `filter` argument may be a filter string that will be applied at
+        If `deadline` is given (see :py:meth:`row`), it applies to the scan
+        as a whole, i.e. to all batches fetched from the scanner. Time spent
+        by the caller between rows counts as well. Once the deadline has
+        passed, the scanner is closed and
+        :py:exc:`hbasepy.deadline.DeadlineExceeded` is raised.
+
+        If a `key_codec` (see :py:class:`hbasepy.keys.KeyCodec`) is given,
+        `row_start`, `row_stop` and `row_prefix` may be tuples with the
+        values of (the leading) key fields, which are encoded with the
+        codec, and the row keys are returned as decoded tuples. A tuple
+        prefix matches complete field values only, e.g. ``(u'user-1',)``
+        does not match ``(u'user-12', 5)``.
+
+        The `filter` argument may be a filter string or a
+        :py:class:`hbasepy.filters.Filter` instance that will be applied at
         the server by the region servers.
 
         If `limit` is given, at most `limit` results will be returned.
@@ -187,6 +488,14 @@ class Table(object):
         this to a low value (or even 1) if your data is large, since a low
         batch size results in added round-trips to the server.
 
+        If `batch_size` is ``'auto'`` (or a
+        :py:class:`hbasepy.throttle.ScanTuner` instance), the batch size is
+        adjusted after each batch, based on the observed size of the rows and
+        the latency of the server, towards replies of about a megabyte (see
+        :py:class:`hbasepy.throttle.ScanTuner` for the details). This avoids
+        needless round-trips for small rows as well as huge replies for wide
+        rows, without having to tune the batch size by hand.
+
         The optional `scan_batching` is for advanced usage only; it
         translates to `Scan.setBatching()` at the Java side (inside the
         Thrift server). By setting this value rows may be split into
@@ -198,6 +507,13 @@ class Table(object):
         by this scanner will be retrieved in sorted order, and the data
         will be stored in `OrderedDict` instances.
 
+        If `stats` is a :py:class:`hbasepy.stats.ScanStats` instance, it is
+        filled with execution statistics of the scan, like the number of
+        round-trips and the time spent waiting for the server. If `stats`
+        is a callable, it is called with a new
+        :py:class:`hbasepy.stats.ScanStats` instance when the scanner is
+        closed.
+
         **Compatibility notes:**
 
         * The `reverse` argument is only available when using HBase 0.98
@@ -214,19 +530,25 @@ class Table(object):
         :param str row_stop: the row key to stop at (exclusive)
         :param str row_prefix: a prefix of the row key that must match
         :param list_or_tuple columns: list of columns (optional)
-        :param str filter: a filter string (optional)
+        :param str_or_Filter filter: a filter string or object (optional)
         :param int timestamp: timestamp (optional)
         :param bool include_timestamp: whether timestamps are returned
-        :param int batch_size: batch size for retrieving results
+        :param int_or_str batch_size: batch size for retrieving results
         :param bool scan_batching: server-side scan batching (optional)
         :param int limit: max number of rows to return
         :param bool sorted_columns: whether to return sorted columns
         :param bool reverse: whether to perform scan in reverse
+        :param stats: statistics object or callback (optional)
+        :param tuple time_range: range of timestamps (optional)
+        :param deadline: time limit (optional)
+        :param key_codec: codec for tuple row keys (optional)
 
         :return: generator yielding the rows matching the scan
         :rtype: iterable of `(row_key, row_data)` tuples
         """
-        if batch_size < 1:
+        if batch_size == 'auto':
+            batch_size = ScanTuner()
+        elif not isinstance(batch_size, ScanTuner) and batch_size < 1:
             raise ValueError("'batch_size' must be >= 1")
 
         if limit is not None and limit < 1:
@@ -243,6 +565,16 @@ class Table(object):
             raise NotImplementedError(
                 "'reverse' is only supported in HBase >= 0.98")
 
+        self._check_time_range(timestamp, time_range)
+
+        if key_codec is not None:
+            if isinstance(row_start, tuple):
+                row_start = key_codec.encode(row_start)
+            if isinstance(row_stop, tuple):
+                row_stop = key_codec.encode(row_stop)
+            if isinstance(row_prefix, tuple):
+                row_prefix = key_codec.encode(row_prefix)
+
         if row_prefix is not None:
             if row_start is not None or row_stop is not None:
                 raise TypeError(
@@ -255,58 +587,214 @@ class Table(object):
                 row_start = row_prefix
                 row_stop = bytes_increment(row_prefix)
 
-        if self.connection.compat == '0.90':
-            # The scannerOpenWithScan() Thrift function is not
-            # available, so work around it as much as possible with the
-            # other scannerOpen*() Thrift functions
-            if filter is not None:
-                raise NotImplementedError(
-                    "'filter' is not supported in HBase 0.90")
-
-            if row_start is None:
-                row_start = ''
-
-            if row_stop is None:
-                if timestamp is None:
-                    scan_id = self.connection.client.scannerOpen(
-                        self.name, row_start, columns, {})
+        stats, callback = resolve_stats(stats, ScanStats)
+        deadline = resolve_deadline(deadline)
+        started = time.time()
+
+        scanner = self._scanner(
+            row_start, row_stop, columns, compile_filter(filter), timestamp,
+            batch_size, scan_batching, limit, sorted_columns, reverse,
+            stats=stats, time_range=time_range, decode=include_timestamp,
+            deadline=deadline)
+        try:
+            for key, row in scanner:
+                if stats is not None and stats.time_to_first_row is None:
+                    stats.time_to_first_row = time.time() - started
+                if key_codec is not None:
+                    key = key_codec.decode(key)
+                yield key, row
+        finally:
+            scanner.close()
+            if stats is not None:
+                stats.elapsed += time.time() - started
+                if callback is not None:
+                    callback(stats)
+
+    def page(self, size, token=None, row_start=None, row_stop=None,
+             row_prefix=None, columns=None, filter=None, timestamp=None,
+             include_timestamp=False, sorted_columns=False, reverse=None,
+             key_codec=None, deadline=None):
+        """Retrieve a page of rows, with a token for the next page.
+
+        This returns a `(rows, token)` tuple with at most `size` rows. If
+        there are more rows, `token` is an opaque string that can be passed
+        as the `token` argument to retrieve the next page; otherwise it is
+        `None`. Each page uses a new scanner that starts right after the
+        last row of the previous page and is limited to the page size, so
+        deep pages are as cheap as the first one; see
+        :py:mod:`hbasepy.paging`.
+
+        The other arguments behave exactly the same as for :py:meth:`scan`.
+        The token contains the query (except for `row_start`, which it
+        replaces), so the next page can be retrieved with just the token;
+        query arguments that are passed along with a token must match it.
+        The `include_timestamp`, `sorted_columns`, `key_codec` and
+        `deadline` arguments apply to each call separately.
+
+        :param int size: the maximum number of rows in the page
+        :param str token: the token returned with the previous page
+        :param str row_start: the row key to start at (inclusive)
+        :param str row_stop: the row key to stop at (exclusive)
+        :param str row_prefix: a prefix of the row key that must match
+        :param list_or_tuple columns: list of columns (optional)
+        :param str_or_Filter filter: a filter string or object (optional)
+        :param int timestamp: timestamp (optional)
+        :param bool include_timestamp: whether timestamps are returned
+        :param bool sorted_columns: whether to return sorted columns
+        :param bool reverse: whether to page in reverse
+        :param key_codec: codec for tuple row keys (optional)
+        :param deadline: time limit (optional)
+
+        :return: the rows, and the token for the next page
+        :rtype: tuple of a list of `(row_key, row_data)` tuples and a str
+        """
+        return paging.page(
+            self, size, token=token, row_start=row_start, row_stop=row_stop,
+            row_prefix=row_prefix, columns=columns, filter=filter,
+            timestamp=timestamp, include_timestamp=include_timestamp,
+            sorted_columns=sorted_columns, reverse=reverse,
+            key_codec=key_codec, deadline=deadline)
+
+    def _scanner(self, row_start, row_stop, columns, filter, timestamp,
+                 batch_size, scan_batching, limit, sorted_columns, reverse,
+                 stats=None, time_range=None, decode=None, deadline=None):
+        """Open a scanner and yield the raw Thrift row results (internal use).
+
+        The arguments have already been validated by the caller, and `filter`
+        must be a filter string (or `None`). `batch_size` is either a number
+        or a :py:class:`ScanTuner`. If `stats` is given, the Thrift calls are
+        recorded in it. `time_range` requires the thrift2 API. `deadline`
+        (a :py:class:`Deadline` or `None`) applies to opening the scanner
+        and fetching rows, but not to closing it, so that a scanner is
+        closed even if the deadline has passed.
+
+        If `decode` is not `None`, `(row_key, row_dict)` tuples are yielded
+        instead, with `decode` as the `include_timestamp` flag; these are
+        produced by the fast decoder if it is enabled for the connection.
+        """
+        tuner = None
+        if isinstance(batch_size, ScanTuner):
+            # Leave the server-side caching at its default, since the
+            # number of rows per batch will change.
+            tuner = batch_size
+            batch_size = None
+
+        timed = tuner is not None or stats is not None
+        fast = decode is not None and self.connection.fast_decode
+        if stats is not None:
+            started = time.time()
+
+        with deadline_scope(deadline):
+            if self.connection.compat == '0.90':
+                # The scannerOpenWithScan() Thrift function is not
+                # available, so work around it as much as possible with the
+                # other scannerOpen*() Thrift functions
+                if filter is not None:
+                    raise NotImplementedError(
+                        "'filter' is not supported in HBase 0.90")
+
+                if row_start is None:
+                    row_start = ''
+
+                if row_stop is None:
+                    if timestamp is None:
+                        scan_id = self.connection.client.scannerOpen(
+                            self.name, row_start, columns, {})
+                    else:
+                        scan_id = self.connection.client.scannerOpenTs(
+                            self.name, row_start, columns, timestamp, {})
                 else:
-                    scan_id = self.connection.client.scannerOpenTs(
-                        self.name, row_start, columns, timestamp, {})
+                    if timestamp is None:
+                        scan_id = self.connection.client.scannerOpenWithStop(
+                            self.name, row_start, row_stop, columns, {})
+                    else:
+                        scan_id = self.connection.client.scannerOpenWithStopTs(
+                            self.name, row_start, row_stop, columns,
+                            timestamp, {})
             else:
-                if timestamp is None:
-                    scan_id = self.connection.client.scannerOpenWithStop(
-                        self.name, row_start, row_stop, columns, {})
+                scan = ttypes.TScan(
+                    startRow=row_start,
+                    stopRow=row_stop,
+                    timestamp=timestamp,
+                    columns=columns,
+                    caching=batch_size,
+                    filterString=filter,
+                    batchSize=scan_batching,
+                    sortColumns=sorted_columns,
+                    reversed=reverse,
+                )
+                if time_range is None:
+                    scan_id = self.connection.client.scannerOpenWithScan(
+                        self.name, scan, {})
                 else:
-                    scan_id = self.connection.client.scannerOpenWithStopTs(
-                        self.name, row_start, row_stop, columns, timestamp, {})
-        else:
-            scan = TScan(
-                startRow=row_start,
-                stopRow=row_stop,
-                timestamp=timestamp,
-                columns=columns,
-                caching=batch_size,
-                filterString=filter,
-                batchSize=scan_batching,
-                sortColumns=sorted_columns,
-                reversed=reverse,
-            )
-            scan_id = self.connection.client.scannerOpenWithScan(
-                self.name, scan, {})
+                    scan_id = self.connection.client.scannerOpenWithScan(
+                        self.name, scan, {}, time_range)
+
+        if stats is not None:
+            stats.scans += 1
+            stats.round_trips += 1
+            stats.server_time += time.time() - started
 
         logger.debug("Opened scanner (id=%d) on '%s'", scan_id, self.name)
 
         n_returned = n_fetched = 0
+        expired = False
         try:
             while True:
+                if tuner is not None:
+                    batch_size = tuner.batch_size
+
                 if limit is None:
                     how_many = batch_size
                 else:
                     how_many = min(batch_size, limit - n_returned)
 
-                items = self.connection.client.scannerGetList(
-                    scan_id, how_many)
+                if timed:
+                    started = time.time()
+
+                with deadline_scope(deadline):
+                    if fast:
+                        items, n_bytes, decode_time = \
+                            self.connection.client.decodeRows(
+                                'scannerGetList', (scan_id, how_many),
+                                sorted_columns, decode)
+                    else:
+                        items = self.connection.client.scannerGetList(
+                            scan_id, how_many)
+
+                if timed:
+                    latency = time.time() - started
+                    if fast:
+                        latency -= decode_time
+                    else:
+                        n_bytes = sum(map(row_size, items))
+                    if tuner is not None:
+                        tuner.record(len(items), n_bytes, latency)
+                    if stats is not None:
+                        stats.round_trips += 1
+                        stats.server_time += latency
+                        stats.rows += len(items)
+                        stats.bytes += n_bytes
+                        if fast:
+                            stats.decode_time += decode_time
+                            stats.cells += sum(len(row) for _, row in items)
+                        else:
+                            stats.cells += sum(
+                                len(item.sortedColumns if sorted_columns
+                                    else item.columns) for item in items)
+
+                if decode is not None and not fast:
+                    if stats is not None:
+                        started = time.time()
+                    if sorted_columns:
+                        items = [(item.row, make_ordered_row(
+                                  item.sortedColumns, decode))
+                                 for item in items]
+                    else:
+                        items = [(item.row, make_row(item.columns, decode))
+                                 for item in items]
+                    if stats is not None:
+                        stats.decode_time += time.time() - started
 
                 if not items:
                     return  # scan has finished
@@ -314,22 +802,507 @@ class Table(object):
                 n_fetched += len(items)
 
                 for n_returned, item in enumerate(items, n_returned + 1):
-                    if sorted_columns:
-                        row = make_ordered_row(item.sortedColumns,
-                                               include_timestamp)
-                    else:
-                        row = make_row(item.columns, include_timestamp)
-
-                    yield item.row, row
+                    yield item
 
                     if limit is not None and n_returned == limit:
                         return  # scan has finished
+        except DeadlineExceeded:
+            expired = True
+            raise
         finally:
-            self.connection.client.scannerClose(scan_id)
+            if stats is not None:
+                started = time.time()
+            try:
+                self.connection.client.scannerClose(scan_id)
+            except Exception:
+                if not expired:
+                    raise
+                # The connection was replaced when the deadline passed;
+                # the server expires the scanner if it cannot be closed.
+                logger.warning("Failed to close scanner (id=%d) on '%s'",
+                               scan_id, self.name, exc_info=True)
+            if stats is not None:
+                stats.round_trips += 1
+                stats.server_time += time.time() - started
             logger.debug(
                 "Closed scanner (id=%d) on '%s' (%d returned, %d fetched)",
                 scan_id, self.name, n_returned, n_fetched)
 
+    def scan_ranges(self, ranges, columns=None, filter=None, timestamp=None,
+                    include_timestamp=False, batch_size=1000, limit=None,
+                    sorted_columns=False, ranges_per_scanner=1, pool=None,
+                    workers=None, ordered=True):
+        """Scan multiple row key ranges of the table.
+
+        Each item in `ranges` is either a row key prefix, or
+        a `(row_start, row_stop)` tuple with the same semantics as the
+        arguments of :py:meth:`scan`. Overlapping and adjacent ranges are
+        merged before scanning, so each row is returned at most once.
+
+        The `ranges_per_scanner` argument specifies how many consecutive
+        ranges are combined into a single scanner. Such a scanner covers all
+        rows from the start of the first range up to the end of the last one,
+        and uses a server-side row filter to only return rows in the ranges.
+        This saves scanner open/close round-trips, but the region servers
+        still read the rows between the ranges, so only use this for ranges
+        that are close together.
+
+        If a `pool` is given, the scanners are run concurrently in `workers`
+        threads (by default as many as there are scanners, up to 8), each
+        using its own connection from the pool. If `ordered` is `True`, rows
+        are yielded in row key order; otherwise they are yielded as soon as
+        any scanner returns them. Without a pool, the scanners are run one
+        after another using this table's connection.
+
+        The other arguments behave exactly the same as for :py:meth:`scan`.
+        If `limit` is given, at most `limit` rows are returned in total.
+
+        :param list ranges: row key prefixes and/or `(start, stop)` tuples
+        :param list_or_tuple columns: list of columns (optional)
+        :param str_or_Filter filter: a filter string or object (optional)
+        :param int timestamp: timestamp (optional)
+        :param bool include_timestamp: whether timestamps are returned
+        :param int batch_size: batch size for retrieving results
+        :param int limit: max number of rows to return
+        :param bool sorted_columns: whether to return sorted columns
+        :param int ranges_per_scanner: max number of ranges per scanner
+        :param pool: connection pool to scan concurrently with (optional)
+        :type pool: :py:class:`ConnectionPool`
+        :param int workers: number of concurrent scanners (optional)
+        :param bool ordered: whether to yield rows in row key order
+
+        :return: generator yielding the rows matching the scan
+        :rtype: iterable of `(row_key, row_data)` tuples
+        """
+        if limit is not None and limit < 1:
+            raise ValueError("'limit' must be >= 1")
+
+        if ranges_per_scanner < 1:
+            raise ValueError("'ranges_per_scanner' must be >= 1")
+
+        filter = compile_filter(filter)
+        key_ranges = normalize_key_ranges(ranges)
+
+        scans = []
+        for i in range(0, len(key_ranges), ranges_per_scanner):
+            group = key_ranges[i:i + ranges_per_scanner]
+            scan_filter = filter
+            if len(group) > 1:
+                range_filter = Or(*[row_range_filter(start, stop)
+                                    for start, stop in group])
+                if filter is not None:
+                    range_filter = And(range_filter, FilterString(filter))
+                scan_filter = range_filter.compile()
+            scans.append(dict(
+                row_start=group[0][0] or None,
+                row_stop=group[-1][1],
+                filter=scan_filter,
+            ))
+
+        scan_kwargs = dict(
+            columns=columns,
+            timestamp=timestamp,
+            include_timestamp=include_timestamp,
+            batch_size=batch_size,
+            limit=limit,
+            sorted_columns=sorted_columns,
+        )
+
+        logger.debug("Scanning %d ranges on '%s' using %d scanners",
+                     len(key_ranges), self.name, len(scans))
+
+        if pool is None:
+            results = (
+                item
+                for kwargs in scans
+                for item in self.scan(**dict(scan_kwargs, **kwargs)))
+        else:
+            def run(connection, kwargs):
+                table = connection.table(self.name)
+                return table.scan(**dict(scan_kwargs, **kwargs))
+
+            if workers is None:
+                workers = min(len(scans), 8)
+            if isinstance(batch_size, int):
+                buffer_size = batch_size
+            else:
+                buffer_size = 1000
+            results = fan_out(run, scans, workers, context=pool.connection,
+                              ordered=ordered, buffer_size=buffer_size)
+
+        n_returned = 0
+        try:
+            for item in results:
+                yield item
+                n_returned += 1
+                if limit is not None and n_returned == limit:
+                    return
+        finally:
+            results.close()
+
+    def _region_ranges(self, row_start, row_stop):
+        """Split a row key range at the region boundaries (internal use).
+
+        Returns a list of `(start, stop)` tuples; `start` is `None` for the
+        start of the table, and `stop` is `None` for the end of the table.
+        """
+        ranges = []
+        for region in self.regions():
+            start, stop = region['start_key'], region['end_key'] or None
+            if row_start is not None and row_start > start:
+                start = row_start
+            if row_stop is not None and (stop is None or row_stop < stop):
+                stop = row_stop
+            if stop is not None and start >= stop:
+                continue  # region is outside the requested range
+            ranges.append((start or None, stop))
+        return ranges
+
+    def _key_scan_args(self, row_start, row_stop, row_prefix, filter):
+        """Common argument handling for :py:meth:`count` and :py:meth:`keys`.
+
+        Returns a `(row_start, row_stop, filter_string)` tuple.
+        """
+        if row_prefix is not None:
+            if row_start is not None or row_stop is not None:
+                raise TypeError(
+                    "'row_prefix' cannot be combined with 'row_start' "
+                    "or 'row_stop'")
+            row_start = row_prefix
+            row_stop = bytes_increment(row_prefix)
+
+        if filter is None:
+            key_filter = FirstKeyOnlyFilter() & KeyOnlyFilter()
+        else:
+            # FirstKeyOnlyFilter would hide cells from the user's filter,
+            # e.g. the column tested by a SingleColumnValueFilter, so only
+            # strip the values in that case.
+            filter = compile_filter(filter)
+            key_filter = FilterString(filter) & KeyOnlyFilter()
+
+        return row_start, row_stop, key_filter.compile()
+
+    def count(self, row_start=None, row_stop=None, row_prefix=None,
+              columns=None, filter=None, batch_size=10000, pool=None,
+              workers=None, sample_regions=None):
+        """Count the rows in (a part of) the table.
+
+        This is much cheaper than counting the results of :py:meth:`scan`:
+        the region servers only return the key of the first cell of each
+        row (using `FirstKeyOnlyFilter` and `KeyOnlyFilter`), results are
+        fetched in large batches, and no row data is decoded.
+
+        The `row_start`, `row_stop`, `row_prefix`, `columns` and `filter`
+        arguments behave exactly the same as for :py:meth:`scan`.
+
+        If a `pool` is given, one scanner is used per region, and these run
+        concurrently in `workers` threads (by default as many as there are
+        regions, up to 8), each using its own connection from the pool.
+
+        If `sample_regions` is given, only that many randomly chosen regions
+        are counted, and the result is extrapolated to all regions in the
+        requested range. This only gives a rough estimate, since regions
+        are not necessarily equally large, but it is much faster for large
+        tables.
+
+        :param str row_start: the row key to start at (inclusive)
+        :param str row_stop: the row key to stop at (exclusive)
+        :param str row_prefix: a prefix of the row key that must match
+        :param list_or_tuple columns: list of columns (optional)
+        :param str_or_Filter filter: a filter string or object (optional)
+        :param int batch_size: batch size for retrieving results
+        :param pool: connection pool to count concurrently with (optional)
+        :type pool: :py:class:`ConnectionPool`
+        :param int workers: number of concurrent scanners (optional)
+        :param int sample_regions: number of regions to sample (optional)
+
+        :return: the number of rows
+        :rtype: int
+        """
+        if batch_size < 1:
+            raise ValueError("'batch_size' must be >= 1")
+
+        if sample_regions is not None and sample_regions < 1:
+            raise ValueError("'sample_regions' must be >= 1")
+
+        row_start, row_stop, filter = self._key_scan_args(
+            row_start, row_stop, row_prefix, filter)
+
+        if pool is None and sample_regions is None:
+            return sum(1 for _ in self._scanner(
+                row_start, row_stop, columns, filter, None, batch_size, None,
+                None, False, False))
+
+        ranges = self._region_ranges(row_start, row_stop)
+        n_regions = len(ranges)
+        if sample_regions is not None and sample_regions < n_regions:
+            ranges = random.sample(ranges, sample_regions)
+
+        def run(connection, key_range):
+            table = self if connection is None else connection.table(self.name)
+            scanner = table._scanner(
+                key_range[0], key_range[1], columns, filter, None,
+                batch_size, None, None, False, False)
+            return [sum(1 for _ in scanner)]
+
+        if pool is None:
+            counts = [n for r in ranges for n in run(None, r)]
+        else:
+            if workers is None:
+                workers = min(len(ranges), 8)
+            counts = list(fan_out(run, ranges, workers,
+                                  context=pool.connection, ordered=False))
+
+        total = sum(counts)
+        if len(ranges) < n_regions:
+            total = int(round(float(total) * n_regions / len(ranges)))
+
+        logger.debug("Counted %d rows in '%s' using %d of %d regions",
+                     total, self.name, len(ranges), n_regions)
+        return total
+
+    def keys(self, row_start=None, row_stop=None, row_prefix=None,
+             columns=None, filter=None, batch_size=10000, limit=None,
+             pool=None, workers=None):
+        """Retrieve the row keys in (a part of) the table.
+
+        This uses the same server-side filters as :py:meth:`count`, so only
+        row keys are transferred. If a `pool` is given, one scanner is used
+        per region, and these run concurrently in `workers` threads; keys are
+        still yielded in row key order.
+
+        The other arguments behave exactly the same as for :py:meth:`scan`.
+
+        :param str row_start: the row key to start at (inclusive)
+        :param str row_stop: the row key to stop at (exclusive)
+        :param str row_prefix: a prefix of the row key that must match
+        :param list_or_tuple columns: list of columns (optional)
+        :param str_or_Filter filter: a filter string or object (optional)
+        :param int batch_size: batch size for retrieving results
+        :param int limit: max number of keys to return
+        :param pool: connection pool to scan concurrently with (optional)
+        :type pool: :py:class:`ConnectionPool`
+        :param int workers: number of concurrent scanners (optional)
+
+        :return: generator yielding the row keys
+        :rtype: iterable of str
+        """
+        if batch_size < 1:
+            raise ValueError("'batch_size' must be >= 1")
+
+        if limit is not None and limit < 1:
+            raise ValueError("'limit' must be >= 1")
+
+        row_start, row_stop, filter = self._key_scan_args(
+            row_start, row_stop, row_prefix, filter)
+
+        if pool is None:
+            results = (item.row for item in self._scanner(
+                row_start, row_stop, columns, filter, None, batch_size, None,
+                limit, False, False))
+        else:
+            ranges = self._region_ranges(row_start, row_stop)
+
+            def run(connection, key_range):
+                table = connection.table(self.name)
+                scanner = table._scanner(
+                    key_range[0], key_range[1], columns, filter, None,
+                    batch_size, None, limit, False, False)
+                return (item.row for item in scanner)
+
+            if workers is None:
+                workers = min(len(ranges), 8)
+            results = fan_out(run, ranges, workers, context=pool.connection,
+                              buffer_size=batch_size)
+
+        n_returned = 0
+        try:
+            for key in results:
+                yield key
+                n_returned += 1
+                if limit is not None and n_returned == limit:
+                    return
+        finally:
+            results.close()
+
+    def map_reduce(self, mapper, reducer, initial=None, row_start=None,
+                   row_stop=None, row_prefix=None, ranges=None, columns=None,
+                   filter=None, timestamp=None, include_timestamp=False,
+                   batch_size=1000, processes=None):
+        """Scan the table in worker processes and reduce the results.
+
+        The scanned range is split into sub-scans (by default one per region,
+        or one per item in `ranges`, see :py:meth:`scan_ranges`), which are
+        run in a :py:class:`multiprocessing.Pool` of `processes` worker
+        processes (by default one per CPU). Each worker opens its own
+        connection, calls ``mapper(row_key, row_data)`` for each scanned row,
+        and combines the mapped values using ``reducer(a, b)``. Only the
+        reduced value of each sub-scan is sent back, and these are then
+        combined using `reducer` as well, so `reducer` must be associative.
+
+        Since they are sent to other processes, `mapper` and `reducer` must
+        be picklable, i.e. functions defined at module level.
+
+        If no rows are scanned, `initial` is returned.
+
+        The other arguments behave exactly the same as for :py:meth:`scan`.
+
+        Example::
+
+            def row_size(key, data):
+                return sum(len(v) for v in data.values())
+
+            total = table.map_reduce(row_size, operator.add, initial=0)
+
+        :param callable mapper: function mapping a row to a value
+        :param callable reducer: function combining two values
+        :param initial: the result if no rows are scanned (optional)
+        :param str row_start: the row key to start at (inclusive)
+        :param str row_stop: the row key to stop at (exclusive)
+        :param str row_prefix: a prefix of the row key that must match
+        :param list ranges: explicit key ranges for the sub-scans (optional)
+        :param list_or_tuple columns: list of columns (optional)
+        :param str_or_Filter filter: a filter string or object (optional)
+        :param int timestamp: timestamp (optional)
+        :param bool include_timestamp: whether timestamps are returned
+        :param int batch_size: batch size for retrieving results
+        :param int processes: number of worker processes (optional)
+
+        :return: the reduced value
+        """
+        if row_prefix is not None:
+            if row_start is not None or row_stop is not None:
+                raise TypeError(
+                    "'row_prefix' cannot be combined with 'row_start' "
+                    "or 'row_stop'")
+            row_start = row_prefix
+            row_stop = bytes_increment(row_prefix)
+
+        if ranges is None:
+            key_ranges = self._region_ranges(row_start, row_stop)
+        else:
+            if row_start is not None or row_stop is not None:
+                raise TypeError(
+                    "'ranges' cannot be combined with 'row_start', "
+                    "'row_stop' or 'row_prefix'")
+            key_ranges = [(start or None, stop) for start, stop
+                          in normalize_key_ranges(ranges)]
+
+        scan_kwargs = dict(
+            columns=columns,
+            filter=compile_filter(filter),
+            timestamp=timestamp,
+            include_timestamp=include_timestamp,
+            batch_size=batch_size,
+        )
+        kwargs = mapreduce.connection_kwargs(self.connection)
+        tasks = [(kwargs, self.name, key_range, scan_kwargs, mapper, reducer)
+                 for key_range in key_ranges]
+
+        import multiprocessing
+
+        n_rows = 0
+        result = initial
+        pool = multiprocessing.Pool(processes)
+        try:
+            for n, partial in pool.imap_unordered(mapreduce.run_task, tasks):
+                if not n:
+                    continue
+                result = reducer(result, partial) if n_rows else partial
+                n_rows += n
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+        logger.debug("Reduced %d rows of '%s' using %d sub-scans",
+                     n_rows, self.name, len(tasks))
+        return result
+
+    def lookup(self, index, value, columns=None, include_timestamp=False,
+               limit=None, chunk_size=100, verify=True):
+        """Retrieve the rows with a given value in an indexed column.
+
+        This method looks up the row keys for `value` using a prefix scan on
+        the index table of the :py:class:`Index` named `index`, and then
+        retrieves these rows from this table using multi-row gets of at most
+        `chunk_size` rows each.
+
+        If `verify` is `True` (the default), rows whose indexed column no
+        longer contains `value` (because it was overwritten after the index
+        entry was written) are skipped.
+
+        The `columns` and `include_timestamp` arguments behave exactly the
+        same as for :py:meth:`row`. If `limit` is given, at most `limit` rows
+        are returned.
+
+        :param str index: the name of the index
+        :param str value: the value to look up
+        :param list_or_tuple columns: list of columns (optional)
+        :param bool include_timestamp: whether timestamps are returned
+        :param int limit: max number of rows to return
+        :param int chunk_size: max number of rows per multi-row get
+        :param bool verify: whether to skip stale index entries
+
+        :return: generator yielding the matching rows
+        :rtype: iterable of `(row_key, row_data)` tuples
+        """
+        if columns is not None and not isinstance(columns, (tuple, list)):
+            raise TypeError("'columns' must be a tuple or list")
+
+        if limit is not None and limit < 1:
+            raise ValueError("'limit' must be >= 1")
+
+        if chunk_size < 1:
+            raise ValueError("'chunk_size' must be >= 1")
+
+        try:
+            index = self.indexes[index]
+        except KeyError:
+            raise ValueError("No index named %r on table %r"
+                             % (index, self.name))
+
+        value = ensure_bytes(value)
+        fetch_columns = columns
+        if verify and columns is not None and not index.covers(columns):
+            fetch_columns = list(columns) + [index.column]
+
+        index_table = self.connection.table(index.index_table)
+        index_keys = index_table.keys(row_prefix=index.prefix(value),
+                                      batch_size=chunk_size)
+
+        n_returned = 0
+        try:
+            while True:
+                chunk = [index.row_key(key)
+                         for key in itertools.islice(index_keys, chunk_size)]
+                if not chunk:
+                    return
+
+                for key, data in self.rows(chunk, columns=fetch_columns,
+                                           include_timestamp=True):
+                    if verify:
+                        cell = data.get(index.column)
+                        if cell is None or cell[0] != value:
+                            logger.debug("Skipping stale index entry for "
+                                         "row %r in index %r", key, index.name)
+                            continue
+                        if fetch_columns is not columns:
+                            del data[index.column]
+
+                    if not include_timestamp:
+                        data = dict((k, v[0]) for k, v in iteritems(data))
+
+                    yield key, data
+
+                    n_returned += 1
+                    if limit is not None and n_returned == limit:
+                        return
+        finally:
+            index_keys.close()
+
     def put(self, row, data, timestamp=None):
         """Store data in the table.
 
@@ -366,7 +1339,9 @@ class Table(object):
         with self.batch(timestamp=timestamp) as batch:
             batch.delete(row, columns)
 
-    def batch(self, timestamp=None, batch_size=None, transaction=False):
+    def batch(self, timestamp=None, batch_size=None, transaction=False,
+              spool=None, controller=None, stats=None, deadline=None,
+              coalesce=False):
         """Create a new batch operation for this table.
 
         This method returns a new :py:class:`Batch` instance that can be used
@@ -382,11 +1357,48 @@ class Table(object):
         used as context manager in a ``with`` block of code. The `transaction`
         flag cannot be used in combination with `batch_size`.
 
+        If a `spool` is given, the batch appends its mutations to this
+        :py:class:`hbasepy.spool.Spool` instead of sending them to the server
+        directly, and the spool replays them in the background.
+
+        If a `controller` is given, the batch size is not fixed, but adapts
+        to the observed latency of the sends; see
+        :py:class:`hbasepy.throttle.AdaptiveController`. The controller may
+        be shared by many batches, e.g. one per loader thread, and cannot be
+        used in combination with `batch_size` or `transaction`.
+
+        If `stats` is a :py:class:`hbasepy.stats.BatchStats` instance, it is
+        updated after each send. If `stats` is a callable, it is called with
+        a new :py:class:`hbasepy.stats.BatchStats` instance for each send.
+
+        If a `deadline` is given (see :py:meth:`row`), it applies to all
+        sends of the batch, including the send at the end of a ``with``
+        block; a number of seconds is counted from the creation of the
+        batch. :py:meth:`Batch.send` also accepts a deadline for a single
+        send.
+
+        If `coalesce` is true, the batch only keeps the last put of each
+        cell, and a delete removes the puts of the cells it covers that
+        were added before it, so repeated updates of a cell are sent only
+        once. Each send has the same outcome as without coalescing: puts
+        added after a delete are kept, and the server applies them before
+        the delete, as it always does. The number of mutations saved is
+        counted in :py:attr:`Batch.coalesced` and in the `stats`. The batch
+        size counts the mutations that remain, so a batch with
+        a `batch_size` may send at other points than without coalescing.
+
         :param bool transaction: whether this batch should behave like
                                  a transaction (only useful when used as a
                                  context manager)
         :param int batch_size: batch size (optional)
         :param int timestamp: timestamp (optional)
+        :param spool: spool to append the mutations to (optional)
+        :type spool: :py:class:`hbasepy.spool.Spool`
+        :param controller: adaptive batch size controller (optional)
+        :type controller: :py:class:`hbasepy.throttle.AdaptiveController`
+        :param stats: statistics object or callback (optional)
+        :param deadline: time limit (optional)
+        :param bool coalesce: whether to coalesce mutations of the same cells
 
         :return: Batch instance
         :rtype: :py:class:`Batch`
@@ -395,6 +1407,64 @@ class Table(object):
         del kwargs['self']
         return Batch(table=self, **kwargs)
 
+    def put_blob(self, row, column, data, chunk_size=blob.DEFAULT_CHUNK_SIZE,
+                 chunks_per_send=4):
+        """Store a large value in the table.
+
+        The value is split into chunks of at most `chunk_size` bytes, which
+        are stored in separate cells next to a manifest cell in `column`,
+        and sent `chunks_per_send` at a time; see :py:mod:`hbasepy.blob`.
+        `data` is either a byte string or a readable file object, which is
+        read one chunk at a time. A blob previously stored in the same
+        column is replaced. Use :py:meth:`open_blob` to read it back.
+
+        :param str row: the row key
+        :param str column: the column for the blob, e.g. ``b'blobs:data'``
+        :param data: the value, or a file object to read it from
+        :param int chunk_size: the maximum size of a chunk in bytes
+        :param int chunks_per_send: number of chunks per batch sent
+
+        :return: the size of the blob in bytes
+        :rtype: int
+        """
+        return blob.put_blob(self, row, column, data, chunk_size=chunk_size,
+                             chunks_per_send=chunks_per_send)
+
+    def open_blob(self, row, column, mode='rb',
+                  chunk_size=blob.DEFAULT_CHUNK_SIZE, chunks_per_send=4):
+        """Open a large value stored with :py:meth:`put_blob`.
+
+        With `mode` ``'rb'``, this returns a seekable, read-only file object
+        (:py:class:`hbasepy.blob.BlobReader`) that fetches chunks from the
+        table as they are read, and raises :py:exc:`hbasepy.blob.BlobError`
+        if there is no blob. With `mode` ``'wb'``, this returns a file object
+        (:py:class:`hbasepy.blob.BlobWriter`) that stores the blob when it is
+        closed; `chunk_size` and `chunks_per_send` are as for
+        :py:meth:`put_blob`. Both can be used as context managers.
+
+        :param str row: the row key
+        :param str column: the column of the blob
+        :param str mode: ``'rb'`` or ``'wb'``
+        :param int chunk_size: the maximum size of a chunk in bytes
+        :param int chunks_per_send: number of chunks per batch sent
+
+        :return: file object
+        """
+        return blob.open_blob(self, row, column, mode=mode,
+                              chunk_size=chunk_size,
+                              chunks_per_send=chunks_per_send)
+
+    def delete_blob(self, row, column):
+        """Delete a large value stored with :py:meth:`put_blob`.
+
+        :param str row: the row key
+        :param str column: the column of the blob
+
+        :return: whether there was a blob to delete
+        :rtype: bool
+        """
+        return blob.delete_blob(self, row, column)
+
     def counter_get(self, row, column):
         """Retrieve the current value of a counter column.
 
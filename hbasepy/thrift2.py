@@ -0,0 +1,303 @@
+"""
+hbasepy Thrift2 backend module.
+
+This module contains an adapter that exposes the Thrift1 `Hbase.Client`
+calls used by hbasepy on top of the Thrift2 `THBaseService` API, so that
+:py:class:`Table` and :py:class:`Batch` work unchanged with both APIs. It is
+used by :py:class:`Connection` when it is created with ``api='thrift2'``.
+
+The Thrift2 bindings are expected in the `hbase_thrift2` package, next to
+the Thrift1 bindings in `hbase_thrift` (whose types are still used for the
+results returned by the adapter).
+"""
+
+from struct import Struct
+
+from .tool import ensure_bytes, LazyModule
+
+ttypes = LazyModule('hbase_thrift.ttypes')
+ttypes2 = LazyModule('hbase_thrift2.ttypes')
+
+unpack_i64 = Struct('>q').unpack
+
+#: Column name used in a delete `Mutation` to delete the complete row
+ROW_DELETE = b''
+
+
+def table_name(name):
+    """Convert a table name to a Thrift2 `TTableName`."""
+    name = ensure_bytes(name)
+    namespace, _, qualifier = name.rpartition(b':')
+    return ttypes2.TTableName(ns=namespace or None, qualifier=qualifier)
+
+
+def column(name):
+    """Convert a Thrift1 `family[:qualifier]` name to a Thrift2 `TColumn`."""
+    family, sep, qualifier = name.partition(b':')
+    return ttypes2.TColumn(family=family, qualifier=qualifier if sep else None)
+
+
+def columns(names):
+    if names is None:
+        return None
+    return [column(name) for name in names]
+
+
+def time_range(timestamp, range_=None):
+    """Return a `TTimeRange` for Thrift1 timestamp semantics or a range."""
+    if range_ is not None:
+        return ttypes2.TTimeRange(minStamp=range_[0], maxStamp=range_[1])
+    if timestamp is not None:
+        # Thrift1 calls return cells *older* than the given timestamp
+        return ttypes2.TTimeRange(minStamp=0, maxStamp=timestamp)
+    return None
+
+
+def row_result(result, sorted_columns=False):
+    """Convert a Thrift2 `TResult` to a Thrift1 `TRowResult`."""
+    if sorted_columns:
+        return ttypes.TRowResult(row=result.row, sortedColumns=[
+            ttypes.TColumn(columnName=cv.family + b':' + cv.qualifier,
+                           cell=ttypes.TCell(value=cv.value,
+                                             timestamp=cv.timestamp))
+            for cv in result.columnValues])
+    return ttypes.TRowResult(row=result.row, columns=dict(
+        (cv.family + b':' + cv.qualifier,
+         ttypes.TCell(value=cv.value, timestamp=cv.timestamp))
+        for cv in result.columnValues))
+
+
+class Thrift2Client(object):
+    """Thrift1 style client on top of a Thrift2 `THBaseService.Client`.
+
+    Only the calls used by hbasepy are implemented. The row and scanner
+    calls accept an optional trailing `range_` argument, a `(min_timestamp,
+    max_timestamp)` tuple, which has no Thrift1 equivalent. A delete
+    mutation for the column :py:data:`ROW_DELETE` deletes the complete row.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._sorted_scanners = set()
+
+    #
+    # Administration
+    #
+
+    def getTableNames(self):
+        names = []
+        for name in self._client.getTableNamesByPattern(None, False):
+            if name.ns and name.ns != b'default':
+                names.append(name.ns + b':' + name.qualifier)
+            else:
+                names.append(name.qualifier)
+        return names
+
+    def getColumnDescriptors(self, name):
+        descriptor = self._client.getTableDescriptor(table_name(name))
+        compression = ttypes2.TCompressionAlgorithm._VALUES_TO_NAMES
+        bloom_filter = ttypes2.TBloomFilterType._VALUES_TO_NAMES
+        descriptors = {}
+        for family in descriptor.columns:
+            descriptors[family.name + b':'] = ttypes.ColumnDescriptor(
+                name=family.name + b':',
+                maxVersions=family.maxVersions,
+                compression=compression.get(family.compressionType),
+                inMemory=family.inMemory,
+                bloomFilterType=bloom_filter.get(family.bloomnFilterType),
+                blockCacheEnabled=family.blockCacheEnabled,
+                timeToLive=family.timeToLive,
+            )
+        return descriptors
+
+    def createTable(self, name, column_descriptors):
+        compression = ttypes2.TCompressionAlgorithm._NAMES_TO_VALUES
+        bloom_filter = ttypes2.TBloomFilterType._NAMES_TO_VALUES
+        families = []
+        for descriptor in column_descriptors:
+            family_name = ensure_bytes(descriptor.name)
+            families.append(ttypes2.TColumnFamilyDescriptor(
+                name=family_name.rstrip(b':'),
+                maxVersions=descriptor.maxVersions,
+                compressionType=compression.get(descriptor.compression),
+                inMemory=descriptor.inMemory,
+                bloomnFilterType=bloom_filter.get(descriptor.bloomFilterType),
+                blockCacheEnabled=descriptor.blockCacheEnabled,
+                timeToLive=descriptor.timeToLive,
+            ))
+        self._client.createTable(
+            ttypes2.TTableDescriptor(tableName=table_name(name),
+                                     columns=families), None)
+
+    def deleteTable(self, name):
+        self._client.deleteTable(table_name(name))
+
+    def enableTable(self, name):
+        self._client.enableTable(table_name(name))
+
+    def disableTable(self, name):
+        self._client.disableTable(table_name(name))
+
+    def isTableEnabled(self, name):
+        return self._client.isTableEnabled(table_name(name))
+
+    def compact(self, name):
+        raise NotImplementedError(
+            "compactions are not supported by the Thrift2 API")
+
+    majorCompact = compact
+
+    def getTableRegions(self, name):
+        return [
+            ttypes.TRegionInfo(
+                startKey=location.regionInfo.startKey,
+                endKey=location.regionInfo.endKey,
+                id=location.regionInfo.regionId,
+                name=b'',
+                version=0,
+                serverName=location.serverName.hostName,
+                port=location.serverName.port,
+            )
+            for location in self._client.getAllRegionLocations(
+                ensure_bytes(name))]
+
+    #
+    # Reads
+    #
+
+    def _get(self, row, column_names, timestamp=None, range_=None,
+             max_versions=None):
+        return ttypes2.TGet(row=row, columns=columns(column_names),
+                            timeRange=time_range(timestamp, range_),
+                            maxVersions=max_versions)
+
+    def getRowWithColumns(self, name, row, column_names, attributes,
+                          range_=None):
+        return self.getRowsWithColumns(name, [row], column_names, attributes,
+                                       range_)
+
+    def getRowWithColumnsTs(self, name, row, column_names, timestamp,
+                            attributes):
+        return self.getRowsWithColumnsTs(name, [row], column_names,
+                                         timestamp, attributes)
+
+    def getRowsWithColumns(self, name, rows, column_names, attributes,
+                           range_=None):
+        gets = [self._get(row, column_names, range_=range_) for row in rows]
+        results = self._client.getMultiple(ensure_bytes(name), gets)
+        return [row_result(r) for r in results if r.columnValues]
+
+    def getRowsWithColumnsTs(self, name, rows, column_names, timestamp,
+                             attributes):
+        gets = [self._get(row, column_names, timestamp=timestamp)
+                for row in rows]
+        results = self._client.getMultiple(ensure_bytes(name), gets)
+        return [row_result(r) for r in results if r.columnValues]
+
+    def getVerMultiple(self, name, cells, versions, timestamp=None):
+        """Return the versions of many `(row, column)` cells in one call.
+
+        This call has no Thrift1 equivalent; the result is a list with
+        a list of `TCell` instances for each cell.
+        """
+        gets = [self._get(row, [column_name], timestamp=timestamp,
+                          max_versions=versions)
+                for row, column_name in cells]
+        results = self._client.getMultiple(ensure_bytes(name), gets)
+        return [[ttypes.TCell(value=cv.value, timestamp=cv.timestamp)
+                 for cv in result.columnValues]
+                for result in results]
+
+    def getVer(self, name, row, column_name, versions, attributes):
+        return self.getVerMultiple(name, [(row, column_name)], versions)[0]
+
+    def getVerTs(self, name, row, column_name, timestamp, versions,
+                 attributes):
+        return self.getVerMultiple(name, [(row, column_name)], versions,
+                                   timestamp)[0]
+
+    #
+    # Scanners
+    #
+
+    def scannerOpenWithScan(self, name, scan, attributes, range_=None):
+        thrift2_scan = ttypes2.TScan(
+            startRow=scan.startRow,
+            stopRow=scan.stopRow,
+            columns=columns(scan.columns),
+            caching=scan.caching,
+            timeRange=time_range(scan.timestamp, range_),
+            filterString=scan.filterString,
+            batchSize=scan.batchSize,
+            reversed=scan.reversed,
+        )
+        scan_id = self._client.openScanner(ensure_bytes(name), thrift2_scan)
+        if scan.sortColumns:
+            self._sorted_scanners.add(scan_id)
+        return scan_id
+
+    def scannerGetList(self, scan_id, n_rows):
+        sorted_columns = scan_id in self._sorted_scanners
+        return [row_result(r, sorted_columns)
+                for r in self._client.getScannerRows(scan_id, n_rows)]
+
+    def scannerClose(self, scan_id):
+        self._sorted_scanners.discard(scan_id)
+        self._client.closeScanner(scan_id)
+
+    #
+    # Writes
+    #
+
+    def mutateRows(self, name, batch_mutations, attributes):
+        self.mutateRowsTs(name, batch_mutations, None, attributes)
+
+    def mutateRowsTs(self, name, batch_mutations, timestamp, attributes):
+        # Like Thrift1, puts are applied before deletes.
+        puts = []
+        deletes = []
+        for batch_mutation in batch_mutations:
+            values = []
+            deleted = []
+            delete_row = False
+            for m in batch_mutation.mutations:
+                if not m.isDelete:
+                    family, _, qualifier = m.column.partition(b':')
+                    values.append(ttypes2.TColumnValue(
+                        family=family, qualifier=qualifier, value=m.value))
+                elif m.column == ROW_DELETE:
+                    delete_row = True
+                else:
+                    deleted.append(column(m.column))
+
+            row = batch_mutation.row
+            if values:
+                puts.append(ttypes2.TPut(row=row, columnValues=values,
+                                         timestamp=timestamp))
+            if delete_row:
+                deletes.append(ttypes2.TDelete(row=row, timestamp=timestamp))
+            elif deleted:
+                # The server ignores the timestamp of the delete when
+                # columns are given, so it is set on each column.
+                if timestamp is not None:
+                    for c in deleted:
+                        c.timestamp = timestamp
+                deletes.append(ttypes2.TDelete(
+                    row=row, columns=deleted, timestamp=timestamp,
+                    deleteType=ttypes2.TDeleteType.DELETE_COLUMNS))
+
+        if puts:
+            self._client.putMultiple(ensure_bytes(name), puts)
+        if deletes:
+            failed = self._client.deleteMultiple(ensure_bytes(name), deletes)
+            if failed:
+                raise ttypes.IOError(message="%d of %d deletes failed"
+                                     % (len(failed), len(deletes)))
+
+    def atomicIncrement(self, name, row, column_name, value):
+        family, _, qualifier = column_name.partition(b':')
+        increment = ttypes2.TIncrement(row=row, columns=[
+            ttypes2.TColumnIncrement(family=family, qualifier=qualifier,
+                                     amount=value)])
+        result = self._client.increment(ensure_bytes(name), increment)
+        return unpack_i64(result.columnValues[0].value)[0]
@@ -0,0 +1,413 @@
+"""
+hbasepy throttling and tuning module.
+"""
+
+from collections import deque
+import contextlib
+import logging
+import threading
+import time
+
+import six
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket rate limiter.
+
+    Tokens are added at `rate` tokens per second, up to a maximum of `burst`
+    tokens (by default one second worth of tokens).
+
+    :param float rate: number of tokens added per second
+    :param float burst: maximum number of tokens (optional)
+    """
+
+    def __init__(self, rate, burst=None):
+        if not rate > 0:
+            raise ValueError("'rate' must be > 0")
+        if burst is None:
+            burst = rate
+        if not burst > 0:
+            raise ValueError("'burst' must be > 0")
+
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = self.burst
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def consume(self, n=1):
+        """Take `n` tokens from the bucket, waiting until they are available.
+
+        Requests for more than `burst` tokens are allowed; they wait until
+        the bucket is full and then leave it in debt, which delays later
+        requests accordingly.
+
+        :param float n: number of tokens
+        :return: the number of seconds spent waiting
+        :rtype: float
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.time()
+                self._refill(now)
+                needed = min(n, self.burst)
+                if self._tokens >= needed:
+                    self._tokens -= n
+                    return waited
+                delay = (needed - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class AdaptiveController(object):
+    """Adaptive batch size and concurrency controller for writes.
+
+    This controller implements additive increase, multiplicative decrease
+    (AIMD), as used for TCP congestion control. It is shared by one or
+    more :py:class:`Batch` instances (see the `controller` argument of
+    :py:meth:`Table.batch`), which report the latency and outcome of each
+    `mutateRows` call to it.
+
+    While the latency stays below `target_latency` seconds, the batch size
+    grows by `batch_size_step` mutations per send, and the allowed number
+    of concurrent sends grows by roughly one per round of sends. When
+    a send is slower than that, or fails (e.g. because a region server is
+    too busy), both are multiplied by `backoff`. Sends that were started
+    before the last decrease do not cause another decrease, so a single
+    slowdown only reduces the limits once.
+
+    If `max_rate` is given, the number of mutations sent per second is also
+    capped using a :py:class:`TokenBucket`; use one controller per table
+    for a per-table cap.
+
+    :param int batch_size: initial batch size
+    :param int min_batch_size: minimum batch size
+    :param int max_batch_size: maximum batch size
+    :param int batch_size_step: batch size increase per healthy send
+    :param int max_concurrency: maximum number of concurrent sends
+    :param float target_latency: max healthy send latency in seconds
+    :param float backoff: multiplier applied on slowdowns and errors
+    :param float max_rate: max number of mutations per second (optional)
+    """
+
+    def __init__(self, batch_size=100, min_batch_size=10,
+                 max_batch_size=10000, batch_size_step=None,
+                 max_concurrency=8, target_latency=0.5, backoff=0.5,
+                 max_rate=None):
+        if not 0 < min_batch_size <= batch_size <= max_batch_size:
+            raise ValueError("batch sizes must satisfy 0 < 'min_batch_size' "
+                             "<= 'batch_size' <= 'max_batch_size'")
+        if max_concurrency < 1:
+            raise ValueError("'max_concurrency' must be >= 1")
+        if not 0 < backoff < 1:
+            raise ValueError("'backoff' must be between 0 and 1")
+        if not target_latency > 0:
+            raise ValueError("'target_latency' must be > 0")
+
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.batch_size_step = batch_size_step or min_batch_size
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.rate_limiter = None if max_rate is None else TokenBucket(max_rate)
+
+        self._batch_size = float(batch_size)
+        self._concurrency = 1.0
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+        #: Number of successful and failed sends, and of decreases
+        self.sends = self.errors = self.decreases = 0
+
+    def __repr__(self):
+        return '<%s.%s batch_size=%d concurrency=%d>' % (
+            __name__,
+            self.__class__.__name__,
+            self.batch_size,
+            self.concurrency,
+        )
+
+    @property
+    def batch_size(self):
+        """The current batch size."""
+        return int(self._batch_size)
+
+    @property
+    def concurrency(self):
+        """The current number of allowed concurrent sends."""
+        return int(self._concurrency)
+
+    @contextlib.contextmanager
+    def slot(self):
+        """Wait until a send is allowed, and hold it while in the block.
+
+        This method *must* be used as a context manager. It returns the time
+        at which the send started, to be passed to :py:meth:`record`.
+        """
+        with self._cond:
+            while self._in_flight >= int(self._concurrency):
+                self._cond.wait()
+            self._in_flight += 1
+        try:
+            yield time.time()
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def throttle(self, n_mutations):
+        """Wait until `n_mutations` may be sent according to `max_rate`."""
+        if self.rate_limiter is not None:
+            self.rate_limiter.consume(n_mutations)
+
+    def record(self, started, latency, error=False):
+        """Record the outcome of a send.
+
+        :param float started: the time the send started
+        :param float latency: the duration of the send in seconds
+        :param bool error: whether the send failed
+        """
+        with self._cond:
+            if error:
+                self.errors += 1
+            else:
+                self.sends += 1
+
+            if error or latency > self.target_latency:
+                if started < self._last_decrease:
+                    return
+                self._last_decrease = time.time()
+                self.decreases += 1
+                self._batch_size = max(self.min_batch_size,
+                                       self._batch_size * self.backoff)
+                self._concurrency = max(1.0,
+                                        self._concurrency * self.backoff)
+                logger.debug(
+                    "Decreased batch size to %d and concurrency to %d "
+                    "(latency %.3fs, error=%s)", self.batch_size,
+                    self.concurrency, latency, error)
+            else:
+                self._batch_size = min(self.max_batch_size,
+                                       self._batch_size + self.batch_size_step)
+                self._concurrency = min(
+                    self.max_concurrency,
+                    self._concurrency + 1.0 / int(self._concurrency))
+            self._cond.notify_all()
+
+
+class ScanTuner(object):
+    """Adaptive scanner batch size.
+
+    A scan using a tuner (see the `batch_size` argument of
+    :py:meth:`Table.scan`) asks for :py:attr:`batch_size` rows in each
+    `scannerGetList` call, and reports the size and latency of each reply
+    back to the tuner using :py:meth:`record`.
+
+    The tuner starts with `initial` rows, and then moves the batch size
+    towards the number of rows that make up `target_bytes`, based on the
+    average row size observed so far, but never asks for more than
+    `max_bytes` worth of rows in a single reply. It grows by at most
+    a factor of two per call, so that a scan that is stopped early does not
+    fetch a lot of unneeded rows. If a reply takes longer than
+    `target_latency` seconds, the batch size is reduced proportionally.
+
+    A tuner keeps its state between scans, so reusing a tuner for similar
+    scans avoids starting small every time. Tuners are not thread-safe.
+
+    :param int initial: initial batch size
+    :param int min_batch_size: minimum batch size
+    :param int max_batch_size: maximum batch size
+    :param int target_bytes: target reply size in bytes
+    :param int max_bytes: maximum reply size in bytes
+    :param float target_latency: max reply latency in seconds
+    """
+
+    def __init__(self, initial=10, min_batch_size=1, max_batch_size=100000,
+                 target_bytes=1024 * 1024, max_bytes=8 * 1024 * 1024,
+                 target_latency=1.0):
+        if not 0 < min_batch_size <= initial <= max_batch_size:
+            raise ValueError("batch sizes must satisfy 0 < 'min_batch_size' "
+                             "<= 'initial' <= 'max_batch_size'")
+        if not 0 < target_bytes <= max_bytes:
+            raise ValueError(
+                "'target_bytes' must be > 0 and <= 'max_bytes'")
+        if not target_latency > 0:
+            raise ValueError("'target_latency' must be > 0")
+
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.target_bytes = target_bytes
+        self.max_bytes = max_bytes
+        self.target_latency = target_latency
+
+        self.batch_size = initial
+        self.row_size = None
+
+    def __repr__(self):
+        return '<%s.%s batch_size=%d row_size=%s>' % (
+            __name__,
+            self.__class__.__name__,
+            self.batch_size,
+            self.row_size,
+        )
+
+    def record(self, n_rows, n_bytes, latency):
+        """Record the size and latency of a reply, and adjust the batch size.
+
+        :param int n_rows: number of rows in the reply
+        :param int n_bytes: (approximate) size of the reply in bytes
+        :param float latency: latency of the call in seconds
+        """
+        if not n_rows:
+            return
+
+        # Exponentially weighted moving average of the row size
+        row_size = float(n_bytes) / n_rows
+        if self.row_size is None:
+            self.row_size = row_size
+        else:
+            self.row_size = 0.7 * self.row_size + 0.3 * row_size
+
+        row_size = max(self.row_size, 1.0)
+        wanted = min(self.target_bytes / row_size,
+                     self.max_bytes / row_size,
+                     2 * self.batch_size)
+        if latency > self.target_latency:
+            wanted = min(wanted,
+                         n_rows * self.target_latency / latency)
+
+        self.batch_size = int(max(self.min_batch_size,
+                                  min(self.max_batch_size, wanted)))
+
+
+class HedgePolicy(object):
+    """Hedged read policy, with statistics.
+
+    A :py:class:`PooledTable` with a hedge policy (see the `hedge` argument
+    of :py:meth:`ConnectionPool.table`) sends each read on a pool
+    connection, and if no reply has arrived after :py:meth:`delay` seconds,
+    sends the same read on a second connection. The first reply is used,
+    and the other request is abandoned: its socket is shut down, and its
+    connection is replaced before it goes back to the pool. This cuts the
+    latency of reads stuck behind e.g. a garbage collection pause, at the
+    cost of a few duplicate reads.
+
+    If `delay` is a number, it is the hedge delay in seconds. If it is
+    a string like ``'p95'``, the delay is that percentile of the latencies
+    of the last `window` reads, but at least `min_delay` seconds; reads are
+    not hedged until `min_samples` latencies have been recorded. To avoid
+    doubling the load on a cluster that is slow across the board, at most
+    a `max_rate` fraction of the reads is hedged.
+
+    A policy can be shared by multiple tables, and is thread-safe.
+
+    :param delay: hedge delay in seconds, or a percentile like ``'p95'``
+    :param float min_delay: minimum hedge delay in seconds
+    :param float max_rate: maximum fraction of reads that are hedged
+    :param int window: number of recent latencies to use for percentiles
+    :param int min_samples: number of latencies needed before hedging
+    """
+
+    def __init__(self, delay='p95', min_delay=0.001, max_rate=0.1,
+                 window=1000, min_samples=20):
+        self.percentile = None
+        if isinstance(delay, six.string_types):
+            try:
+                if not delay.startswith('p'):
+                    raise ValueError
+                self.percentile = float(delay[1:])
+            except ValueError:
+                raise ValueError("'delay' must be a number or a percentile "
+                                 "like 'p95'")
+            if not 0 < self.percentile < 100:
+                raise ValueError("the 'delay' percentile must be between "
+                                 "0 and 100")
+            self._delay = None
+        elif not delay > 0:
+            raise ValueError("'delay' must be > 0")
+        else:
+            self._delay = float(delay)
+        if not 0 < max_rate <= 1:
+            raise ValueError("'max_rate' must be between 0 and 1")
+        if window < 1 or min_samples < 1:
+            raise ValueError("'window' and 'min_samples' must be >= 1")
+
+        self.min_delay = min_delay
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._n_new = 0
+        self._lock = threading.Lock()
+
+        #: Number of reads, of hedged reads, and of reads won by the hedge
+        self.reads = self.hedges = self.hedge_wins = 0
+
+    def __repr__(self):
+        return '<%s.%s delay=%s reads=%d hedges=%d hedge_wins=%d>' % (
+            __name__,
+            self.__class__.__name__,
+            self._delay,
+            self.reads,
+            self.hedges,
+            self.hedge_wins,
+        )
+
+    @property
+    def hedge_rate(self):
+        """The fraction of reads that were hedged."""
+        return float(self.hedges) / self.reads if self.reads else 0.0
+
+    @property
+    def win_rate(self):
+        """The fraction of hedged reads answered first by the hedge."""
+        return float(self.hedge_wins) / self.hedges if self.hedges else 0.0
+
+    def delay(self):
+        """Return the current hedge delay in seconds.
+
+        Returns `None` if reads should not be hedged (yet).
+        """
+        return self._delay
+
+    def allow_hedge(self):
+        """Return whether the hedge rate allows hedging another read."""
+        with self._lock:
+            return self.hedges < self.max_rate * (self.reads + 1)
+
+    def record(self, latency, hedged=False, hedge_won=False):
+        """Record the outcome of a read.
+
+        :param float latency: latency of the read in seconds
+        :param bool hedged: whether the read was hedged
+        :param bool hedge_won: whether the hedge replied first
+        """
+        with self._lock:
+            self.reads += 1
+            if hedged:
+                self.hedges += 1
+                if hedge_won:
+                    self.hedge_wins += 1
+
+            if self.percentile is None:
+                return
+            self._latencies.append(latency)
+            self._n_new += 1
+            n = len(self._latencies)
+            # Sorting the window for every read would be wasteful, so the
+            # percentile is updated after every 5% of new latencies.
+            if n < self.min_samples or self._n_new < max(1, n // 20):
+                return
+            self._n_new = 0
+            latencies = sorted(self._latencies)
+            index = min(n - 1, int(n * self.percentile / 100))
+            self._delay = max(self.min_delay, latencies[index])
@@ -4,9 +4,15 @@ HappyBase utility module.
 These functions are not part of the public API.
 """
 
+import contextlib
+import heapq
+import importlib
 import re
+import sys
+import threading
 
 import six
+from six import moves
 
 CAPITALS = re.compile('([A-Z])')
 
@@ -26,6 +32,24 @@ except ImportError:
                 "install the 'ordereddict' Package from PyPI.")
 
 
+class LazyModule(object):
+    """Module proxy that imports the module on first attribute access.
+
+    This is used for the generated Thrift modules, which are slow to import
+    and not needed until the first connection is made. Attributes are cached
+    on the proxy, so later lookups are as fast as regular attribute lookups.
+    """
+
+    def __init__(self, name):
+        self.__name = name
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__name)
+        value = getattr(module, attr)
+        setattr(self, attr, value)
+        return value
+
+
 def camel_case_to_pep8(name):
     """Convert a camel cased name to PEP8 style."""
     converted = CAPITALS.sub(lambda m: '_' + m.groups()[0].lower(), name)
@@ -89,3 +113,233 @@ def bytes_increment(b):
             b[i] += 1
             return bytes(b[:i+1])
     return None
+
+
+def normalize_key_ranges(ranges):
+    """Normalize and merge row key ranges.
+
+    Each item in `ranges` is either a row key prefix, or a `(start, stop)`
+    tuple where `start` is inclusive and `stop` is exclusive; `None` means
+    unbounded. The result is a sorted list of non-overlapping `(start, stop)`
+    tuples, in which overlapping and adjacent ranges have been merged. `start`
+    is always a byte string; `stop` may be `None`.
+    """
+    normalized = []
+    for r in ranges:
+        if isinstance(r, (six.binary_type, six.text_type)):
+            start = ensure_bytes(r)
+            stop = bytes_increment(start) if start else None
+        else:
+            start, stop = r
+            start = b'' if start is None else ensure_bytes(start)
+            if stop is not None:
+                stop = ensure_bytes(stop)
+                if stop <= start:
+                    raise ValueError(
+                        "empty key range: %r >= %r" % (start, stop))
+        normalized.append((start, stop))
+
+    normalized.sort(key=lambda r: r[0])
+    merged = []
+    for start, stop in normalized:
+        if merged:
+            prev_start, prev_stop = merged[-1]
+            if prev_stop is None:
+                # The previous range extends to the end of the table
+                continue
+            if start <= prev_stop:
+                if stop is None or stop > prev_stop:
+                    merged[-1] = (prev_start, stop)
+                continue
+        merged.append((start, stop))
+    return merged
+
+
+_DONE = object()
+
+
+class _Failure(object):
+    """Exception raised in a worker thread, to be reraised by the consumer."""
+
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+
+@contextlib.contextmanager
+def _no_context():
+    yield None
+
+
+class FanOut(object):
+    """Run `func` for each task in worker threads.
+
+    `func(resource, task)` must return an iterable; the items it produces
+    are available from :py:meth:`results`. If `ordered` is true, each task
+    has its own result queue, otherwise all tasks share a single queue.
+
+    `context` is an optional callable returning a context manager, which is
+    entered once per worker thread before it takes any tasks. Its value is
+    passed as the `resource` argument to `func`. This is used to bind each
+    worker to a connection from a :py:class:`ConnectionPool`; because workers
+    only take tasks once they hold their resource, and tasks are taken in
+    order, the oldest unfinished task can always make progress.
+
+    At most `buffer_size` items are buffered per result queue. Calling
+    :py:meth:`close` stops the workers and closes their iterables.
+    """
+
+    def __init__(self, func, tasks, workers, context=None, ordered=True,
+                 buffer_size=1000):
+        self._func = func
+        self._tasks = list(tasks)
+        self._context = context or _no_context
+        self._stop = threading.Event()
+        self._pending = moves.queue.Queue()
+        for i, task in enumerate(self._tasks):
+            self._pending.put((i, task))
+
+        if ordered:
+            self._queues = [moves.queue.Queue(buffer_size)
+                            for _ in self._tasks]
+        else:
+            self._queues = [moves.queue.Queue(buffer_size)] * len(self._tasks)
+
+        self._threads = [threading.Thread(target=self._worker)
+                         for _ in range(min(workers, len(self._tasks)))]
+        for t in self._threads:
+            t.daemon = True
+            t.start()
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except moves.queue.Full:
+                pass
+        return False
+
+    def _run(self, i, task, resource):
+        iterable = iter(self._func(resource, task))
+        try:
+            for item in iterable:
+                if not self._put(self._queues[i], item):
+                    return False
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+        return self._put(self._queues[i], _DONE)
+
+    def _worker(self):
+        i = None
+        try:
+            with self._context() as resource:
+                while not self._stop.is_set():
+                    try:
+                        i, task = self._pending.get_nowait()
+                    except moves.queue.Empty:
+                        return
+                    if not self._run(i, task, resource):
+                        return
+        except Exception:
+            if i is None:
+                # Failed to obtain a resource; report it on the first task
+                # that is still waiting, if any.
+                try:
+                    i, _ = self._pending.get_nowait()
+                except moves.queue.Empty:
+                    return
+            self._put(self._queues[i], _Failure(sys.exc_info()))
+
+    def results(self, i=None):
+        """Yield the results of task `i`, or of all tasks if `i` is `None`.
+
+        Exceptions raised by a task are reraised here.
+        """
+        if i is None:
+            q, remaining = self._queues[0], len(self._tasks)
+        else:
+            q, remaining = self._queues[i], 1
+        while remaining:
+            item = q.get()
+            if item is _DONE:
+                remaining -= 1
+                continue
+            if isinstance(item, _Failure):
+                six.reraise(*item.exc_info)
+            yield item
+
+    def close(self):
+        """Stop the workers and wait for them to finish."""
+        self._stop.set()
+        for t in self._threads:
+            t.join()
+
+
+def fan_out(func, tasks, workers, context=None, ordered=True,
+            buffer_size=1000):
+    """Run `func` for each task in worker threads and yield the results.
+
+    The arguments are the same as for :py:class:`FanOut`. If `ordered` is
+    true, the items are yielded in task order, otherwise in completion order.
+    When the consumer stops iterating, the workers are stopped and their
+    iterables closed before this generator returns.
+    """
+    tasks = list(tasks)
+    if not tasks:
+        return
+
+    fan = FanOut(func, tasks, workers, context=context, ordered=ordered,
+                 buffer_size=buffer_size)
+    try:
+        if ordered:
+            for i in range(len(tasks)):
+                for item in fan.results(i):
+                    yield item
+        else:
+            for item in fan.results():
+                yield item
+    finally:
+        fan.close()
+
+
+class _Reversed(object):
+    """Wrapper inverting the sort order of a key."""
+
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+
+def merge_sorted(iterables, key=None, reverse=False):
+    """Merge sorted iterables into a single sorted iterable.
+
+    This is like :py:func:`heapq.merge`, but also supports the `key` and
+    `reverse` arguments on Python 2.
+    """
+    heap = []
+    iterators = [iter(it) for it in iterables]
+    for i, it in enumerate(iterators):
+        for item in it:
+            k = item if key is None else key(item)
+            heap.append((_Reversed(k) if reverse else k, i, item))
+            break
+    heapq.heapify(heap)
+
+    while heap:
+        _, i, item = heap[0]
+        yield item
+        for item in iterators[i]:
+            k = item if key is None else key(item)
+            heapq.heapreplace(heap, (_Reversed(k) if reverse else k, i, item))
+            break
+        else:
+            heapq.heappop(heap)
@@ -0,0 +1,220 @@
+"""
+hbasepy traffic accounting module.
+
+This module counts the bytes sent to and received from the Thrift server,
+and attributes them to the Thrift method and table of each call. It is used
+by :py:class:`Connection`; see :py:meth:`Connection.traffic`.
+"""
+
+from collections import deque, namedtuple
+import threading
+
+import six
+
+#: Traffic of a (method, table) combination
+TrafficStats = namedtuple('TrafficStats',
+                          ['calls', 'bytes_sent', 'bytes_received'])
+
+# Methods that do not take a table name as their first argument
+_NO_TABLE_METHODS = frozenset(['getTableNames', 'getRegionInfo'])
+
+
+def _table_name(name):
+    if isinstance(name, six.binary_type):
+        return name.decode('utf-8', 'replace')
+    return name
+
+
+class CountingTransport(object):
+    """Transport wrapper that counts the bytes read and written."""
+
+    def __init__(self, transport):
+        self._transport = transport
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def isOpen(self):
+        return self._transport.isOpen()
+
+    def open(self):
+        return self._transport.open()
+
+    def close(self):
+        return self._transport.close()
+
+    def read(self, sz):
+        data = self._transport.read(sz)
+        self.bytes_read += len(data)
+        return data
+
+    def readAll(self, sz):
+        data = self._transport.readAll(sz)
+        self.bytes_read += len(data)
+        return data
+
+    def write(self, buf):
+        self.bytes_written += len(buf)
+        self._transport.write(buf)
+
+    def flush(self):
+        self._transport.flush()
+
+
+class TrafficCounter(object):
+    """Per (method, table) traffic totals of a connection."""
+
+    def __init__(self):
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def add(self, method, table, bytes_sent, bytes_received, calls=1):
+        key = (method, table)
+        with self._lock:
+            n_calls, sent, received = self._totals.get(key, (0, 0, 0))
+            self._totals[key] = TrafficStats(n_calls + calls,
+                                             sent + bytes_sent,
+                                             received + bytes_received)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._totals)
+
+    def reset(self):
+        with self._lock:
+            self._totals.clear()
+
+
+def aggregate(snapshots, by=None):
+    """Sum traffic snapshots, optionally grouped by 'method' or 'table'."""
+    if by not in (None, 'method', 'table'):
+        raise ValueError("'by' must be None, 'method' or 'table'")
+
+    totals = {}
+    for snapshot in snapshots:
+        for (method, table), stats in six.iteritems(snapshot):
+            if by == 'method':
+                key = method
+            elif by == 'table':
+                key = table
+            else:
+                key = (method, table)
+            current = totals.get(key, (0, 0, 0))
+            totals[key] = TrafficStats(*[a + b
+                                         for a, b in zip(current, stats)])
+    return totals
+
+
+class CountingClient(object):
+    """Thrift client proxy that records the traffic of each call.
+
+    The bytes moved by a call are attributed to the Thrift method and to the
+    table it operates on. Scanner calls, which only take a scanner id, are
+    attributed to the table the scanner was opened on. Pipelined calls,
+    which use the `send_*` and `recv_*` methods of the Thrift client
+    directly, are attributed the same way as regular calls, and so are the
+    calls made through the `decodeRows` method of the fast decoder (see
+    :py:mod:`hbasepy.decoder`).
+    """
+
+    def __init__(self, client, transport, counter):
+        self._client = client
+        self._transport = transport
+        self._counter = counter
+        self._scanner_tables = {}
+        self._pipelined_tables = {}
+
+    def __getattr__(self, method):
+        func = getattr(self._client, method)
+        if not callable(func):
+            return func
+        if method.startswith(('send_', 'recv_')):
+            call = self._wrap_pipelined(func, method)
+        elif method == 'decodeRows':
+            call = self._wrap_decode(func)
+        else:
+            call = self._wrap(func, method)
+        setattr(self, method, call)
+        return call
+
+    def _wrap(self, func, method):
+        transport = self._transport
+        counter = self._counter
+        scanner_tables = self._scanner_tables
+        is_scanner_open = method.startswith('scannerOpen')
+        is_scanner_call = method.startswith('scanner') and not is_scanner_open
+
+        def call(*args):
+            if is_scanner_call:
+                table = scanner_tables.get(args[0])
+            elif args and method not in _NO_TABLE_METHODS:
+                table = _table_name(args[0])
+            else:
+                table = None
+
+            written = transport.bytes_written
+            read = transport.bytes_read
+            try:
+                result = func(*args)
+            finally:
+                counter.add(method, table,
+                            transport.bytes_written - written,
+                            transport.bytes_read - read)
+
+            if is_scanner_open:
+                scanner_tables[result] = table
+            elif method == 'scannerClose':
+                scanner_tables.pop(args[0], None)
+            return result
+
+        call.__name__ = method
+        return call
+
+    def _wrap_pipelined(self, func, method):
+        transport = self._transport
+        counter = self._counter
+        is_send = method.startswith('send_')
+        method = method[5:]
+        tables = self._pipelined_tables.setdefault(method, deque())
+
+        def call(*args):
+            if is_send:
+                table = _table_name(args[0]) if args else None
+                tables.append(table)
+            else:
+                table = tables.popleft() if tables else None
+
+            written = transport.bytes_written
+            read = transport.bytes_read
+            try:
+                return func(*args)
+            finally:
+                counter.add(method, table,
+                            transport.bytes_written - written,
+                            transport.bytes_read - read,
+                            calls=1 if is_send else 0)
+
+        call.__name__ = func.__name__
+        return call
+
+    def _wrap_decode(self, func):
+        transport = self._transport
+        counter = self._counter
+        scanner_tables = self._scanner_tables
+
+        def call(method, args, *rest):
+            if method.startswith('scanner'):
+                table = scanner_tables.get(args[0])
+            else:
+                table = _table_name(args[0])
+
+            written = transport.bytes_written
+            read = transport.bytes_read
+            try:
+                return func(method, args, *rest)
+            finally:
+                counter.add(method, table,
+                            transport.bytes_written - written,
+                            transport.bytes_read - read)
+
+        call.__name__ = func.__name__
+        return call
@@ -1,6 +1,11 @@
 # encoding=utf-8
+import contextlib
+import operator
 import random
+import shutil
+import tempfile
 import threading
+from hbase_thrift import ttypes
 from nose.tools import (
     assert_in,
     assert_is_instance,
@@ -8,7 +13,17 @@ from nose.tools import (
     assert_raises,
     assert_equal
 )
-from hbasepy import Connection, ConnectionPool, NoConnectionsAvailable
+from hbasepy import (
+    Connection, ConnectionPool, Deadline, DeadlineExceeded, Lane,
+    NoConnectionsAvailable, SaltedTable)
+from hbasepy import filters
+from hbasepy.blob import BlobError, put_blob
+from hbasepy.index import Index
+from hbasepy.keys import Descending, KeyCodec
+from hbasepy.snapshot import Snapshot, write_snapshot
+from hbasepy.spool import Spool
+from hbasepy.stats import ScanStats, BatchStats
+from hbasepy.throttle import AdaptiveController, HedgePolicy, ScanTuner
 import six
 
 HBASE_HOST = 'master'
@@ -66,6 +81,22 @@ def test_families(table_name):
         print (name, fdesc)
 
 
+def test_schema_cache(table_name):
+    table_tmp = connection.table(table_name)
+    families = table_tmp.families()
+
+    # Cached descriptors are shared by all table instances
+    client = connection.client
+    connection.client = None
+    try:
+        assert_equal(families, connection.table(table_name).families())
+    finally:
+        connection.client = client
+
+    connection.invalidate_schema(table_name)
+    assert_equal(families, table_tmp.families())
+
+
 def test_get_row(table_name, row, column):
     table_tmp = connection.table(table_name)
     print (table_tmp.row(row, columns=column))
@@ -132,6 +163,127 @@ def test_batch(table_name):
     b.send()
 
 
+class BusyPool(object):
+    """Pool whose first `failures` connections fail like a busy region."""
+
+    def __init__(self, pool, failures):
+        self.pool = pool
+        self.failures = failures
+
+    @contextlib.contextmanager
+    def connection(self):
+        with self.pool.connection() as connection:
+            if self.failures:
+                self.failures -= 1
+                raise ttypes.IOError(
+                    message='RegionTooBusyException: Above memstore limit')
+            yield connection
+
+
+def test_batch_spool(table_name):
+    table_tmp = connection.table(table_name)
+    pool = ConnectionPool(size=1, **connection_kwargs)
+    directory = tempfile.mkdtemp()
+    try:
+        spool = Spool(directory, pool, segment_size=64 * 1024,
+                      max_bytes=256 * 1024)
+        for i in range(100):
+            with table_tmp.batch(spool=spool) as b:
+                b.put(('row-spool-%03d' % i).encode('ascii'),
+                      {b'cf:col1': str(i).encode('ascii')})
+        spool.close()
+        assert_equal(spool.replayed, 100)
+        assert_equal(table_tmp.count(row_prefix=b'row-spool-'), 100)
+
+        # Reopening an empty spool replays nothing
+        spool = Spool(directory, pool)
+        assert_equal(spool.pending_bytes, 0)
+
+        # Mutations rejected by the server do not block later ones
+        with connection.table('no-such-table').batch(spool=spool) as b:
+            b.put(b'row-spool-rejected', {b'cf:col1': b'x'})
+        with table_tmp.batch(spool=spool) as b:
+            b.put(b'row-spool-100', {b'cf:col1': b'100'})
+        spool.close()
+        assert_equal(spool.rejected, 1)
+        assert_equal(spool.replayed, 1)
+        assert_equal(table_tmp.count(row_prefix=b'row-spool-'), 101)
+        assert_equal(
+            [([('no-such-table',
+                [(b'row-spool-rejected', [(False, b'cf:col1', b'x')])])],
+              None)],
+            spool.dead_letters())
+
+        # Busy regions are retried until the mutations are applied...
+        spool = Spool(directory, BusyPool(pool, 3), max_retries=3)
+        with table_tmp.batch(spool=spool) as b:
+            b.put(b'row-spool-101', {b'cf:col1': b'101'})
+        spool.close()
+        assert_equal(spool.replayed, 1)
+        assert_equal(spool.rejected, 0)
+        assert_equal({b'cf:col1': b'101'}, table_tmp.row(b'row-spool-101'))
+
+        # ...but no more than `max_retries` times
+        spool = Spool(directory, BusyPool(pool, 3), max_retries=2)
+        with table_tmp.batch(spool=spool) as b:
+            b.put(b'row-spool-102', {b'cf:col1': b'102'})
+        spool.close()
+        assert_equal(spool.replayed, 0)
+        assert_equal(spool.rejected, 1)
+        assert_equal(2, len(spool.dead_letters()))
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_batch_controller(table_name):
+    table_tmp = connection.table(table_name)
+    controller = AdaptiveController(batch_size=10, min_batch_size=10,
+                                    max_batch_size=100, target_latency=5.0)
+    with table_tmp.batch(controller=controller) as b:
+        for i in range(500):
+            b.put(('row-aimd-%03d' % i).encode('ascii'),
+                  {b'cf:col1': str(i).encode('ascii')})
+    print(controller)
+    assert_equal(controller.errors, 0)
+    assert_equal(controller.batch_size, 100)
+
+    with assert_raises(TypeError):
+        table_tmp.batch(controller=controller, transaction=True)
+
+
+def test_batch_coalesce(table_name):
+    table_tmp = connection.table(table_name)
+    stats = BatchStats()
+    with table_tmp.batch(coalesce=True, stats=stats) as b:
+        for i in range(10):
+            b.put(b'row-coalesce', {b'cf:col1': str(i).encode('ascii'),
+                                    b'cf:col2': b'x'})
+        b.put(b'row-coalesce', {b'cf:col3': b'y'})
+        b.delete(b'row-coalesce', [b'cf:col3'])
+        # Applied before the delete by the server, so this put is deleted
+        b.put(b'row-coalesce', {b'cf:col3': b'z'})
+    assert_equal(19, b.coalesced)
+    assert_equal(19, stats.coalesced)
+    assert_equal(4, stats.mutations)
+    assert_equal({b'cf:col1': b'9', b'cf:col2': b'x'},
+                 table_tmp.row(b'row-coalesce'))
+    table_tmp.delete(b'row-coalesce')
+
+    # A failed send keeps the pending mutations, which can still be
+    # coalesced with later ones
+    b = table_tmp.batch(coalesce=True)
+    b.put(b'row-coalesce', {b'cf:col1': b'a', b'cf:col2': b'b'})
+    b.delete(b'row-coalesce', [b'cf:col1'])
+    b.put(b'row-coalesce', {b'cf:col3': b'c'})
+    with assert_raises(DeadlineExceeded):
+        b.send(deadline=Deadline.at(0))
+    b.put(b'row-coalesce', {b'cf:col3': b'd'})
+    b.send()
+    assert_equal({b'cf:col2': b'b', b'cf:col3': b'd'},
+                 table_tmp.row(b'row-coalesce'))
+    table_tmp.delete(b'row-coalesce')
+
+
 def test_batch_context_managers(table_name):
     table_tmp = connection.table(table_name)
 
@@ -164,6 +316,98 @@ def test_batch_context_managers(table_name):
     print(res)
 
 
+def test_salted_table(table_name):
+    salted = SaltedTable(connection.table(table_name), buckets=4)
+    with salted.batch() as b:
+        for i in range(20):
+            b.put(('salted-%03d' % i).encode('ascii'),
+                  {b'cf:col1': str(i).encode('ascii')})
+
+    assert_equal(salted.row(b'salted-007'), {b'cf:col1': b'7'})
+
+    keys = [k for k, v in salted.scan(row_prefix=b'salted-')]
+    assert_equal(keys, sorted(keys))
+    assert_equal(len(keys), 20)
+
+    keys = [k for k, v in salted.scan(row_start=b'salted-005',
+                                      row_stop=b'salted-008')]
+    assert_equal(keys, [b'salted-005', b'salted-006', b'salted-007'])
+
+    pool = ConnectionPool(size=4, **connection_kwargs)
+    salted = SaltedTable(connection.table(table_name), buckets=4, pool=pool)
+    keys = [k for k, v in salted.scan(row_prefix=b'salted-', reverse=True)]
+    assert_equal(keys, sorted(keys, reverse=True))
+
+    # Concurrent scans, and other users of the pool, do not deadlock
+    pooled = pool.table(table_name)
+    counts = []
+    errors = []
+
+    def scan():
+        try:
+            for _ in range(5):
+                counts.append(len(list(salted.scan(row_prefix=b'salted-'))))
+                pooled.row(b'salted-none')
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=scan) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert_equal([], errors)
+    assert_equal([20] * 15, counts)
+    assert_equal(4, len(pool._idle))
+
+    # A scan that cannot get all its connections gives up
+    salted = SaltedTable(connection.table(table_name), buckets=4, pool=pool,
+                         timeout=0.1)
+    with pool.connection():
+        with assert_raises(NoConnectionsAvailable):
+            list(salted.scan(row_prefix=b'salted-'))
+
+    with assert_raises(ValueError):
+        SaltedTable(connection.table(table_name), buckets=8, pool=pool)
+
+
+def test_rows(table_name):
+    table_tmp = connection.table(table_name)
+    table_tmp.put(b'rows-1', {b'cf:col1': b'v1'})
+    table_tmp.put(b'rows-2', {b'cf:col1': b'v2'})
+    rows = table_tmp.rows([b'rows-1', b'rows-2', b'rows-missing'])
+    assert_equal(rows, [(b'rows-1', {b'cf:col1': b'v1'}),
+                        (b'rows-2', {b'cf:col1': b'v2'})])
+    assert_equal(table_tmp.rows([]), [])
+
+
+def test_secondary_index(table_name, index_table_name):
+    connection.create_table(index_table_name, {'i': dict(max_versions=1)})
+    index = Index('email', b'cf:email', index_table_name)
+    table_tmp = connection.table(table_name, indexes=[index])
+
+    table_tmp.put(b'user-1', {b'cf:email': b'a@example.com'})
+    table_tmp.put(b'user-2', {b'cf:email': b'b@example.com'})
+    table_tmp.put(b'user-3', {b'cf:email': b'a@example.com'})
+    rows = list(table_tmp.lookup('email', b'a@example.com'))
+    assert_equal([k for k, v in rows], [b'user-1', b'user-3'])
+
+    # Stale index entries are skipped
+    table_tmp.put(b'user-1', {b'cf:email': b'c@example.com'})
+    rows = list(table_tmp.lookup('email', b'a@example.com'))
+    assert_equal([k for k, v in rows], [b'user-3'])
+
+    # Deletes remove the index entries
+    table_tmp.delete(b'user-3')
+    assert_equal(list(table_tmp.lookup('email', b'a@example.com')), [])
+
+    with assert_raises(ValueError):
+        list(table_tmp.lookup('no-such-index', b'a@example.com'))
+
+    connection.disable_table(index_table_name)
+    connection.delete_table(index_table_name)
+
+
 def test_cells(table_name):
     table_tmp = connection.table(table_name)
     row_key = b'cell-test'
@@ -192,6 +436,33 @@ def test_cells(table_name):
     print(results)
 
 
+def test_cells_many(table_name):
+    table_tmp = connection.table(table_name)
+    col = b'cf1:col1'
+    rows = [b'cells-many-%02d' % i for i in range(10)]
+    for ts in (1, 2, 3):
+        with table_tmp.batch(timestamp=ts) as b:
+            for row_key in rows:
+                b.put(row_key, {col: b'v%d' % ts})
+
+    with assert_raises(ValueError):
+        table_tmp.cells_many({rows[0]: [col]}, window=0)
+
+    expected = dict((row_key, {col: [b'v3', b'v2']}) for row_key in rows)
+    results = table_tmp.cells_many([(row_key, [col]) for row_key in rows],
+                                   versions=2, window=4)
+    assert_equal(rows, list(results))
+    assert_equal(expected, results)
+
+    pool = ConnectionPool(size=3, **connection_kwargs)
+    results = table_tmp.cells_many(dict.fromkeys(rows, [col]), versions=2,
+                                   pool=pool)
+    assert_equal(expected, results)
+
+    for row_key in rows:
+        table_tmp.delete(row_key)
+
+
 def test_scan(table_name):
     table_tmp = connection.table(table_name)
     with assert_raises(ValueError):
@@ -208,6 +479,72 @@ def test_scan(table_name):
     print(key, value)
 
 
+def test_scan_auto_batch_size(table_name):
+    table_tmp = connection.table(table_name)
+    expected = list(table_tmp.scan(row_prefix=b'row-batch1-'))
+    assert_equal(
+        list(table_tmp.scan(row_prefix=b'row-batch1-', batch_size='auto')),
+        expected)
+
+    tuner = ScanTuner(initial=2, max_bytes=64 * 1024)
+    assert_equal(
+        list(table_tmp.scan(row_prefix=b'row-batch1-', batch_size=tuner)),
+        expected)
+    print(tuner)
+
+
+def test_scan_ranges(table_name):
+    table_tmp = connection.table(table_name)
+    prefixes = [b'row-batch1-00', b'row-batch1-001', (b'row-batch1-005',
+                                                      b'row-batch1-008')]
+    keys = [k for k, v in table_tmp.scan_ranges(prefixes)]
+    assert_equal(keys, sorted(set(keys)))
+    print(keys)
+
+    grouped = [k for k, v in table_tmp.scan_ranges(prefixes,
+                                                    ranges_per_scanner=2)]
+    assert_equal(keys, grouped)
+
+    pool = ConnectionPool(size=3, **connection_kwargs)
+    concurrent = [k for k, v in table_tmp.scan_ranges(prefixes, pool=pool)]
+    assert_equal(keys, concurrent)
+
+    with assert_raises(ValueError):
+        list(table_tmp.scan_ranges([(b'b', b'a')]))
+
+
+def test_count_and_keys(table_name):
+    table_tmp = connection.table(table_name)
+    keys = [k for k, v in table_tmp.scan(row_prefix=b'row-batch1-')]
+    assert_equal(table_tmp.count(row_prefix=b'row-batch1-'), len(keys))
+    assert_equal(list(table_tmp.keys(row_prefix=b'row-batch1-')), keys)
+    assert_equal(list(table_tmp.keys(row_prefix=b'row-batch1-', limit=2)),
+                 keys[:2])
+
+    pool = ConnectionPool(size=3, **connection_kwargs)
+    assert_equal(table_tmp.count(row_prefix=b'row-batch1-', pool=pool),
+                 len(keys))
+    assert_equal(list(table_tmp.keys(row_prefix=b'row-batch1-', pool=pool)),
+                 keys)
+    print(table_tmp.count(sample_regions=1))
+
+
+def _row_cell_count(key, data):
+    return len(data)
+
+
+def test_map_reduce(table_name):
+    table_tmp = connection.table(table_name)
+    expected = sum(len(v) for k, v in table_tmp.scan(row_prefix=b'row-'))
+    result = table_tmp.map_reduce(_row_cell_count, operator.add, initial=0,
+                                  row_prefix=b'row-', processes=2)
+    assert_equal(result, expected)
+
+    result = table_tmp.map_reduce(_row_cell_count, operator.add, initial=0,
+                                  row_prefix=b'no-such-row-')
+    assert_equal(result, 0)
+
+
 def test_scan_filter_and_batch_size(table_name):
     table_tmp = connection.table(table_name)
     filter = b"SingleColumnValueFilter ('basicInfo', 'age', =, 'binary:16')"
@@ -215,6 +552,41 @@ def test_scan_filter_and_batch_size(table_name):
         print(k, v)
 
 
+def test_filters():
+    f = filters.SingleColumnValueFilter(b'basicInfo:age', '=', b'16')
+    assert_equal(
+        f.compile(),
+        b"SingleColumnValueFilter ('basicInfo', 'age', =, 'binary:16', "
+        b"false, true)")
+
+    f = filters.PrefixFilter(b"it's") & filters.KeyOnlyFilter()
+    assert_equal(f.compile(), b"PrefixFilter ('it''s') AND KeyOnlyFilter ()")
+
+    f = filters.Skip(filters.ValueFilter('!=', b'0')) | (
+        filters.PageFilter(10) & filters.FirstKeyOnlyFilter())
+    assert_equal(
+        f.compile(),
+        b"SKIP ValueFilter (!=, 'binary:0') OR "
+        b"(PageFilter (10) AND FirstKeyOnlyFilter ())")
+
+    with assert_raises(ValueError):
+        filters.ValueFilter('<', b'abc', comparator='substring')
+    with assert_raises(ValueError):
+        filters.RowFilter('~', b'abc')
+    with assert_raises(ValueError):
+        filters.PageFilter(0)
+    with assert_raises(TypeError):
+        filters.ColumnRangeFilter(b'a', b'z', min_inclusive='yes')
+
+
+def test_scan_filter_object(table_name):
+    table_tmp = connection.table(table_name)
+    f = (filters.SingleColumnValueFilter(b'basicInfo:age', '=', b'16') &
+         filters.KeyOnlyFilter())
+    for k, v in table_tmp.scan(filter=f):
+        print(k, v)
+
+
 def test_delete(table_name):
     row_key = b'May'
     table_tmp = connection.table(table_name)
@@ -301,6 +673,416 @@ def test_pool_exhaustion():
         t.join()
 
 
+def test_pool_preconnect():
+    pool = ConnectionPool(size=3, preconnect=True, **connection_kwargs)
+
+    # All connections become available once they are open
+    held = []
+    for i in range(3):
+        held.append(pool._acquire_connection(timeout=10))
+    for connection in held:
+        assert connection._transport_is_open
+        connection.tables()
+        pool._return_connection(connection)
+
+
+def test_pooled_table(table_name):
+    pool = ConnectionPool(size=3, **connection_kwargs)
+    pooled = pool.table(table_name)
+
+    # Failed assertions in the threads would not fail the test, so the
+    # results are checked after joining them.
+    results = {}
+    errors = []
+
+    def run(n):
+        try:
+            values = []
+            for i in range(20):
+                row_key = b'pooled-%d-%02d' % (n, i)
+                pooled.put(row_key, {b'cf1:col1': b'v'})
+                values.append(pooled.row(row_key))
+            rows = list(pooled.scan(row_prefix=b'pooled-%d-' % n))
+            results[n] = (values, len(rows))
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert_equal([], errors)
+    for n in range(6):
+        assert_equal(([{b'cf1:col1': b'v'}] * 20, 20), results[n])
+
+    # All connections are back in the pool
+    assert_equal(3, len(pool._idle))
+
+    with pooled.batch() as b:
+        for key, data in pooled.scan(row_prefix=b'pooled-'):
+            b.delete(key)
+
+
+def test_stats(table_name):
+    table_tmp = connection.table(table_name)
+
+    batch_stats = BatchStats()
+    with table_tmp.batch(batch_size=10, stats=batch_stats) as b:
+        for i in range(25):
+            b.put(b'stats-%02d' % i, {b'cf1:col1': b'v'})
+    assert_equal(3, batch_stats.sends)
+    assert_equal(25, batch_stats.mutations)
+    assert_equal(25, batch_stats.rows)
+
+    scan_stats = ScanStats()
+    rows = list(table_tmp.scan(row_prefix=b'stats-', batch_size=10,
+                               stats=scan_stats))
+    assert_equal(25, len(rows))
+    assert_equal(25, scan_stats.rows)
+    assert_equal(25, scan_stats.cells)
+    # open, three full batches, an empty batch, and close
+    assert_equal(6, scan_stats.round_trips)
+    assert_is_not_none(scan_stats.time_to_first_row)
+
+    collected = []
+    for key, data in table_tmp.scan(row_prefix=b'stats-', limit=1,
+                                    stats=collected.append):
+        table_tmp.delete(key)
+    assert_equal(1, len(collected))
+
+
+def test_traffic(table_name):
+    conn = Connection(**connection_kwargs)
+    table_tmp = conn.table(table_name)
+    table_tmp.put(b'traffic', {b'cf1:col1': b'v' * 1000})
+    list(table_tmp.scan(row_prefix=b'traffic'))
+    table_tmp.delete(b'traffic')
+
+    by_method = conn.traffic(by='method')
+    assert by_method['mutateRows'].bytes_sent > 1000
+    assert by_method['scannerGetList'].bytes_received > 1000
+
+    by_table = conn.traffic(by='table')
+    assert_equal([table_name], [name for name in by_table
+                                if name is not None])
+
+    conn.reset_traffic()
+    assert_equal({}, conn.traffic())
+
+
+def test_thrift2(table_name):
+    conn = Connection(api='thrift2', **connection_kwargs)
+    table_tmp = conn.table(table_name)
+    row_key = b'thrift2-row'
+
+    table_tmp.put(row_key, {b'cf1:col1': b'old'}, timestamp=10)
+    table_tmp.put(row_key, {b'cf1:col1': b'new'}, timestamp=20)
+    assert_equal({b'cf1:col1': b'new'}, table_tmp.row(row_key))
+    assert_equal({b'cf1:col1': b'old'},
+                 table_tmp.row(row_key, time_range=(0, 15)))
+    assert_equal([(row_key, {b'cf1:col1': b'old'})],
+                 list(table_tmp.scan(row_prefix=row_key,
+                                     time_range=(10, 11))))
+    assert_equal([b'new', b'old'], table_tmp.cells(row_key, b'cf1:col1'))
+
+    with assert_raises(TypeError):
+        table_tmp.row(row_key, timestamp=10, time_range=(0, 15))
+
+    # Complete rows are deleted without listing the column families
+    table_tmp.delete(row_key)
+    assert_equal({}, table_tmp.row(row_key))
+
+    with assert_raises(NotImplementedError):
+        connection.table(table_name).row(row_key, time_range=(0, 15))
+
+
+def test_snapshot(table_name):
+    table_tmp = connection.table(table_name)
+    with table_tmp.batch() as b:
+        for i in range(100):
+            b.put(b'snapshot-%03d' % i, {b'cf1:col1': b'%d' % i})
+
+    directory = tempfile.mkdtemp()
+    try:
+        path = directory + '/snapshot'
+        n_rows = write_snapshot(
+            path, table_tmp.scan(row_prefix=b'snapshot-'), block_size=256)
+        assert_equal(100, n_rows)
+
+        with assert_raises(ValueError):
+            write_snapshot(path, [(b'b', {}), (b'a', {})])
+
+        with Snapshot(path) as snapshot:
+            assert_equal(100, len(snapshot))
+            assert_equal(table_tmp.row(b'snapshot-042'),
+                         snapshot.row(b'snapshot-042'))
+            assert_equal({}, snapshot.row(b'snapshot-nope'))
+            assert_equal(
+                list(table_tmp.scan(row_start=b'snapshot-010',
+                                    row_stop=b'snapshot-020')),
+                list(snapshot.scan(row_start=b'snapshot-010',
+                                   row_stop=b'snapshot-020')))
+            assert_equal(10, len(list(snapshot.scan(
+                row_prefix=b'snapshot-05'))))
+            assert_equal(3, len(list(snapshot.scan(limit=3))))
+            assert_equal([b'snapshot-001', b'snapshot-000'],
+                         [key for key, data in snapshot.rows(
+                             [b'snapshot-001', b'missing', b'snapshot-000'])])
+    finally:
+        shutil.rmtree(directory)
+
+    with table_tmp.batch() as b:
+        for i in range(100):
+            b.delete(b'snapshot-%03d' % i)
+
+
+def test_fast_decode(table_name):
+    conn = Connection(fast_decode=True, **connection_kwargs)
+    fast_table = conn.table(table_name)
+    table_tmp = connection.table(table_name)
+    with table_tmp.batch() as b:
+        for i in range(50):
+            b.put(b'decode-%02d' % i, {b'cf1:col1': b'%d' % i,
+                                       b'cf1:col2': b'x' * i})
+
+    for kwargs in ({}, {'include_timestamp': True},
+                   {'sorted_columns': True}, {'batch_size': 7, 'limit': 20}):
+        assert_equal(list(table_tmp.scan(row_prefix=b'decode-', **kwargs)),
+                     list(fast_table.scan(row_prefix=b'decode-', **kwargs)))
+    assert_equal(table_tmp.row(b'decode-07', include_timestamp=True),
+                 fast_table.row(b'decode-07', include_timestamp=True))
+    assert_equal({}, fast_table.row(b'decode-nope'))
+    keys = [b'decode-01', b'decode-nope', b'decode-02']
+    assert_equal(table_tmp.rows(keys), fast_table.rows(keys))
+
+    stats = ScanStats()
+    assert_equal(50, len(list(fast_table.scan(row_prefix=b'decode-',
+                                              stats=stats))))
+    assert_equal(100, stats.cells)
+
+    with assert_raises(ValueError):
+        Connection(fast_decode=True, protocol='compact', **connection_kwargs)
+
+    with table_tmp.batch() as b:
+        for i in range(50):
+            b.delete(b'decode-%02d' % i)
+
+
+def test_hedged_reads(table_name):
+    pool = ConnectionPool(size=3, **connection_kwargs)
+    # A tiny fixed delay, so that most reads are hedged
+    policy = HedgePolicy(delay=0.0001, max_rate=1.0)
+    hedged = pool.table(table_name, hedge=policy)
+    hedged.put(b'hedged-row', {b'cf1:col1': b'v'})
+
+    for i in range(20):
+        assert_equal({b'cf1:col1': b'v'}, hedged.row(b'hedged-row'))
+        assert_equal([(b'hedged-row', {b'cf1:col1': b'v'})],
+                     list(hedged.scan(row_prefix=b'hedged-')))
+    assert_equal([b'v'], hedged.cells(b'hedged-row', b'cf1:col1'))
+
+    assert_equal(41, policy.reads)
+    assert policy.hedges > 0
+    assert 0 <= policy.win_rate <= 1
+
+    # Abandoned connections are replaced and returned to the pool
+    assert_equal(3, len(pool._idle))
+
+    with assert_raises(ValueError):
+        HedgePolicy(delay='p100')
+    with assert_raises(TypeError):
+        pool.table(table_name, hedge=0.1)
+
+    hedged.delete(b'hedged-row')
+
+
+def test_deadlines(table_name):
+    conn = Connection(**connection_kwargs)
+    tbl = conn.table(table_name)
+    tbl.put(b'deadline-row', {b'cf1:col1': b'v'})
+
+    assert_equal({b'cf1:col1': b'v'}, tbl.row(b'deadline-row', deadline=5))
+
+    # A deadline shared by several operations
+    deadline = Deadline(5)
+    assert_equal([(b'deadline-row', {b'cf1:col1': b'v'})],
+                 list(tbl.scan(row_prefix=b'deadline-', deadline=deadline)))
+    with tbl.batch(deadline=deadline) as b:
+        b.put(b'deadline-row', {b'cf1:col2': b'w'})
+
+    with assert_raises(DeadlineExceeded):
+        tbl.row(b'deadline-row', deadline=Deadline.at(0))
+    with assert_raises(DeadlineExceeded):
+        list(tbl.scan(deadline=Deadline.at(0)))
+    with assert_raises(TypeError):
+        tbl.row(b'deadline-row', deadline='soon')
+
+    # The connection is still usable afterwards
+    assert_equal({b'cf1:col1': b'v', b'cf1:col2': b'w'},
+                 tbl.row(b'deadline-row'))
+
+    # Waiting for a pool connection counts towards the deadline
+    pool = ConnectionPool(size=1, **connection_kwargs)
+    errors = []
+
+    def acquire():
+        try:
+            with pool.connection(deadline=0.1):
+                pass
+        except DeadlineExceeded as exc:
+            errors.append(exc)
+
+    with pool.connection():
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        thread.join()
+    assert_equal(1, len(errors))
+
+    tbl.delete(b'deadline-row')
+    conn.close()
+
+
+def test_pool_lanes(table_name):
+    pool = ConnectionPool(size=3, lanes={
+        'interactive': Lane(priority=0, reserved=1),
+        'bulk': Lane(priority=1, limit=2),
+    }, default_lane='interactive', **connection_kwargs)
+    bulk = pool.table(table_name, lane='bulk')
+    bulk.put(b'lane-row', {b'cf1:col1': b'v'})
+
+    # The bulk lane is capped at two connections, and the remaining
+    # connection is reserved for interactive requests.
+    held = [pool._acquire_connection(lane='bulk') for i in range(2)]
+    with assert_raises(NoConnectionsAvailable):
+        with pool.connection(timeout=0.1, lane='bulk'):
+            pass
+    with pool.connection() as connection:
+        row = connection.table(table_name).row(b'lane-row')
+        assert_equal({b'cf1:col1': b'v'}, row)
+    for connection in held:
+        pool._return_connection(connection)
+
+    stats = pool.lane_stats()
+    assert_equal(1, stats['bulk'].timeouts)
+    assert_equal(0, stats['interactive'].waits)
+
+    with assert_raises(ValueError):
+        pool.connection(lane='unknown').__enter__()
+    with assert_raises(ValueError):
+        ConnectionPool(size=1, lanes={'a': Lane(reserved=2)},
+                       **connection_kwargs)
+
+    bulk.delete(b'lane-row')
+
+
+class ManifestFailingTable(object):
+    """Table whose unsized batches, used for blob manifests, fail to send."""
+
+    def __init__(self, table):
+        self.table = table
+
+    def __getattr__(self, name):
+        return getattr(self.table, name)
+
+    def batch(self, batch_size=None):
+        batch = self.table.batch(batch_size=batch_size)
+        if batch_size is None:
+            def send():
+                raise ttypes.IOError(message='Manifest write failed')
+            batch.send = send
+        return batch
+
+
+def test_blobs(table_name):
+    table_tmp = connection.table(table_name)
+    data = bytes(bytearray(random.getrandbits(8) for i in range(250000)))
+    size = table_tmp.put_blob(b'blob-row', b'cf:blob', data,
+                              chunk_size=64 * 1024)
+    assert_equal(len(data), size)
+
+    with table_tmp.open_blob(b'blob-row', b'cf:blob') as f:
+        assert_equal(data[:1000], f.read(1000))
+        f.seek(100000)
+        assert_equal(data[100000:], f.read())
+
+    # Replacing a blob removes the chunks of the previous one
+    with table_tmp.open_blob(b'blob-row', b'cf:blob', 'wb',
+                             chunk_size=1000) as f:
+        f.write(b'small')
+    assert_equal(2, len(table_tmp.row(b'blob-row')))
+    with table_tmp.open_blob(b'blob-row', b'cf:blob') as f:
+        assert_equal(b'small', f.read())
+
+    # A failed manifest write removes the new chunks, keeping the old blob
+    with assert_raises(ttypes.IOError):
+        put_blob(ManifestFailingTable(table_tmp), b'blob-row', b'cf:blob',
+                 data, chunk_size=64 * 1024)
+    assert_equal(2, len(table_tmp.row(b'blob-row')))
+    with table_tmp.open_blob(b'blob-row', b'cf:blob') as f:
+        assert_equal(b'small', f.read())
+
+    assert table_tmp.delete_blob(b'blob-row', b'cf:blob')
+    with assert_raises(BlobError):
+        table_tmp.open_blob(b'blob-row', b'cf:blob')
+
+
+def test_key_codec(table_name):
+    table_tmp = connection.table(table_name)
+    codec = KeyCodec(six.text_type, int, Descending(int))
+    for n in (-10, -1, 0, 5):
+        for ts in (1, 2):
+            table_tmp.put(codec.encode((u'codec', n, ts)), {b'cf:col1': b'v'})
+
+    # Negative numbers sort before positive ones, timestamps descending
+    keys = [key for key, data in table_tmp.scan(row_prefix=(u'codec',),
+                                                key_codec=codec)]
+    assert_equal([(u'codec', n, ts) for n in (-10, -1, 0, 5)
+                  for ts in (2, 1)], keys)
+
+    keys = [key for key, data in table_tmp.scan(
+        row_start=(u'codec', -1), row_stop=(u'codec', 5), key_codec=codec)]
+    assert_equal([(u'codec', -1, 2), (u'codec', -1, 1), (u'codec', 0, 2),
+                  (u'codec', 0, 1)], keys)
+
+    with assert_raises(TypeError):
+        codec.encode((b'codec',))
+
+    with table_tmp.batch() as b:
+        for key in table_tmp.keys(row_prefix=codec.encode((u'codec',))):
+            b.delete(key)
+
+
+def test_page(table_name):
+    table_tmp = connection.table(table_name)
+    with table_tmp.batch() as b:
+        for i in range(25):
+            b.put(b'page-%02d' % i, {b'cf:col1': b'v'})
+    expected = [b'page-%02d' % i for i in range(25)]
+
+    for reverse in (False, True):
+        keys = []
+        token = None
+        while True:
+            rows, token = table_tmp.page(10, token=token,
+                                         row_prefix=b'page-',
+                                         reverse=reverse)
+            assert len(rows) <= 10
+            keys.extend(key for key, data in rows)
+            if token is None:
+                break
+        assert_equal(expected[::-1] if reverse else expected, keys)
+
+    rows, token = table_tmp.page(10, row_prefix=b'page-')
+    with assert_raises(ValueError):
+        table_tmp.page(10, token=token, reverse=True)
+
+    with table_tmp.batch() as b:
+        for key in expected:
+            b.delete(key)
+
+
 if __name__ == '__main__':
     import logging
     logging.basicConfig(level=logging.DEBUG)
@@ -309,6 +1091,7 @@ if __name__ == '__main__':
     # test_create_table('table2')
     # test_invalid_table_create()
     # test_families('table2')
+    # test_schema_cache('table2')
     # test_get_row('students', b'Tom', [b'basicInfo:age'])
     # test_enable_table('table2')
     # test_delete_table('table2')
@@ -316,12 +1099,38 @@ if __name__ == '__main__':
     # test_put('students')
     # test_atomic_counters()
     # test_batch('mytable')
+    # test_batch_spool('mytable')
+    # test_batch_controller('mytable')
+    # test_batch_coalesce('mytable')
     # test_batch_context_managers('mytable')
+    # test_salted_table('mytable')
+    # test_rows('mytable')
+    # test_secondary_index('mytable', 'mytable_by_email')
     # test_cells('table2')
+    # test_cells_many('mytable')
     # test_scan('mytable')
+    # test_scan_auto_batch_size('mytable')
+    # test_stats('mytable')
+    # test_traffic('mytable')
+    # test_thrift2('mytable')
+    # test_snapshot('mytable')
+    # test_fast_decode('mytable')
+    # test_scan_ranges('mytable')
+    # test_count_and_keys('mytable')
+    # test_map_reduce('mytable')
     # test_scan_filter_and_batch_size('students')
+    # test_filters()
+    # test_scan_filter_object('students')
     # test_delete('students')
     # test_connection_pool()
     # test_pool_exhaustion()
+    # test_pool_preconnect()
+    # test_pooled_table('mytable')
+    # test_hedged_reads('mytable')
+    # test_deadlines('mytable')
+    # test_pool_lanes('mytable')
+    # test_blobs('mytable')
+    # test_key_codec('mytable')
+    # test_page('mytable')
 
 